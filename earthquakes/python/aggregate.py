@@ -0,0 +1,198 @@
+import math
+
+import numpy as np
+
+# Default histogram bins for earthquake magnitudes
+MAGNITUDE_BINS = np.arange(-2.0, 10.5, 0.5)
+
+
+class QuantileSketch:
+    """
+    QuantileSketch is a mergeable quantile sketch with a bounded relative error, in
+    the style of DDSketch. Values are counted in logarithmically sized buckets, so
+    two sketches are merged by adding their bucket counts and the estimate of any
+    quantile is within `relative_accuracy` of the true value.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        """
+        Parameters
+        ----------
+        relative_accuracy : float, default: 0.01
+            The maximum relative error of the quantile estimates.
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative accuracy must be between 0 and 1")
+
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    def _key(self, value):
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def _value(self, key):
+        return 2 * self.gamma**key / (self.gamma + 1)
+
+    def add(self, value):
+        if value > 0:
+            key = self._key(value)
+            self.positive[key] = self.positive.get(key, 0) + 1
+        elif value < 0:
+            key = self._key(-value)
+            self.negative[key] = self.negative.get(key, 0) + 1
+        else:
+            self.zeros += 1
+        self.count += 1
+
+    def add_many(self, values):
+        """
+        Add an array of values to the sketch, computing the bucket keys in bulk.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        sides = (
+            (self.positive, values[values > 0]),
+            (self.negative, -values[values < 0]),
+        )
+        for store, side in sides:
+            keys, counts = np.unique(
+                np.ceil(np.log(side) / self.log_gamma).astype(np.int64),
+                return_counts=True,
+            )
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                store[key] = store.get(key, 0) + count
+        self.zeros += int(np.count_nonzero(values == 0))
+        self.count += values.size
+
+    def merge(self, other):
+        """
+        Merge the counts of another sketch with the same accuracy into this one.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("cannot merge sketches with different accuracies")
+
+        for key, count in other.positive.items():
+            self.positive[key] = self.positive.get(key, 0) + count
+        for key, count in other.negative.items():
+            self.negative[key] = self.negative.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        """
+        Estimate the value at quantile `q` (between 0 and 1).
+        """
+        if self.count == 0:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+
+
+class PartialAggregate:
+    """
+    PartialAggregate accumulates mergeable summary statistics (count, sum, sum of
+    squares, min, max, a fixed-bin histogram and a quantile sketch) over a set of
+    values. Partial aggregates computed over separate partitions of a topic can be
+    merged into the aggregate over the whole topic.
+    """
+
+    def __init__(self, bins=MAGNITUDE_BINS, relative_accuracy=0.01):
+        """
+        Parameters
+        ----------
+        bins : array-like, default: MAGNITUDE_BINS
+            The edges of the histogram bins. Values outside of the bins are counted
+            in the first or last bin.
+
+        relative_accuracy : float, default: 0.01
+            The relative accuracy of the quantile sketch.
+        """
+        self.bins = np.asarray(bins, dtype=np.float64)
+        self.histogram = np.zeros(len(self.bins) - 1, dtype=np.int64)
+        self.sketch = QuantileSketch(relative_accuracy)
+        self.count = 0
+        self.total = 0.0
+        self.sumsq = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add_many(self, values):
+        """
+        Add an array of values to the aggregate, ignoring missing (NaN) values.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+
+        self.count += values.size
+        self.total += float(values.sum())
+        self.sumsq += float(np.square(values).sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        clipped = np.clip(values, self.bins[0], self.bins[-1])
+        self.histogram += np.histogram(clipped, bins=self.bins)[0]
+        self.sketch.add_many(values)
+
+    def merge(self, other):
+        """
+        Merge another partial aggregate with the same bins into this one.
+        """
+        if not np.array_equal(self.bins, other.bins):
+            raise ValueError("cannot merge aggregates with different histogram bins")
+
+        self.count += other.count
+        self.total += other.total
+        self.sumsq += other.sumsq
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.histogram += other.histogram
+        self.sketch.merge(other.sketch)
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return 0.0
+        return max((self.sumsq - self.total**2 / self.count) / (self.count - 1), 0.0)
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    def summary(self):
+        """
+        Return the aggregate statistics as a dict.
+        """
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "variance": self.variance,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "histogram": dict(zip(self.bins[:-1].tolist(), self.histogram.tolist())),
+        }
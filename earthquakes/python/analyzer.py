@@ -1,10 +1,20 @@
 import os
 import json
 import asyncio
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
+
+from pyensign.events import Event
 from pyensign.ensign import Ensign
 
+from cache import ReplayCache
+from codec import CodecError, CodecRegistry
+from query import Query, to_millis
+from aggregate import MAGNITUDE_BINS, PartialAggregate
+from stats import StreamingStats
+from columns import decode_batch, to_columns
+
 ################################################################
 # EarthquakeAnalyzer Class Methods
 ################################################################
@@ -14,7 +24,7 @@ class EarthquakeAnalyzer:
     EarthquakeAnalyzer reads historic data off of an Ensign stream.
     """
 
-    def __init__(self, topic="earthquakes-json"):
+    def __init__(self, topic="earthquakes-json", cache_dir="cache"):
         """
         Initialize the EarthquakeAnalyzer, which use EnSQL to query
         historic data off the topic, and can produce an aggregate analysis
@@ -24,8 +34,17 @@ class EarthquakeAnalyzer:
         ----------
         topic : string, default: "earthquakes-json"
             The name of the topic you wish to subscribe to.
+
+        cache_dir : string, default: "cache"
+            The directory to keep a local replay cache of the topic in. Replays read
+            the cached events first and only query Ensign for events newer than the
+            cache's high-water mark. Set to None to always query the whole topic.
         """
         self.topic = topic
+        self.codecs = CodecRegistry(schema="earthquake")
+        self.cache = None
+        if cache_dir is not None:
+            self.cache = ReplayCache(cache_dir, topic)
         keys = self._load_keys()
         self.ensign = Ensign(
             client_id=keys["ClientID"],
@@ -56,24 +75,185 @@ class EarthquakeAnalyzer:
         """
         if slice:
             q = f"SELECT * FROM {self.topic} LIMIT {str(sample_size)}"
-        else:
-            q = f"SELECT * FROM {self.topic}"
 
-        # Get the cursor first!!
+            # Get the cursor first!!
+            cursor = await self.ensign.query(q)
+
+            # The cursor is the async generator, so asynchronously process the events
+            async for event in cursor:
+                yield event
+            return
+
+        # Serve the history from the local cache before going to the network
+        if self.cache is not None:
+            for payload, mimetype in self.cache.payloads():
+                yield Event(payload, mimetype=mimetype)
+
+        async for event in self._fetch():
+            yield event
+
+    async def _fetch(self):
+        """
+        Query the events that are not in the local cache yet, appending them to the
+        cache as they are received.
+        """
+        q = f"SELECT * FROM {self.topic}"
+        if self.cache is not None and self.cache.high_water > 0:
+            q += f" OFFSET {self.cache.high_water}"
+
         cursor = await self.ensign.query(q)
+        try:
+            async for event in cursor:
+                if self.cache is not None:
+                    self.cache.append(event.data, event.mimetype)
+                yield event
+        finally:
+            # Only commit the events that were fully received to the cache
+            if self.cache is not None:
+                self.cache.flush()
+
+    async def replay_batches(self, batch_size=1000, columnar=False, **kwargs):
+        """
+        Replay events in batches, decoding each batch directly into NumPy arrays so
+        that analyses can be vectorized over whole batches. Memory use is bounded by
+        the batch size rather than by the length of the topic.
+
+        Parameters
+        ----------
+        batch_size : int, default=1000
+            The maximum number of events to decode into each batch.
+
+        columnar : boolean, default=False
+            If True, yield a dict of column arrays (magnitude, time, updated, rms and
+            gap) for each batch. Otherwise yield a structured array with the fields of
+            `columns.EARTHQUAKE_DTYPE`.
+
+        kwargs : dict
+            Any additional keyword arguments are passed to `replay()`.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        # Cached events are already decoded, so they can be served straight from the
+        # memory-mapped segments and only the new events need to be decoded.
+        events = self.replay(**kwargs)
+        if self.cache is not None and not kwargs.get("slice", False):
+            for batch in self.cache.batches(batch_size):
+                yield to_columns(batch) if columnar else batch
+            events = self._fetch()
+
+        payloads, mimetypes = [], []
+        async for event in events:
+            payloads.append(event.data)
+            mimetypes.append(event.mimetype)
+            if len(payloads) == batch_size:
+                batch = decode_batch(payloads, mimetypes)
+                payloads, mimetypes = [], []
+                yield to_columns(batch) if columnar else batch
+
+        if payloads:
+            batch = decode_batch(payloads, mimetypes)
+            yield to_columns(batch) if columnar else batch
+
+    def query(self):
+        """
+        Start building a query against the topic. Filters, time ranges and field
+        projections are pushed down into the EnSQL sent to Ensign where possible.
+        Run the query with `execute()`, e.g.:
+
+            q = analyzer.query().select("magnitude", "place").where("magnitude", ">", 4.5)
+            async for data in analyzer.execute(q.since(last_week)):
+                ...
+        """
+        return Query(self.topic)
+
+    async def execute(self, query):
+        """
+        Run a query built with `query()`, yielding the decoded (and projected) data of
+        each matching event. Anything EnSQL cannot express is filtered on the client.
+        The local replay cache is not used, since the query results only contain
+        part of the topic.
 
-        # The cursor is the async generator, so asynchronously process the events
+        Parameters
+        ----------
+        query : Query
+            The query to run.
+        """
+        cursor = await self.ensign.query(query.ensql())
+
+        returned = 0
         async for event in cursor:
-            yield event
+            data = self.unpack(event)
+            if data is None or not query.matches(data):
+                continue
+
+            yield query.project(data)
+            returned += 1
+            if query.max_events is not None and returned >= query.max_events:
+                break
+
+    async def parallel_aggregate(
+        self, start, end, partitions=None, field="magnitude", bins=MAGNITUDE_BINS
+    ):
+        """
+        Aggregate a numeric field over the earthquakes that occurred in [start, end)
+        in parallel. The time range is split into partitions, each of which is
+        queried and aggregated in its own worker process, and the mergeable partial
+        aggregates (count, sum, sum of squares, min/max, histogram and quantile
+        sketch) are merged into the result.
+
+        Parameters
+        ----------
+        start : datetime or int
+            The start of the time range, as a datetime or milliseconds since the epoch.
+
+        end : datetime or int
+            The end of the time range, as a datetime or milliseconds since the epoch.
+
+        partitions : int, default=None
+            The number of time-range partitions to split the query into. Defaults to
+            the number of CPUs.
+
+        field : string, default="magnitude"
+            The numeric field of the events to aggregate.
+
+        bins : array-like, default=MAGNITUDE_BINS
+            The edges of the histogram bins.
+
+        Returns
+        -------
+        aggregate : PartialAggregate
+            The merged aggregate over the whole time range.
+        """
+        partitions = partitions or os.cpu_count() or 1
+        edges = np.linspace(to_millis(start), to_millis(end), partitions + 1)
+        edges = edges.astype(np.int64).tolist()
+
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(max_workers=partitions) as pool:
+            partials = await asyncio.gather(
+                *[
+                    loop.run_in_executor(
+                        pool, _aggregate_partition, self.topic, lo, hi, field, bins
+                    )
+                    for lo, hi in zip(edges[:-1], edges[1:])
+                    if hi > lo
+                ]
+            )
+
+        result = PartialAggregate(bins=bins)
+        for partial in partials:
+            result.merge(partial)
+        return result
 
     def unpack(self, event):
         """
         Decode and ack the event.
         """
         try:
-            data = json.loads(event.data)
-        except json.JSONDecodeError:
-            print("Received invalid JSON in event payload:", event.data)
+            data = self.codecs.decode(event.data, event.mimetype)
+        except CodecError as e:
+            print(f"Received invalid event payload ({e}):", event.data)
             return
 
         return data
@@ -82,35 +262,68 @@ class EarthquakeAnalyzer:
 # Helper Methods
 ################################################################
 
+def _aggregate_partition(topic, start, end, field, bins, chunk_size=10000):
+    """
+    Worker process entrypoint for `parallel_aggregate`: query a single time-range
+    partition of the topic and return its partial aggregate. Each worker opens its
+    own connection to Ensign, since clients cannot be shared across processes.
+    """
+
+    async def aggregate():
+        m = EarthquakeAnalyzer(topic=topic, cache_dir=None)
+        partial = PartialAggregate(bins=bins)
+        chunk = []
+        async for data in m.execute(m.query().select(field).between(start, end)):
+            value = data.get(field)
+            chunk.append(np.nan if value is None else value)
+            if len(chunk) >= chunk_size:
+                partial.add_many(chunk)
+                chunk = []
+        partial.add_many(chunk)
+        return partial
+
+    return asyncio.run(aggregate())
+
+
 async def test_replay():
     m = EarthquakeAnalyzer()
     async for e in m.replay():
         print(e)
 
-def update_avg(window):
+async def analyze(sizes=(5, 50, 500), durations=(3600, 86400)):
     """
-    Update the running average based on a sliding window of values
-    provided as an argument
-    """
-    n = len(window)
-    return np.convolve(window, np.ones(n)/n, mode="valid")[0]
+    Compute running magnitude statistics over several count-based and time-based
+    windows in a single pass over the replayed events.
 
-async def analyze():
-    """
-    Get an average magnitude
+    Parameters
+    ----------
+    sizes : iterable of int, default: (5, 50, 500)
+        The number of most recent events in each count-based window.
+
+    durations : iterable of float, default: (3600, 86400)
+        The length in seconds of each time-based window, measured against the
+        time at which the earthquakes occurred.
     """
-    window = [0.0, 0.0, 0.0, 0.0, 0.0]
+    stats = StreamingStats(sizes=sizes, durations=durations)
     m = EarthquakeAnalyzer()
     async for e in m.replay(slice=False):
         jsn = m.unpack(e)
+        if jsn is None or jsn.get("magnitude") is None:
+            continue
+
         new = jsn["magnitude"]
-        window.append(float(new))
-        window.pop(0)
+        # USGS reports the event time in milliseconds since the epoch
+        stats.update(new, (jsn.get("time") or 0) / 1000.0)
         print(f"New magnitude reading: {new}")
-        print(f"Experimental window is: {window}")
-        print(f"Running average is: {update_avg(window)}")
+        for window in stats.summary():
+            print(
+                f"{window['window']:>12}: n={window['count']} "
+                f"mean={window['mean']:.3f} var={window['variance']:.3f} "
+                f"min={window['min']} max={window['max']} ewma={window['ewma']:.3f}"
+            )
         print()
 
+
 if __name__ == "__main__":
 
     # asyncio.run(test_replay())
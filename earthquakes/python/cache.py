@@ -0,0 +1,160 @@
+import os
+import json
+
+import numpy as np
+from pyensign import mimetypes as mtype
+
+from columns import EARTHQUAKE_DTYPE, decode_batch
+
+
+class ReplayCache:
+    """
+    ReplayCache is an append-only, on-disk cache of the events in a topic. Events are
+    written in immutable segments, each made up of five files:
+
+        <segment>.data           the raw event payloads, concatenated
+        <segment>.offsets.npy    the byte offsets of each payload in the data file
+        <segment>.mimetypes.npy  the mimetype of each payload
+        <segment>.cols.npy       the decoded EARTHQUAKE_DTYPE columns of each event
+        <segment>.valid.npy      whether each payload could be decoded
+
+    The payloads and columns are memory-mapped when read, so replaying the cache
+    neither parses the whole history up front nor holds it in memory. An index file
+    records the segments and the high-water mark (the number of events cached), which
+    is the offset in the topic from which new events need to be fetched.
+    """
+
+    def __init__(self, path, topic, segment_size=10000):
+        """
+        Parameters
+        ----------
+        path : str
+            The directory to store the cache in. A subdirectory is created per topic.
+
+        topic : str
+            The name of the topic being cached.
+
+        segment_size : int, default: 10000
+            The maximum number of events to write into a single segment.
+        """
+        self.path = os.path.join(path, topic)
+        self.segment_size = segment_size
+        self._pending = []
+        self._mimetypes = []
+        os.makedirs(self.path, exist_ok=True)
+
+        self.index_path = os.path.join(self.path, "index.json")
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {"high_water": 0, "segments": []}
+
+    @property
+    def high_water(self):
+        """
+        The number of events that have been committed to the cache.
+        """
+        return self.index["high_water"]
+
+    def _segment_path(self, name, suffix):
+        return os.path.join(self.path, name + suffix)
+
+    def payloads(self):
+        """
+        Yield the raw payload and mimetype of every cached event, oldest first.
+        """
+        for segment in self.index["segments"]:
+            offsets = np.load(
+                self._segment_path(segment["name"], ".offsets.npy"), mmap_mode="r"
+            )
+            mimetypes = self._load_mimetypes(segment)
+            if offsets[-1] == 0:
+                # np.memmap cannot map an empty file
+                data = b""
+            else:
+                data_path = self._segment_path(segment["name"], ".data")
+                data = np.memmap(data_path, dtype=np.uint8, mode="r")
+            for start, end, mimetype in zip(offsets[:-1], offsets[1:], mimetypes):
+                yield bytes(data[start:end]), mimetype
+
+    def _load_mimetypes(self, segment):
+        """
+        Return the mimetypes of the payloads in a segment as a list. Segments that
+        were cached before mimetypes were recorded only contain JSON payloads.
+        """
+        path = self._segment_path(segment["name"], ".mimetypes.npy")
+        if not os.path.exists(path):
+            return [mtype.ApplicationJSON] * segment["count"]
+        return np.load(path).tolist()
+
+    def batches(self, batch_size):
+        """
+        Yield the decoded columns of the cached events in batches of at most
+        `batch_size` rows. Events whose payloads could not be decoded are skipped,
+        the same as when live events are decoded into batches. The batches are
+        read-only views of the memory-mapped segments (or copies of the segments
+        with invalid events); copy them if you need to modify the data.
+        """
+        for segment in self.index["segments"]:
+            cols = np.load(
+                self._segment_path(segment["name"], ".cols.npy"), mmap_mode="r"
+            )
+            valid_path = self._segment_path(segment["name"], ".valid.npy")
+            if os.path.exists(valid_path):
+                valid = np.load(valid_path)
+                if not valid.all():
+                    cols = cols[valid]
+            for start in range(0, cols.shape[0], batch_size):
+                yield cols[start : start + batch_size]
+
+    def append(self, payload, mimetype="application/json"):
+        """
+        Buffer a new event payload and its mimetype, writing a segment to disk
+        whenever enough events have accumulated. Events are not visible in the cache
+        until they are flushed.
+        """
+        self._pending.append(payload)
+        self._mimetypes.append(mtype.parse(mimetype))
+        if len(self._pending) >= self.segment_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write any buffered events to a new segment and advance the high-water mark.
+        Segment files are written before the index is atomically replaced, so a
+        crash never leaves a partially written segment visible.
+        """
+        if not self._pending:
+            return
+
+        name = f"{self.high_water:016d}"
+        sizes = np.fromiter((len(p) for p in self._pending), dtype=np.int64)
+        offsets = np.zeros(len(self._pending) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+
+        with open(self._segment_path(name, ".data"), "wb") as f:
+            for payload in self._pending:
+                f.write(payload)
+        np.save(self._segment_path(name, ".offsets.npy"), offsets)
+        mimetypes = np.array(self._mimetypes, dtype=np.int32)
+        np.save(self._segment_path(name, ".mimetypes.npy"), mimetypes)
+
+        # Keep the columns aligned with the payloads, even if some are invalid, and
+        # record which ones are so that batches can skip them
+        cols = np.empty(len(self._pending), dtype=EARTHQUAKE_DTYPE)
+        valid = np.empty(len(self._pending), dtype=bool)
+        cols = decode_batch(
+            self._pending, self._mimetypes, out=cols, skip_invalid=False, valid=valid
+        )
+        np.save(self._segment_path(name, ".cols.npy"), cols)
+        np.save(self._segment_path(name, ".valid.npy"), valid)
+
+        self.index["segments"].append({"name": name, "count": len(self._pending)})
+        self.index["high_water"] += len(self._pending)
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_path)
+        self._pending = []
+        self._mimetypes = []
@@ -0,0 +1,325 @@
+import math
+import json
+import heapq
+from itertools import count
+
+from pyensign import nack
+from pyensign.events import Event
+
+from codec import CodecError
+from subscriber import EarthquakeSubscriber
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Return the great-circle distance in kilometers between two points.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class Cluster:
+    """
+    Cluster tracks the live members and summary statistics of a sequence of nearby
+    earthquakes.
+    """
+
+    def __init__(self, id):
+        self.id = id
+        self.members = set()
+        self.count = 0
+        self.magnitude_sum = 0.0
+        self.max_magnitude = None
+        self.max_magnitude_time = None
+        self.first = None
+        self.last = None
+        self.activity = 0.0
+        self.lat_sum = 0.0
+        # Longitudes are averaged as unit vectors so clusters can span the dateline
+        self.lon_x = 0.0
+        self.lon_y = 0.0
+
+    def add(self, event_id, lat, lon, time, magnitude, weight):
+        self.members.add(event_id)
+        self.count += 1
+        self.activity += weight
+        self.lat_sum += lat
+        self.lon_x += math.cos(math.radians(lon))
+        self.lon_y += math.sin(math.radians(lon))
+        self.first = time if self.first is None else min(self.first, time)
+        self.last = time if self.last is None else max(self.last, time)
+        if magnitude is not None:
+            self.magnitude_sum += magnitude
+            if self.max_magnitude is None or magnitude > self.max_magnitude:
+                self.max_magnitude = magnitude
+                self.max_magnitude_time = time
+
+    def absorb(self, other):
+        """
+        Merge the statistics of another cluster into this one; the caller is
+        responsible for relabelling the other cluster's members.
+        """
+        self.members |= other.members
+        self.count += other.count
+        self.activity += other.activity
+        self.lat_sum += other.lat_sum
+        self.lon_x += other.lon_x
+        self.lon_y += other.lon_y
+        self.magnitude_sum += other.magnitude_sum
+        self.first = min(self.first, other.first)
+        self.last = max(self.last, other.last)
+        if other.max_magnitude is not None and (
+            self.max_magnitude is None or other.max_magnitude > self.max_magnitude
+        ):
+            self.max_magnitude = other.max_magnitude
+            self.max_magnitude_time = other.max_magnitude_time
+
+    @property
+    def kind(self):
+        """
+        Classify the cluster as an aftershock sequence, when it is dominated by a
+        mainshock that is clearly larger than the rest and came early in the
+        sequence (Bath's law puts the largest aftershock ~1.2 magnitudes below the
+        mainshock), or as a swarm otherwise.
+        """
+        if self.max_magnitude is None or self.count < 2:
+            return "swarm"
+
+        others = (self.magnitude_sum - self.max_magnitude) / (self.count - 1)
+        early = self.max_magnitude_time <= self.first + (self.last - self.first) / 2
+        if self.max_magnitude - others >= 1.0 and early:
+            return "aftershocks"
+        return "swarm"
+
+    def summary(self):
+        return {
+            "cluster_id": self.id,
+            "kind": self.kind,
+            "count": self.count,
+            "active": len(self.members),
+            "activity": round(self.activity, 4),
+            "max_magnitude": self.max_magnitude,
+            "latitude": self.lat_sum / self.count,
+            "longitude": math.degrees(math.atan2(self.lon_y, self.lon_x)),
+            "first": self.first,
+            "last": self.last,
+        }
+
+
+class ClusterDetector:
+    """
+    ClusterDetector groups earthquakes that occur close together in space and time
+    into clusters as they arrive. Active events are indexed in a uniform lat/lon
+    grid whose cells are as large as the search radius, so each new event is only
+    compared against the events in the neighbouring cells rather than against every
+    active event. Events expire once they are older than the time window, in the
+    order of their times rather than the order they arrived in.
+    """
+
+    def __init__(self, radius_km=50.0, window=7 * 86400, decay=86400, min_events=3):
+        """
+        Parameters
+        ----------
+        radius_km : float, default: 50.0
+            The maximum distance between two events in the same cluster.
+
+        window : float, default: 604800 (one week)
+            The number of seconds an event stays active and can be linked to.
+
+        decay : float, default: 86400 (one day)
+            The time constant in seconds of the exponential decay of the weight each
+            new event adds to the activity of its cluster, which weights the activity
+            towards events that are close together in time. It does not affect which
+            events are linked, which only depends on `radius_km` and `window`.
+
+        min_events : int, default: 3
+            The number of events a cluster needs before it is reported.
+        """
+        self.radius_km = radius_km
+        self.window = window
+        self.decay = decay
+        self.min_events = min_events
+
+        self.cell_deg = radius_km / KM_PER_DEGREE
+        self.ncols = math.ceil(360 / self.cell_deg)
+        self.grid = {}
+        self.events = {}
+        # (time, event_id) of the active events, earliest first
+        self.expiry = []
+        self.clusters = {}
+        self.ids = count(1)
+        self.now = None
+
+    def _cell(self, lat, lon):
+        row = math.floor((lat + 90) / self.cell_deg)
+        col = math.floor((lon + 180) / self.cell_deg) % self.ncols
+        return row, col
+
+    def _neighbours(self, lat, lon):
+        """
+        Yield the ids of the active events in the cells within the search radius.
+        """
+        row, col = self._cell(lat, lon)
+
+        # Longitude cells shrink towards the poles, so search more of them
+        band = min(abs(lat) + self.cell_deg, 89.9)
+        span = math.ceil(1 / math.cos(math.radians(band)))
+        span = min(span, self.ncols // 2)
+        for r in range(row - 1, row + 2):
+            for c in range(col - span, col + span + 1):
+                yield from self.grid.get((r, c % self.ncols), ())
+
+    def _expire(self):
+        cutoff = self.now - self.window
+        while self.expiry and self.expiry[0][0] <= cutoff:
+            _, event_id = heapq.heappop(self.expiry)
+            lat, lon, _, _, cluster_id = self.events.pop(event_id)
+            cell = self.grid[self._cell(lat, lon)]
+            cell.discard(event_id)
+            if not cell:
+                del self.grid[self._cell(lat, lon)]
+
+            cluster = self.clusters[cluster_id]
+            cluster.members.discard(event_id)
+            if not cluster.members:
+                del self.clusters[cluster_id]
+
+    def add(self, event_id, lat, lon, time, magnitude=None):
+        """
+        Add an earthquake (with its time in seconds) to the detector and return the
+        cluster it belongs to if that cluster has at least `min_events` events,
+        otherwise None. Events that have already been added are ignored.
+        """
+        if event_id in self.events:
+            return None
+
+        self.now = time if self.now is None else max(self.now, time)
+        self._expire()
+        if time <= self.now - self.window:
+            return None
+
+        # Link the new event to every active neighbour within the radius
+        linked = set()
+        weight = 0.0
+        for other in self._neighbours(lat, lon):
+            olat, olon, otime, _, cluster_id = self.events[other]
+            if haversine_km(lat, lon, olat, olon) <= self.radius_km:
+                linked.add(cluster_id)
+                weight += math.exp(-abs(time - otime) / self.decay)
+
+        if linked:
+            # Merge the linked clusters into the largest one
+            clusters = sorted(
+                (self.clusters[c] for c in linked), key=lambda c: len(c.members)
+            )
+            cluster = clusters.pop()
+            for other in clusters:
+                for member in other.members:
+                    self.events[member] = self.events[member][:4] + (cluster.id,)
+                cluster.absorb(other)
+                del self.clusters[other.id]
+        else:
+            cluster = Cluster(next(self.ids))
+            self.clusters[cluster.id] = cluster
+
+        cluster.add(event_id, lat, lon, time, magnitude, weight)
+        self.events[event_id] = (lat, lon, time, magnitude, cluster.id)
+        self.grid.setdefault(self._cell(lat, lon), set()).add(event_id)
+        heapq.heappush(self.expiry, (time, event_id))
+
+        if cluster.count >= self.min_events:
+            return cluster
+        return None
+
+
+class EarthquakeClusterer(EarthquakeSubscriber):
+    """
+    EarthquakeClusterer subscribes to the earthquake reports, detects aftershock
+    sequences and swarms as the reports arrive and publishes the clusters to a
+    derived topic.
+    """
+
+    def __init__(
+        self,
+        topic="earthquakes-json",
+        cluster_topic="earthquake-clusters-json",
+        radius_km=50.0,
+        window=7 * 86400,
+        decay=86400,
+        min_events=3,
+    ):
+        """
+        Parameters
+        ----------
+        topic : string, default: "earthquakes-json"
+            The name of the topic you wish to subscribe to.
+
+        cluster_topic : string, default: "earthquake-clusters-json"
+            The name of the topic to publish detected clusters to.
+
+        radius_km, window, decay, min_events
+            The clustering parameters, see ClusterDetector.
+        """
+        super().__init__(topic=topic)
+        self.cluster_topic = cluster_topic
+        self.detector = ClusterDetector(
+            radius_km=radius_km, window=window, decay=decay, min_events=min_events
+        )
+
+    async def print_ack(self, ack):
+        pass
+
+    async def print_nack(self, nack):
+        print(f"Cluster was not committed with error {nack.code}: {nack.error}")
+
+    async def handle_event(self, event):
+        """
+        Decode the event, add it to the cluster detector and publish its cluster if
+        it is large enough to report.
+        """
+        try:
+            data = self.codecs.decode(event.data, event.mimetype)
+        except CodecError as e:
+            print(f"Received invalid event payload ({e}):", event.data)
+            await event.nack(nack.UnknownType)
+            return
+
+        lat, lon = data.get("latitude", None), data.get("longitude", None)
+        if lat is None or lon is None or data.get("time", None) is None:
+            # Reports published before coordinates were included can't be clustered
+            await event.ack()
+            return
+
+        cluster = self.detector.add(
+            data.get("id", None) or data.get("article_link", None),
+            lat,
+            lon,
+            data["time"] / 1000,
+            data.get("magnitude", None),
+        )
+        if cluster is not None:
+            summary = cluster.summary()
+            print("Earthquake cluster detected:", summary)
+            await self.ensign.publish(
+                self.cluster_topic,
+                Event(json.dumps(summary).encode("utf-8"), mimetype="application/json"),
+                on_ack=self.print_ack,
+                on_nack=self.print_nack,
+            )
+        await event.ack()
+
+    async def subscribe(self):
+        await self.ensign.ensure_topic_exists(self.cluster_topic)
+        await super().subscribe()
+
+
+if __name__ == "__main__":
+    clusterer = EarthquakeClusterer()
+    clusterer.run()
@@ -0,0 +1,107 @@
+from itertools import repeat
+
+import numpy as np
+
+from codec import CodecError, CodecRegistry
+
+# The numeric fields of an earthquake report, decoded into a NumPy structured array.
+# Times are stored as datetime64 in milliseconds since USGS reports epoch millis;
+# missing values are stored as NaN (or NaT for times).
+EARTHQUAKE_DTYPE = np.dtype(
+    [
+        ("magnitude", np.float64),
+        ("time", "datetime64[ms]"),
+        ("updated", "datetime64[ms]"),
+        ("rms", np.float64),
+        ("gap", np.float64),
+    ]
+)
+
+NAT = np.datetime64("NaT", "ms")
+
+# Payloads are decoded with the codec that matches their mimetype
+CODECS = CodecRegistry(schema="earthquake")
+
+
+def _number(value):
+    return np.nan if value is None else value
+
+
+def _timestamp(value):
+    return NAT if value is None else value
+
+
+def decode_batch(
+    payloads, mimetypes="application/json", out=None, skip_invalid=True, valid=None
+):
+    """
+    Decode a sequence of event payloads directly into a structured array with the
+    EARTHQUAKE_DTYPE fields, without keeping the intermediate dicts around. Each
+    payload is decoded with the codec that matches its mimetype.
+
+    Parameters
+    ----------
+    payloads : sequence of bytes
+        The raw payloads of the events to decode.
+
+    mimetypes : str, int or sequence, default: "application/json"
+        The mimetype of every payload, or a sequence with the mimetype of each
+        payload, e.g. the mimetypes of the events the payloads came from.
+
+    out : np.ndarray, optional
+        A preallocated array with the EARTHQUAKE_DTYPE to decode into. It must be at
+        least as long as `payloads`; a new array is allocated if not specified.
+
+    skip_invalid : bool, default: True
+        If True, payloads that cannot be decoded are skipped, so the batch may be
+        shorter than `payloads`. Otherwise they are decoded as a row of missing
+        values, keeping the batch aligned with the payloads.
+
+    valid : np.ndarray, optional
+        A boolean array at least as long as `payloads` that is set to whether each
+        payload could be decoded, so that rows of missing values decoded from
+        invalid payloads can be told apart from valid rows.
+
+    Returns
+    -------
+    batch : np.ndarray
+        The decoded records.
+    """
+    if out is None:
+        out = np.empty(len(payloads), dtype=EARTHQUAKE_DTYPE)
+
+    if isinstance(mimetypes, (str, int)):
+        mimetypes = repeat(mimetypes)
+
+    n = 0
+    for i, (payload, mimetype) in enumerate(zip(payloads, mimetypes)):
+        try:
+            data = CODECS.decode(payload, mimetype)
+            ok = True
+        except CodecError as e:
+            print(f"Received invalid event payload ({e}):", payload)
+            ok = False
+        if valid is not None:
+            valid[i] = ok
+        if not ok:
+            if skip_invalid:
+                continue
+            data = {}
+
+        out[n] = (
+            _number(data.get("magnitude")),
+            _timestamp(data.get("time")),
+            _timestamp(data.get("updated")),
+            _number(data.get("rms")),
+            _number(data.get("gap")),
+        )
+        n += 1
+
+    return out[:n]
+
+
+def to_columns(batch):
+    """
+    Split a structured batch into a dict of contiguous column arrays.
+    """
+    return {name: np.ascontiguousarray(batch[name]) for name in batch.dtype.names}
@@ -1,16 +1,50 @@
 import os
 import json
 import asyncio
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 
 import requests
 from pyensign.events import Event
 from pyensign.ensign import Ensign
 
+from codec import CodecRegistry
+
 # TODO: replace with YOU - your email and app details :)
 # These are User Agent details that will be sent to the USGS API
 ME = "(https://rotational.io/data-playground/us-geological, earthquakes@rotational.io)"
 
+# Precomputed USGS summary feeds, which are regenerated about once a minute and can be
+# used in place of the query endpoint, e.g. "all_hour", "2.5_day" or "significant_week"
+# See https://earthquake.usgs.gov/earthquakes/feed/v1.0/geojson.php
+FEED_URL = "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/{}.geojson"
+
+
+class DedupIndex:
+    """
+    DedupIndex is a bounded index of the event revisions that have already been
+    published, keyed by USGS event id and update time. When the index is full, the
+    least recently seen revisions are forgotten first.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.seen = OrderedDict()
+
+    def add(self, event_id, updated):
+        """
+        Record a revision, returning False if it has already been seen.
+        """
+        key = (event_id, updated)
+        if key in self.seen:
+            self.seen.move_to_end(key)
+            return False
+
+        self.seen[key] = True
+        if len(self.seen) > self.max_size:
+            self.seen.popitem(last=False)
+        return True
+
 
 class EarthquakePublisher:
     """
@@ -18,7 +52,16 @@ class EarthquakePublisher:
     as events to Ensign.
     """
 
-    def __init__(self, topic="earthquakes-json", interval=900, user=ME):
+    def __init__(
+        self,
+        topic="earthquakes-json",
+        interval=900,
+        user=ME,
+        state_path="usgs_state.json",
+        dedup_size=10000,
+        feed=None,
+        codec="json",
+    ):
         """
         Parameters
         ----------
@@ -34,12 +77,44 @@ class EarthquakePublisher:
         user : str
             When querying the USGS API, as a courtesy, they like you to identify your
             app and contact info (aka User Agent details)
+
+        state_path : str, default: "usgs_state.json"
+            The file to persist the `updatedafter` watermark to, so that a restarted
+            publisher only requests events updated since the last poll.
+
+        dedup_size : int, default: 10000
+            The number of published event revisions to remember, so that each
+            revision of an event is only published once.
+
+        feed : str, default: None
+            The name of a USGS summary feed (e.g. "all_hour") to poll instead of the
+            query endpoint. The feeds are precomputed and cached by USGS, so most
+            polls are answered with a cheap 304 Not Modified. The feed should cover
+            at least one polling interval.
+
+        codec : str, default: "json"
+            The codec to encode events with: "json", "orjson", "msgpack" or "avro"
+            (see codec.py). Subscribers pick the codec to decode with from the
+            mimetype of each event.
         """
         self.topic = topic
         self.interval = interval
+        self.state_path = state_path
+        self.watermark = self._load_watermark()
+        self.dedup = DedupIndex(max_size=dedup_size)
         self.url = "https://earthquake.usgs.gov/fdsnws/event/1/query"
+        self.feed = feed
         self.user = {"User-Agent": user}
-        self.datatype = "application/json"
+        self.codec = CodecRegistry(schema="earthquake").get(codec)
+        self.datatype = self.codec.mimetype
+
+        # Reuse connections across polls, and ask for compressed responses
+        self.session = requests.Session()
+        self.session.headers.update(self.user)
+        self.session.headers.update({"Accept-Encoding": "gzip"})
+
+        # The ETag and Last-Modified validators of the last response, per URL
+        self.validators = {}
 
         # NOTE: If you need a client_id and client_secret, register for a free account
         # at: https://rotational.app/register
@@ -59,6 +134,25 @@ class EarthquakePublisher:
         except Exception as e:
             raise OSError(f"unable to load Ensign API keys from file: ", e)
 
+    def _load_watermark(self):
+        """
+        Load the last persisted watermark (milliseconds since the epoch), if any.
+        """
+        if not os.path.exists(self.state_path):
+            return None
+
+        with open(self.state_path) as f:
+            return json.load(f).get("updatedafter", None)
+
+    def _save_watermark(self):
+        """
+        Atomically persist the current watermark.
+        """
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"updatedafter": self.watermark}, f)
+        os.replace(tmp, self.state_path)
+
     async def print_ack(self, ack):
         """
         Enable the Ensign server to notify the Publisher the event has been acknowledged
@@ -81,16 +175,54 @@ class EarthquakePublisher:
 
     def compose_query(self):
         """
-        Combine the base URI with the time-related query params
-        Ask for only the data from the last 15 minutes
+        Combine the base URI with the time-related query params. Ask only for the
+        events that have been updated since the watermark (the latest update time
+        we have seen), or since one interval ago if there is no watermark yet. Times
+        are sent in UTC, which is what the USGS API expects.
 
         NOTE: There are other query params you can leverage to reduce the total results.
         For example, you can add the `minmagnitude` param to only get results for bigger
         earthquakes. Check out the docs for more details:
         https://earthquake.usgs.gov/fdsnws/event/1/#parameters
         """
-        start = datetime.now() - timedelta(hours=0, minutes=15)
-        return self.url + "?format=geojson" + "&starttime=" + start.isoformat()
+        if self.feed is not None:
+            return FEED_URL.format(self.feed)
+
+        if self.watermark is None:
+            since = datetime.now(timezone.utc) - timedelta(seconds=self.interval)
+        else:
+            since = datetime.fromtimestamp(self.watermark / 1000, tz=timezone.utc)
+
+        # The API does not accept timezone offsets, so send a naive UTC timestamp
+        since = since.replace(tzinfo=None).isoformat(timespec="milliseconds")
+        return self.url + "?format=geojson" + "&updatedafter=" + since
+
+    def fetch(self, url):
+        """
+        Make a conditional GET request to the USGS API, sending the validators of the
+        previous response to the same URL. Returns the parsed JSON body, or None if
+        the data has not changed since the last request (HTTP 304).
+        """
+        headers = {}
+        etag, last_modified = self.validators.get(url, (None, None))
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        if last_modified is not None:
+            headers["If-Modified-Since"] = last_modified
+
+        response = self.session.get(url, headers=headers)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+
+        # Only the latest URL is remembered, since query URLs change with the watermark
+        self.validators = {
+            url: (
+                response.headers.get("ETag", None),
+                response.headers.get("Last-Modified", None),
+            )
+        }
+        return response.json()
 
     def unpack_usgs_response(self, message):
         """
@@ -107,6 +239,12 @@ class EarthquakePublisher:
             raise Exception(
                 "unexpected response from usgs request, no geo-events found"
             )
+
+        # Summary feeds are not filtered by update time, so skip anything that is
+        # older than the watermark at the start of this response. Events updated in
+        # the same millisecond as the watermark may not have been seen yet, so those
+        # are left to the dedup index.
+        since = self.watermark
         for geo_event in geo_events:
             details = geo_event.get("properties", None)
             if details is None:
@@ -114,9 +252,25 @@ class EarthquakePublisher:
                     "unable to parse usgs api response, no geo-event details found"
                 )
 
+            # Skip revisions of events that have already been published
+            updated = details.get("updated", None)
+            if since is not None and updated is not None and updated < since:
+                continue
+            if not self.dedup.add(geo_event.get("id", None), updated):
+                continue
+            if updated is not None and (
+                self.watermark is None or updated > self.watermark
+            ):
+                self.watermark = updated
+
+            # The geometry holds the longitude, latitude and depth (in km) of the quake
+            geometry = geo_event.get("geometry", None) or {}
+            coordinates = geometry.get("coordinates", None) or [None, None, None]
+
             # There's a lot available! For this example, we'll just parse out a few
             # fields from the USGS API response:
             data = {
+                "id": geo_event.get("id", None),
                 "magnitude": details.get("mag", None),
                 "place": details.get("place", None),
                 "time": details.get("time", None),
@@ -125,35 +279,48 @@ class EarthquakePublisher:
                 "type": details.get("type", None),
                 "rms": details.get("rms", None),
                 "gap": details.get("gap", None),
+                "longitude": coordinates[0],
+                "latitude": coordinates[1],
+                "depth": coordinates[2],
             }
 
-            yield Event(json.dumps(data).encode("utf-8"), mimetype=self.datatype)
+            yield Event(self.codec.encode(data), mimetype=self.datatype)
 
     async def recv_and_publish(self):
         """
         At some interval (`self.interval`), ping the API to get any newly updated
-        events from the last interval period
+        events since the last poll
 
         Publish report data to the `self.topic`
         """
         await self.ensign.ensure_topic_exists(self.topic)
 
+        # Polls are scheduled on a fixed cadence, so the time spent querying and
+        # publishing does not make the interval drift.
+        loop = asyncio.get_running_loop()
+        next_poll = loop.time()
         while True:
             query = self.compose_query()
-            response = requests.get(query).json()
-
-            # unpack the API response and parse it into events
-            events = self.unpack_usgs_response(response)
-            for event in events:
-                await self.ensign.publish(
-                    self.topic,
-                    event,
-                    on_ack=self.print_ack,
-                    on_nack=self.print_nack,
-                )
 
-            # sleep for a bit before we ping the API again
-            await asyncio.sleep(self.interval)
+            # Run the blocking request in a thread so acks can still be processed
+            response = await asyncio.to_thread(self.fetch, query)
+
+            # Nothing has changed since the last poll, so there's nothing to publish
+            if response is not None:
+                # unpack the API response and parse it into events
+                events = self.unpack_usgs_response(response)
+                for event in events:
+                    await self.ensign.publish(
+                        self.topic,
+                        event,
+                        on_ack=self.print_ack,
+                        on_nack=self.print_nack,
+                    )
+                self._save_watermark()
+
+            # sleep until it is time to ping the API again
+            next_poll += self.interval
+            await asyncio.sleep(max(next_poll - loop.time(), 0))
 
     def run(self):
         """
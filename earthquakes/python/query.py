@@ -0,0 +1,182 @@
+import operator
+from datetime import datetime, timezone
+
+# Comparison operators that can be pushed down into an EnSQL WHERE clause; anything
+# else is evaluated on the client after the events are decoded.
+PUSHDOWN_OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+CLIENT_OPERATORS = {
+    "in": lambda value, options: value in options,
+    "not in": lambda value, options: value not in options,
+    "contains": lambda value, part: value is not None and part in value,
+}
+
+
+def to_millis(ts):
+    """
+    Convert a datetime (naive datetimes are assumed to be UTC) or a number of
+    milliseconds since the epoch to milliseconds since the epoch, which is how USGS
+    reports the time of an earthquake.
+    """
+    if isinstance(ts, datetime):
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return int(ts.timestamp() * 1000)
+    return int(ts)
+
+
+def literal(value):
+    """
+    Format a Python value as an EnSQL literal.
+    """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    raise TypeError(f"cannot express {value!r} as an EnSQL literal")
+
+
+def _pushable(value):
+    return isinstance(value, (bool, int, float, str))
+
+
+class Query:
+    """
+    Query builds an EnSQL query against a topic, pushing field projections, time
+    ranges and comparison predicates down to Ensign so that only the matching events
+    (and fields) are sent over the network. Predicates that EnSQL cannot express are
+    kept as residual filters and evaluated on the client with `matches()`.
+
+    Queries are built by chaining methods, e.g.:
+
+        Query("earthquakes-json").select("magnitude", "time").where(
+            "magnitude", ">", 4.5
+        ).since(datetime.now(timezone.utc) - timedelta(days=7))
+    """
+
+    def __init__(self, topic):
+        self.topic = topic
+        self.fields = []
+        self.predicates = []
+        self.residuals = []
+        self.filters = []
+        self.max_events = None
+
+    def select(self, *fields):
+        """
+        Only return the specified fields of each event.
+        """
+        self.fields.extend(fields)
+        return self
+
+    def where(self, field, op, value):
+        """
+        Only return events where `field op value` holds. Comparisons against a
+        string, number or boolean are pushed down to EnSQL; the client-side
+        operators "in", "not in" and "contains" are evaluated after decoding.
+        """
+        if op in PUSHDOWN_OPERATORS and _pushable(value):
+            self.predicates.append((field, op, value))
+        elif op in PUSHDOWN_OPERATORS or op in CLIENT_OPERATORS:
+            self.residuals.append((field, op, value))
+        else:
+            raise ValueError(f"unsupported query operator {op!r}")
+        return self
+
+    def filter(self, func):
+        """
+        Only return events for which `func(data)` is truthy. Arbitrary filters are
+        always evaluated on the client.
+        """
+        self.filters.append(func)
+        return self
+
+    def since(self, start):
+        """
+        Only return earthquakes that occurred at or after `start`, which is either a
+        datetime or milliseconds since the epoch.
+        """
+        return self.where("time", ">=", to_millis(start))
+
+    def until(self, end):
+        """
+        Only return earthquakes that occurred before `end`, which is either a
+        datetime or milliseconds since the epoch.
+        """
+        return self.where("time", "<", to_millis(end))
+
+    def between(self, start, end):
+        """
+        Only return earthquakes that occurred in the half-open range [start, end).
+        """
+        return self.since(start).until(end)
+
+    def limit(self, n):
+        """
+        Return at most `n` events.
+        """
+        self.max_events = n
+        return self
+
+    @property
+    def needs_decode(self):
+        """
+        True if events have to be decoded on the client to evaluate the query.
+        """
+        return bool(self.residuals or self.filters)
+
+    def ensql(self):
+        """
+        Render the pushed down part of the query as an EnSQL statement.
+        """
+        projection = "*"
+        if self.fields and not self.filters:
+            # Residual predicates need their fields, even if they are not selected
+            fields = list(self.fields)
+            for field, _, _ in self.residuals:
+                if field not in fields:
+                    fields.append(field)
+            projection = ", ".join(fields)
+
+        q = f"SELECT {projection} FROM {self.topic}"
+        if self.predicates:
+            conditions = [
+                f"{field} {op} {literal(value)}" for field, op, value in self.predicates
+            ]
+            q += " WHERE " + " AND ".join(conditions)
+
+        # A limit can only be pushed down if every predicate was pushed down too,
+        # otherwise Ensign would count events that the client filters out.
+        if self.max_events is not None and not self.needs_decode:
+            q += f" LIMIT {self.max_events}"
+        return q
+
+    def matches(self, data):
+        """
+        Evaluate the residual predicates and filters against a decoded event.
+        """
+        for field, op, value in self.residuals:
+            actual = data.get(field)
+            if op in PUSHDOWN_OPERATORS:
+                if actual is None or not PUSHDOWN_OPERATORS[op](actual, value):
+                    return False
+            elif not CLIENT_OPERATORS[op](actual, value):
+                return False
+        return all(func(data) for func in self.filters)
+
+    def project(self, data):
+        """
+        Apply the field projection to a decoded event on the client.
+        """
+        if not self.fields:
+            return data
+        return {field: data.get(field) for field in self.fields}
@@ -0,0 +1,277 @@
+from collections import deque
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    RingBuffer is a preallocated, fixed-capacity circular buffer of (timestamp, value)
+    pairs backed by NumPy arrays. Appending to a full buffer overwrites (and returns)
+    the oldest entry, so no memory is allocated once the buffer is warm.
+    """
+
+    def __init__(self, capacity, growable=False):
+        """
+        Parameters
+        ----------
+        capacity : int
+            The number of entries to preallocate space for.
+
+        growable : bool, default: False
+            If True, the buffer doubles its capacity when full instead of overwriting
+            the oldest entry. Used by time-based windows, where the number of events
+            in the window is not known ahead of time.
+        """
+        if capacity < 1:
+            raise ValueError("ring buffer capacity must be at least 1")
+
+        self.growable = growable
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.head = 0
+        self.size = 0
+
+    @property
+    def capacity(self):
+        return self.values.shape[0]
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        """
+        Double the capacity of the buffer, unrolling the entries so the oldest is at
+        index zero.
+        """
+        order = (self.head + np.arange(self.size)) % self.capacity
+        values = np.zeros(self.capacity * 2, dtype=np.float64)
+        times = np.zeros(self.capacity * 2, dtype=np.float64)
+        values[: self.size] = self.values[order]
+        times[: self.size] = self.times[order]
+        self.values, self.times, self.head = values, times, 0
+
+    def append(self, value, ts=0.0):
+        """
+        Append a value to the buffer. If the buffer is full and not growable, the
+        oldest (timestamp, value) pair is evicted and returned, otherwise None.
+        """
+        evicted = None
+        if self.size == self.capacity:
+            if self.growable:
+                self._grow()
+            else:
+                evicted = self.popleft()
+
+        idx = (self.head + self.size) % self.capacity
+        self.values[idx] = value
+        self.times[idx] = ts
+        self.size += 1
+        return evicted
+
+    def popleft(self):
+        """
+        Remove and return the oldest (timestamp, value) pair in the buffer.
+        """
+        if self.size == 0:
+            raise IndexError("pop from an empty ring buffer")
+
+        item = (float(self.times[self.head]), float(self.values[self.head]))
+        self.head = (self.head + 1) % self.capacity
+        self.size -= 1
+        return item
+
+    def oldest_time(self):
+        return float(self.times[self.head])
+
+    def to_array(self):
+        """
+        Return a copy of the values in the buffer, oldest first.
+        """
+        order = (self.head + np.arange(self.size)) % self.capacity
+        return self.values[order]
+
+
+class WindowStats:
+    """
+    WindowStats maintains running statistics over a sliding window of values in O(1)
+    (amortized) time per update: mean and variance with Welford's algorithm (adding
+    and removing values), min and max with monotonic queues, and an exponentially
+    weighted moving average.
+
+    A window is either count-based (the last `size` values) or time-based (all values
+    with timestamps in the last `duration` seconds).
+    """
+
+    def __init__(self, size=None, duration=None, alpha=None):
+        """
+        Parameters
+        ----------
+        size : int, optional
+            The number of values in a count-based window.
+
+        duration : float, optional
+            The length in seconds of a time-based window. Exactly one of `size` or
+            `duration` must be specified.
+
+        alpha : float, optional
+            The EWMA smoothing factor. Defaults to 2 / (size + 1) for count-based
+            windows. For time-based windows the EWMA decays continuously with a time
+            constant of `duration`, and alpha is ignored.
+        """
+        if (size is None) == (duration is None):
+            raise ValueError("specify exactly one of size or duration for a window")
+
+        self.size = size
+        self.duration = duration
+        if size is not None:
+            self.name = f"last {size}"
+            self.alpha = alpha if alpha is not None else 2.0 / (size + 1)
+            self.buffer = RingBuffer(size)
+        else:
+            self.name = f"last {duration:g}s"
+            self.alpha = None
+            self.buffer = RingBuffer(64, growable=True)
+
+        # Monotonic queues of (sequence, value) used to track the min and max
+        self._seq = 0
+        self._mins = deque()
+        self._maxs = deque()
+
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.ewma = None
+        self._last_ts = None
+
+    def update(self, value, ts=0.0):
+        """
+        Add a new value (observed at timestamp `ts`, in seconds) to the window and
+        evict any values that have fallen out of it.
+        """
+        value = float(value)
+        evicted = self.buffer.append(value, ts)
+        if evicted is not None:
+            self._remove(evicted[1])
+
+        self._add(value)
+        self._update_ewma(value, ts)
+
+        if self.duration is not None:
+            # Out-of-order events are evaluated against the newest timestamp seen
+            now = ts if self._last_ts is None else max(ts, self._last_ts)
+            cutoff = now - self.duration
+            while len(self.buffer) > 1 and self.buffer.oldest_time() <= cutoff:
+                self._remove(self.buffer.popleft()[1])
+        self._last_ts = ts if self._last_ts is None else max(ts, self._last_ts)
+
+    def _add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+        self._seq += 1
+        while self._mins and self._mins[-1][1] >= value:
+            self._mins.pop()
+        self._mins.append((self._seq, value))
+        while self._maxs and self._maxs[-1][1] <= value:
+            self._maxs.pop()
+        self._maxs.append((self._seq, value))
+
+    def _remove(self, value):
+        self.count -= 1
+        if self.count == 0:
+            self.mean = 0.0
+            self._m2 = 0.0
+        else:
+            delta = value - self.mean
+            self.mean -= delta / self.count
+            self._m2 -= delta * (value - self.mean)
+
+        # The evicted value is always the oldest in the window, so its sequence
+        # number is the smallest still alive.
+        oldest = self._seq - self.count
+        if self._mins and self._mins[0][0] <= oldest:
+            self._mins.popleft()
+        if self._maxs and self._maxs[0][0] <= oldest:
+            self._maxs.popleft()
+
+    def _update_ewma(self, value, ts):
+        if self.ewma is None:
+            self.ewma = value
+            return
+
+        if self.alpha is not None:
+            alpha = self.alpha
+        else:
+            elapsed = max(ts - self._last_ts, 0.0)
+            alpha = 1.0 - np.exp(-elapsed / self.duration)
+        self.ewma += alpha * (value - self.ewma)
+
+    @property
+    def variance(self):
+        """
+        The sample variance of the values in the window.
+        """
+        if self.count < 2:
+            return 0.0
+        return max(self._m2 / (self.count - 1), 0.0)
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.variance))
+
+    @property
+    def min(self):
+        return self._mins[0][1] if self._mins else None
+
+    @property
+    def max(self):
+        return self._maxs[0][1] if self._maxs else None
+
+    def summary(self):
+        """
+        Return the current statistics for the window as a dict.
+        """
+        return {
+            "window": self.name,
+            "count": self.count,
+            "mean": self.mean,
+            "variance": self.variance,
+            "min": self.min,
+            "max": self.max,
+            "ewma": self.ewma,
+        }
+
+
+class StreamingStats:
+    """
+    StreamingStats updates several count-based and time-based windows at once, so that
+    statistics for every window can be reported in a single pass over the stream.
+    """
+
+    def __init__(self, sizes=(5, 50, 500), durations=(3600, 86400)):
+        """
+        Parameters
+        ----------
+        sizes : iterable of int, default: (5, 50, 500)
+            The sizes of the count-based windows to maintain.
+
+        durations : iterable of float, default: (3600, 86400)
+            The lengths in seconds of the time-based windows to maintain.
+        """
+        self.windows = [WindowStats(size=size) for size in sizes]
+        self.windows += [WindowStats(duration=duration) for duration in durations]
+
+    def update(self, value, ts=0.0):
+        """
+        Add a new value observed at timestamp `ts` (in seconds) to every window.
+        """
+        for window in self.windows:
+            window.update(value, ts)
+
+    def summary(self):
+        """
+        Return the current statistics for every window.
+        """
+        return [window.summary() for window in self.windows]
@@ -5,6 +5,8 @@ import asyncio
 from pyensign import nack
 from pyensign.ensign import Ensign
 
+from codec import CodecError, CodecRegistry
+
 
 class EarthquakeSubscriber:
     """
@@ -23,6 +25,7 @@ class EarthquakeSubscriber:
             The name of the topic you wish to subscribe to.
         """
         self.topic = topic
+        self.codecs = CodecRegistry(schema="earthquake")
         keys = self._load_keys()
         self.ensign = Ensign(
             client_id=keys["ClientID"],
@@ -48,9 +51,9 @@ class EarthquakeSubscriber:
         Decode and ack the event.
         """
         try:
-            data = json.loads(event.data)
-        except json.JSONDecodeError:
-            print("Received invalid JSON in event payload:", event.data)
+            data = self.codecs.decode(event.data, event.mimetype)
+        except CodecError as e:
+            print(f"Received invalid event payload ({e}):", event.data)
             await event.nack(nack.UnknownType)
             return
 
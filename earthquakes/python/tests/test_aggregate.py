@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from aggregate import PartialAggregate, QuantileSketch
+
+
+def test_sketch_quantiles_are_within_relative_accuracy():
+    rng = np.random.default_rng(42)
+    values = np.concatenate([rng.lognormal(0, 1, 5000), -rng.lognormal(0, 1, 1000)])
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    sketch.add_many(values)
+
+    assert sketch.count == values.size
+    for q in (0.05, 0.25, 0.5, 0.9, 0.99):
+        expected = np.quantile(values, q, method="lower")
+        assert sketch.quantile(q) == pytest.approx(expected, rel=0.011)
+
+
+def test_sketch_add_and_add_many_agree():
+    values = [-3.0, -0.5, 0.0, 0.0, 0.1, 2.0, 2.0, 7.5]
+    one = QuantileSketch()
+    for value in values:
+        one.add(value)
+    many = QuantileSketch()
+    many.add_many(values)
+
+    assert one.positive == many.positive
+    assert one.negative == many.negative
+    assert one.zeros == many.zeros == 2
+    assert one.quantile(0.5) == 0.0
+
+
+def test_sketch_merge():
+    with pytest.raises(ValueError):
+        QuantileSketch(0.01).merge(QuantileSketch(0.02))
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def merged(values, partitions):
+    total = PartialAggregate()
+    for part in np.array_split(values, partitions):
+        partial = PartialAggregate()
+        partial.add_many(part)
+        total.merge(partial)
+    return total
+
+
+def test_merged_partitions_match_single_aggregate():
+    rng = np.random.default_rng(7)
+    values = rng.normal(2.5, 1.2, 1000)
+    values[::50] = np.nan
+
+    whole = PartialAggregate()
+    whole.add_many(values)
+    parts = merged(values, 4)
+
+    present = values[~np.isnan(values)]
+    assert parts.count == whole.count == present.size
+    assert parts.mean == pytest.approx(present.mean())
+    assert parts.variance == pytest.approx(present.var(ddof=1))
+    assert parts.min == present.min()
+    assert parts.max == present.max()
+    assert parts.histogram.sum() == present.size
+    assert np.array_equal(parts.histogram, whole.histogram)
+    assert parts.quantile(0.5) == whole.quantile(0.5)
+
+
+def test_out_of_range_values_are_counted_in_the_outer_bins():
+    aggregate = PartialAggregate(bins=[0, 1, 2])
+    aggregate.add_many([-5.0, 0.5, 1.5, 12.0])
+    assert aggregate.histogram.tolist() == [2, 2]
+
+
+def test_empty_aggregate_summary():
+    aggregate = merged(np.array([np.nan, np.nan]), 2)
+    summary = aggregate.summary()
+    assert summary["count"] == 0
+    assert summary["mean"] is None
+    assert summary["min"] is None and summary["max"] is None
+    assert summary["p50"] is None
+
+
+def test_merge_requires_the_same_bins():
+    with pytest.raises(ValueError):
+        PartialAggregate(bins=[0, 1]).merge(PartialAggregate(bins=[0, 2]))
@@ -0,0 +1,88 @@
+import json
+
+import numpy as np
+import pytest
+from pyensign import mimetypes as mtype
+
+from cache import ReplayCache
+from codec import CodecRegistry
+from columns import EARTHQUAKE_DTYPE, decode_batch, to_columns
+
+QUAKES = [
+    {"id": "a", "magnitude": 4.5, "time": 1000, "updated": 2000, "rms": 0.5},
+    {"id": "b", "magnitude": 2.0, "time": 3000, "updated": 4000, "gap": 90.0},
+    {"id": "c", "magnitude": None, "time": 5000, "updated": None},
+]
+
+
+def encoded(codecs):
+    registry = CodecRegistry(schema="earthquake")
+    payloads, mimetypes = [], []
+    for quake, name in zip(QUAKES, codecs):
+        codec = registry.get(name)
+        payloads.append(codec.encode(quake))
+        mimetypes.append(codec.mimetype)
+    return payloads, mimetypes
+
+
+def assert_quakes(batch):
+    assert batch.dtype == EARTHQUAKE_DTYPE
+    np.testing.assert_array_equal(batch["magnitude"], [4.5, 2.0, np.nan])
+    assert batch["time"].astype(np.int64).tolist() == [1000, 3000, 5000]
+    assert np.isnat(batch["updated"][2])
+    np.testing.assert_array_equal(batch["rms"], [0.5, np.nan, np.nan])
+
+
+def test_decode_batch_with_the_codec_of_each_payload():
+    pytest.importorskip("msgpack")
+    pytest.importorskip("fastavro")
+    payloads, mimetypes = encoded(["json", "msgpack", "avro"])
+    assert_quakes(decode_batch(payloads, mimetypes))
+
+    # pyensign events have integer mimetypes
+    mimetypes = [mtype.parse(mimetype) for mimetype in mimetypes]
+    assert_quakes(decode_batch(payloads, mimetypes))
+
+
+def test_decode_batch_skips_invalid_payloads():
+    payloads = [json.dumps(QUAKES[0]).encode(), b"{not json", json.dumps(QUAKES[1])]
+    valid = np.empty(3, dtype=bool)
+    batch = decode_batch(payloads, valid=valid)
+    assert batch["magnitude"].tolist() == [4.5, 2.0]
+    assert valid.tolist() == [True, False, True]
+
+    batch = decode_batch(payloads, skip_invalid=False)
+    assert len(batch) == 3
+    assert np.isnan(batch["magnitude"][1])
+
+
+def test_cache_replays_payloads_with_their_mimetypes(tmp_path):
+    pytest.importorskip("msgpack")
+    payloads, mimetypes = encoded(["json", "msgpack", "json"])
+    cache = ReplayCache(tmp_path, "earthquakes-json", segment_size=2)
+    for payload, mimetype in zip(payloads, mimetypes):
+        cache.append(payload, mimetype)
+    cache.append(b"{not json")
+    cache.flush()
+
+    cache = ReplayCache(tmp_path, "earthquakes-json")
+    assert cache.high_water == 4
+    assert list(cache.payloads()) == list(
+        zip(payloads + [b"{not json"], [mtype.parse(m) for m in mimetypes] + [50])
+    )
+
+    batches = list(cache.batches(batch_size=10))
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert_quakes(np.concatenate(batches))
+    assert to_columns(batches[0])["magnitude"].flags["C_CONTIGUOUS"]
+
+
+def test_segments_without_mimetypes_are_json(tmp_path):
+    cache = ReplayCache(tmp_path, "earthquakes-json")
+    cache.append(json.dumps(QUAKES[0]).encode())
+    cache.flush()
+    (tmp_path / "earthquakes-json" / "0000000000000000.mimetypes.npy").unlink()
+
+    assert list(ReplayCache(tmp_path, "earthquakes-json").payloads()) == [
+        (json.dumps(QUAKES[0]).encode(), mtype.ApplicationJSON)
+    ]
@@ -0,0 +1,89 @@
+import pytest
+
+from clusters import ClusterDetector
+
+DAY = 86400
+
+
+@pytest.fixture
+def detector():
+    return ClusterDetector(radius_km=50.0, window=7 * DAY, min_events=2)
+
+
+def test_nearby_events_are_clustered(detector):
+    assert detector.add("a", 35.0, -118.0, 0, 5.0) is None
+    cluster = detector.add("b", 35.1, -118.1, 60, 3.0)
+    assert cluster is not None
+    assert cluster.members == {"a", "b"}
+    assert cluster.kind == "aftershocks"
+
+
+def test_distant_events_are_not_clustered(detector):
+    detector.add("a", 35.0, -118.0, 0)
+    assert detector.add("b", 40.0, -118.0, 60) is None
+    assert len(detector.clusters) == 2
+
+
+def test_duplicate_events_are_ignored(detector):
+    detector.add("a", 35.0, -118.0, 0)
+    detector.add("b", 35.1, -118.1, 60)
+    assert detector.add("a", 35.0, -118.0, 0) is None
+    assert detector.clusters[detector.events["a"][4]].count == 2
+
+
+def test_clusters_link_across_the_dateline(detector):
+    detector.add("a", 51.0, 179.9, 0)
+    cluster = detector.add("b", 51.0, -179.9, 60)
+    assert cluster is not None
+    assert abs(abs(cluster.summary()["longitude"]) - 180) < 0.1
+
+
+def test_linked_clusters_are_merged(detector):
+    detector.add("a", 35.0, -118.0, 0)
+    detector.add("b", 35.0, -117.2, 60)
+    assert len(detector.clusters) == 2
+
+    # Within the radius of both a and b
+    cluster = detector.add("c", 35.0, -117.6, 120)
+    assert cluster.members == {"a", "b", "c"}
+    assert len(detector.clusters) == 1
+    assert {detector.events[e][4] for e in "abc"} == {cluster.id}
+
+
+def test_events_expire_after_the_window(detector):
+    detector.add("a", 35.0, -118.0, 0)
+    first = detector.events["a"][4]
+    assert detector.add("b", 35.1, -118.1, 8 * DAY) is None
+    assert "a" not in detector.events
+    assert list(detector.clusters) == [detector.events["b"][4]]
+    assert detector.events["b"][4] != first
+
+
+def test_late_events_expire_in_time_order(detector):
+    # A late, older event arrives behind a newer one
+    detector.add("new", 35.0, -118.0, 5 * DAY)
+    detector.add("old", 10.0, 100.0, 1 * DAY)
+
+    # The old event is out of the window, but the new one is not
+    detector.add("far", -40.0, 0.0, 8.5 * DAY)
+    assert "old" not in detector.events
+    assert "new" in detector.events
+
+    # So the old event can no longer link new events into a cluster
+    assert detector.add("near-old", 10.1, 100.1, 8.5 * DAY) is None
+
+
+def test_events_older_than_the_window_are_dropped(detector):
+    detector.add("a", 35.0, -118.0, 10 * DAY)
+    assert detector.add("b", 35.1, -118.1, 2 * DAY) is None
+    assert "b" not in detector.events
+
+
+def test_decay_weights_activity(detector):
+    detector.add("a", 35.0, -118.0, 0)
+    close = detector.add("b", 35.1, -118.1, 60).activity
+
+    other = ClusterDetector(radius_km=50.0, window=7 * DAY, min_events=2)
+    other.add("a", 35.0, -118.0, 0)
+    apart = other.add("b", 35.1, -118.1, 3 * DAY).activity
+    assert close > apart > 0
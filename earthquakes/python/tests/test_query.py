@@ -0,0 +1,83 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from query import Query, literal, to_millis
+
+
+def test_to_millis():
+    assert to_millis(datetime(2023, 1, 1)) == 1672531200000
+    assert to_millis(datetime(2023, 1, 1, tzinfo=timezone.utc)) == 1672531200000
+    assert to_millis(1672531200000.0) == 1672531200000
+
+
+def test_literal():
+    assert literal(True) == "true"
+    assert literal(4.5) == "4.5"
+    assert literal(3) == "3"
+    assert literal("O'Brien") == "'O''Brien'"
+    with pytest.raises(TypeError):
+        literal(None)
+
+
+def test_select_all():
+    assert Query("earthquakes-json").ensql() == "SELECT * FROM earthquakes-json"
+
+
+def test_predicates_and_limit_are_pushed_down():
+    query = (
+        Query("earthquakes-json")
+        .select("magnitude", "time")
+        .where("magnitude", ">", 4.5)
+        .where("type", "=", "earthquake")
+        .between(1000, 2000)
+        .limit(10)
+    )
+    assert not query.needs_decode
+    assert query.ensql() == (
+        "SELECT magnitude, time FROM earthquakes-json WHERE magnitude > 4.5 AND "
+        "type = 'earthquake' AND time >= 1000 AND time < 2000 LIMIT 10"
+    )
+
+
+def test_residual_predicates_are_evaluated_on_the_client():
+    query = (
+        Query("earthquakes-json")
+        .select("magnitude")
+        .where("type", "in", ["earthquake", "explosion"])
+        .where("place", "contains", "CA")
+        .limit(10)
+    )
+    assert query.needs_decode
+    # the residual fields are fetched, and the limit is not pushed down
+    assert query.ensql() == "SELECT magnitude, type, place FROM earthquakes-json"
+
+    assert query.matches({"type": "earthquake", "place": "5km N of Ridgecrest, CA"})
+    assert not query.matches({"type": "quarry blast", "place": "Ridgecrest, CA"})
+    assert not query.matches({"type": "earthquake", "place": None})
+
+
+def test_comparisons_with_unpushable_values_are_residual():
+    query = Query("earthquakes-json").where("magnitude", ">", None)
+    assert query.ensql() == "SELECT * FROM earthquakes-json"
+    assert query.residuals == [("magnitude", ">", None)]
+
+
+def test_missing_fields_do_not_match_comparisons():
+    query = Query("earthquakes-json").where("depth", ">", [10])
+    assert not query.matches({"magnitude": 5.0})
+
+
+def test_filters_fetch_every_field():
+    query = Query("earthquakes-json").select("magnitude").filter(
+        lambda data: data["magnitude"] > 5
+    )
+    assert query.ensql() == "SELECT * FROM earthquakes-json"
+    assert query.matches({"magnitude": 6.0})
+    assert not query.matches({"magnitude": 4.0})
+    assert query.project({"magnitude": 6.0, "place": "x"}) == {"magnitude": 6.0}
+
+
+def test_unsupported_operator():
+    with pytest.raises(ValueError):
+        Query("earthquakes-json").where("magnitude", "~", 5)
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from stats import RingBuffer, StreamingStats, WindowStats
+
+
+def test_ring_buffer_overwrites_oldest():
+    buffer = RingBuffer(3)
+    for i in range(3):
+        assert buffer.append(i, ts=i) is None
+    assert buffer.append(3, ts=3) == (0.0, 0.0)
+    assert len(buffer) == 3
+    assert buffer.to_array().tolist() == [1.0, 2.0, 3.0]
+
+
+def test_growable_ring_buffer_keeps_order():
+    buffer = RingBuffer(2, growable=True)
+    buffer.append(0)
+    buffer.append(1)
+    buffer.popleft()
+    for i in range(2, 6):
+        assert buffer.append(i) is None
+    assert buffer.capacity >= 5
+    assert buffer.to_array().tolist() == [1.0, 2.0, 3.0, 4.0, 5.0]
+
+
+def test_ring_buffer_rejects_bad_capacity_and_empty_pop():
+    with pytest.raises(ValueError):
+        RingBuffer(0)
+    with pytest.raises(IndexError):
+        RingBuffer(1).popleft()
+
+
+def test_window_requires_size_or_duration():
+    with pytest.raises(ValueError):
+        WindowStats()
+    with pytest.raises(ValueError):
+        WindowStats(size=5, duration=60)
+
+
+def test_count_window_matches_numpy():
+    rng = np.random.default_rng(42)
+    values = rng.normal(3.0, 1.5, size=200)
+    window = WindowStats(size=20)
+    for i, value in enumerate(values):
+        window.update(value, ts=i)
+
+        expected = values[max(i - 19, 0) : i + 1]
+        assert window.count == len(expected)
+        assert window.mean == pytest.approx(expected.mean())
+        if len(expected) > 1:
+            assert window.variance == pytest.approx(expected.var(ddof=1))
+        assert window.min == expected.min()
+        assert window.max == expected.max()
+
+
+def test_time_window_evicts_old_values():
+    window = WindowStats(duration=10)
+    for ts, value in [(0, 1.0), (5, 9.0), (12, 3.0), (14, 5.0)]:
+        window.update(value, ts)
+
+    # the value at 0 is older than 10 seconds at 12 and was evicted
+    assert window.count == 3
+    assert window.mean == pytest.approx(17.0 / 3)
+    assert window.min == 3.0
+    assert window.max == 9.0
+
+    window.update(2.0, 30)
+    assert window.count == 1
+    assert window.min == window.max == 2.0
+
+
+def test_time_window_uses_newest_timestamp_for_late_values():
+    window = WindowStats(duration=10)
+    window.update(1.0, 0)
+    window.update(2.0, 20)
+    window.update(3.0, 5)
+    assert window.count == 2
+    assert window.mean == pytest.approx(2.5)
+
+
+def test_ewma():
+    window = WindowStats(size=3, alpha=0.5)
+    for value in (4.0, 8.0, 0.0):
+        window.update(value)
+    assert window.ewma == pytest.approx(3.0)
+
+    timed = WindowStats(duration=10)
+    timed.update(0.0, 0)
+    timed.update(1.0, 10)
+    assert timed.ewma == pytest.approx(1 - np.exp(-1))
+
+
+def test_streaming_stats_summary():
+    stats = StreamingStats(sizes=(2,), durations=(60,))
+    for ts, value in enumerate((1.0, 2.0, 3.0)):
+        stats.update(value, ts)
+
+    counts, timed = stats.summary()
+    assert counts["window"] == "last 2"
+    assert counts["count"] == 2
+    assert counts["mean"] == pytest.approx(2.5)
+    assert timed["window"] == "last 60s"
+    assert timed["count"] == 3
+    assert timed["variance"] == pytest.approx(1.0)
@@ -0,0 +1,105 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from publisher import FEED_URL, DedupIndex, EarthquakePublisher
+
+
+def feature(event_id, updated, mag=4.5):
+    return {
+        "id": event_id,
+        "properties": {"mag": mag, "time": updated - 100, "updated": updated},
+        "geometry": {"coordinates": [-117.6, 35.7, 8.2]},
+    }
+
+
+@pytest.fixture
+def make_publisher(tmp_path, monkeypatch):
+    # The Ensign keys are read from the parent of the working directory
+    (tmp_path / "client.json").write_text(
+        json.dumps({"ClientID": "client", "ClientSecret": "secret"})
+    )
+    (tmp_path / "python").mkdir()
+    monkeypatch.chdir(tmp_path / "python")
+
+    def make_publisher(**kwargs):
+        return EarthquakePublisher(state_path=str(tmp_path / "usgs.json"), **kwargs)
+
+    return make_publisher
+
+
+def published(publisher, *features):
+    events = publisher.unpack_usgs_response({"features": list(features)})
+    return [(data["id"], data["updated"]) for data in map(decoded, events)]
+
+
+def decoded(event):
+    return json.loads(event.data)
+
+
+def test_dedup_index():
+    dedup = DedupIndex(max_size=2)
+    assert dedup.add("a", 1)
+    assert not dedup.add("a", 1)
+    # a new revision of the same event is not a repeat
+    assert dedup.add("a", 2)
+
+    # the least recently seen revision is forgotten first
+    assert not dedup.add("a", 1)
+    assert dedup.add("b", 1)
+    assert dedup.add("a", 2)
+    assert not dedup.add("b", 1)
+
+
+def test_unpack_skips_old_and_repeated_revisions(make_publisher):
+    publisher = make_publisher()
+    publisher.watermark = 1000
+
+    assert published(
+        publisher, feature("old", 999), feature("a", 1000), feature("b", 1500)
+    ) == [("a", 1000), ("b", 1500)]
+    assert publisher.watermark == 1500
+
+    assert published(
+        publisher, feature("a", 1000), feature("b", 1500), feature("c", 1500)
+    ) == [("c", 1500)]
+    assert published(publisher, feature("a", 2000)) == [("a", 2000)]
+    assert publisher.watermark == 2000
+
+
+def test_unpack_event_fields(make_publisher):
+    (event,) = make_publisher().unpack_usgs_response({"features": [feature("a", 1)]})
+    data = decoded(event)
+    assert data["magnitude"] == 4.5
+    assert (data["longitude"], data["latitude"], data["depth"]) == (-117.6, 35.7, 8.2)
+
+    with pytest.raises(Exception):
+        list(make_publisher().unpack_usgs_response({"type": "FeatureCollection"}))
+
+
+def test_watermark_is_persisted(make_publisher):
+    publisher = make_publisher()
+    assert publisher.watermark is None
+
+    published(publisher, feature("a", 1672531200123))
+    publisher._save_watermark()
+    assert make_publisher().watermark == 1672531200123
+
+
+def test_compose_query(make_publisher):
+    publisher = make_publisher(interval=600)
+    publisher.watermark = 1672531200123
+    assert publisher.compose_query() == (
+        "https://earthquake.usgs.gov/fdsnws/event/1/query?format=geojson"
+        "&updatedafter=2023-01-01T00:00:00.123"
+    )
+
+    # without a watermark, ask for the events updated in the last interval
+    publisher.watermark = None
+    since = publisher.compose_query().split("&updatedafter=")[1]
+    expected = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=600)
+    assert abs(datetime.fromisoformat(since) - expected) < timedelta(seconds=5)
+
+    publisher = make_publisher(feed="all_hour")
+    assert publisher.compose_query() == FEED_URL.format("all_hour")
@@ -0,0 +1,283 @@
+import time
+import asyncio
+
+import numpy as np
+from pyensign.events import Event
+from pyensign.ensign import Ensign
+
+from codec import CodecRegistry
+from utils import handle_ack, handle_nack
+
+# Columns of the per-symbol bar state arrays
+OPEN, HIGH, LOW, CLOSE, VOLUME, NOTIONAL, COUNT = range(7)
+EMPTY_BAR = np.array([np.nan, -np.inf, np.inf, np.nan, 0.0, 0.0, 0.0])
+
+# Bars to build by default: name -> (step in seconds, number of steps per bar).
+# Bars with one step are tumbling; bars with more are sliding windows that are
+# emitted every step, e.g. a 5 minute bar updated every minute.
+BARS = {
+    "1s": (1, 1),
+    "1m": (60, 1),
+    "5m": (300, 1),
+    "5m-sliding": (60, 5),
+}
+
+
+class BarAggregator:
+    """
+    BarAggregator builds OHLCV, VWAP and trade-count bars per symbol at a single
+    resolution. The state of each symbol is kept in NumPy arrays: the bars for the
+    steps that are still open, and a ring buffer of the last `window` closed steps
+    from which the sliding bars are computed. A step stays open for `lateness`
+    seconds after it ends, so that trades still in transit at the boundary are
+    included, and closes when a trade arrives that much later, or when `flush()` is
+    called with a time that much later.
+    """
+
+    def __init__(self, name, step, window=1, lateness=0):
+        """
+        Parameters
+        ----------
+        name : str
+            The name of the bars, e.g. "1m".
+
+        step : int
+            The length of a step in seconds; a bar is emitted every step.
+
+        window : int, default: 1
+            The number of steps covered by each bar. Bars are tumbling when the
+            window is 1, and sliding otherwise.
+
+        lateness : float, default: 0
+            The number of seconds a step stays open after it ends, so that trades
+            that arrive late can still be added to it.
+        """
+        self.name = name
+        self.step = step * 1000
+        self.window = window
+        self.lateness = int(lateness * 1000)
+
+        # The start of the oldest open step of each symbol, and the bars of its
+        # open steps that have trades, keyed by their start
+        self.starts = {}
+        self.open = {}
+        self.rings = {}
+        self.positions = {}
+
+    def add(self, symbol, price, volume, timestamp):
+        """
+        Add a trade (with its timestamp in milliseconds) and return any bars it
+        closed. Trades that arrive for a step that has already closed, more than
+        `lateness` seconds after it ended, are ignored.
+        """
+        start = timestamp - timestamp % self.step
+        if symbol not in self.starts:
+            # The first trade may itself be late, so open the steps from `lateness`
+            # seconds before it, or trades that arrive after it would be dropped
+            earliest = timestamp - self.lateness
+            self.starts[symbol] = earliest - earliest % self.step
+            self.open[symbol] = {}
+            self.rings[symbol] = np.tile(EMPTY_BAR, (self.window, 1))
+            self.positions[symbol] = 0
+        elif start < self.starts[symbol]:
+            return []
+
+        bar = self.open[symbol].get(start, None)
+        if bar is None:
+            bar = self.open[symbol][start] = EMPTY_BAR.copy()
+        if bar[COUNT] == 0:
+            bar[OPEN] = price
+        bar[HIGH] = max(bar[HIGH], price)
+        bar[LOW] = min(bar[LOW], price)
+        bar[CLOSE] = price
+        bar[VOLUME] += volume
+        bar[NOTIONAL] += price * volume
+        bar[COUNT] += 1
+        return self._close(symbol, timestamp - self.lateness)
+
+    def flush(self, now):
+        """
+        Close the steps of every symbol that ended `lateness` seconds before `now`
+        (in milliseconds), so that bars for quiet symbols are not held back until
+        their next trade.
+        """
+        bars = []
+        for symbol in list(self.starts):
+            bars.extend(self._close(symbol, now - self.lateness))
+        return bars
+
+    def _close(self, symbol, watermark):
+        """
+        Close the open steps that ended by `watermark` (in milliseconds), oldest
+        first, pushing each into the ring buffer (along with any empty steps in
+        between), and return the bars for the closed steps that had trades in their
+        window.
+        """
+        until = watermark - watermark % self.step
+        ring = self.rings[symbol]
+        steps = self.open[symbol]
+
+        bars = []
+        while self.starts[symbol] < until:
+            start = self.starts[symbol]
+            bar = steps.pop(start, None)
+            if bar is None and not ring[:, COUNT].any():
+                # Every step in the window has passed without a trade, so skip
+                # ahead to the next step with trades
+                self.starts[symbol] = min(min(steps, default=until), until)
+                continue
+
+            pos = self.positions[symbol]
+            ring[pos] = EMPTY_BAR if bar is None else bar
+            self.positions[symbol] = (pos + 1) % self.window
+
+            bar = self._bar(symbol, start + self.step)
+            if bar is not None:
+                bars.append(bar)
+            self.starts[symbol] = start + self.step
+        return bars
+
+    def _bar(self, symbol, end):
+        """
+        Aggregate the steps in the ring buffer, oldest first, into a bar message
+        for the window ending at `end`, or None if there were no trades in the
+        window.
+        """
+        pos = self.positions[symbol]
+        steps = self.rings[symbol][(pos + np.arange(self.window)) % self.window]
+        traded = steps[steps[:, COUNT] > 0]
+        if traded.shape[0] == 0:
+            return None
+
+        volume = traded[:, VOLUME].sum()
+        return {
+            "symbol": symbol,
+            "bar": self.name,
+            "start": int(end - self.step * self.window),
+            "end": int(end),
+            "open": float(traded[0, OPEN]),
+            "high": float(traded[:, HIGH].max()),
+            "low": float(traded[:, LOW].min()),
+            "close": float(traded[-1, CLOSE]),
+            "volume": float(volume),
+            "vwap": float(traded[:, NOTIONAL].sum() / volume) if volume else None,
+            "count": int(traded[:, COUNT].sum()),
+        }
+
+
+class BarsSubscriber:
+    """
+    BarsSubscriber aggregates the raw trades into OHLCV and VWAP bars per symbol at
+    several resolutions and publishes each resolution to its own derived topic, so
+    that models and dashboards can consume a few bars per second instead of every
+    tick.
+    """
+
+    def __init__(
+        self,
+        sub_topic="trades",
+        ensign_creds="",
+        bars=BARS,
+        flush_interval=1,
+        lateness=2,
+        codec="json",
+    ):
+        """
+        Parameters
+        ----------
+        sub_topic : str, default: "trades"
+            The name of the topic to consume trades from. Bars are published to
+            topics named "<sub_topic>-bars-<bar name>", e.g. "trades-bars-1m".
+
+        ensign_creds : str (optional)
+            The path to your Ensign credentials file. If not provided, credentials will
+            be read from the ENSIGN_CLIENT_ID and ENSIGN_CLIENT_SECRET environment
+            variables.
+
+        bars : dict, default: BARS
+            The bars to build, as a dict of name -> (step in seconds, window in steps).
+
+        flush_interval : float, default: 1
+            The number of seconds between checks for bars that have ended without a
+            new trade to close them.
+
+        lateness : float, default: 2
+            The number of seconds to wait after a bar ends before closing it, so
+            that trades still in transit when it ends are included. Trades that
+            arrive later than that are dropped.
+
+        codec : str, default: "json"
+            The codec to encode bars with: "json", "orjson" or "msgpack" (see
+            codec.py). Trades are decoded with the codec matching their mimetype.
+        """
+        self.sub_topic = sub_topic
+        self.ensign = Ensign(cred_path=ensign_creds)
+        self.aggregators = [
+            BarAggregator(name, step, window, lateness)
+            for name, (step, window) in bars.items()
+        ]
+        self.topics = {
+            agg.name: f"{sub_topic}-bars-{agg.name}" for agg in self.aggregators
+        }
+        self.flush_interval = flush_interval
+        self.codecs = CodecRegistry(schema="trade")
+        self.codec = CodecRegistry().get(codec)
+
+    def run(self):
+        """
+        Run the subscriber forever.
+        """
+        asyncio.run(self.subscribe())
+
+    async def publish_bars(self, bars):
+        """
+        Publish closed bars to the topic for their resolution.
+        """
+        for bar in bars:
+            print(bar)
+            event = Event(self.codec.encode(bar), mimetype=self.codec.mimetype)
+            await self.ensign.publish(
+                self.topics[bar["bar"]], event, on_ack=handle_ack, on_nack=handle_nack
+            )
+
+    async def handle_event(self, event):
+        """
+        Add a trade to every aggregator and publish the bars it closed.
+        """
+        data = self.codecs.decode(event.data, event.mimetype)
+        for agg in self.aggregators:
+            bars = agg.add(
+                data["symbol"], data["price"], data["volume"], data["timestamp"]
+            )
+            await self.publish_bars(bars)
+        await event.ack()
+
+    async def flush(self):
+        """
+        Periodically close the bars that have ended.
+        """
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            now = int(time.time() * 1000)
+            for agg in self.aggregators:
+                await self.publish_bars(agg.flush(now))
+
+    async def subscribe(self):
+        """
+        Subscribe to the trades topic and aggregate the trades into bars.
+        """
+        for topic in self.topics.values():
+            await self.ensign.ensure_topic_exists(topic)
+
+        topic_id = await self.ensign.topic_id(self.sub_topic)
+        flusher = asyncio.create_task(self.flush())
+        try:
+            async for event in self.ensign.subscribe(topic_id):
+                await self.handle_event(event)
+        finally:
+            flusher.cancel()
+
+
+if __name__ == "__main__":
+    subscriber = BarsSubscriber(ensign_creds="secret/subscribe_creds.json")
+    subscriber.run()
@@ -0,0 +1,74 @@
+import os
+import json
+import pickle
+from urllib.parse import quote, unquote
+
+MODELS_DIR = "models"
+STATE_FILE = "state.json"
+
+
+def atomic_write(path, data):
+    """
+    Write bytes to a file atomically, by writing to a temporary file and renaming
+    it over the destination, so a crash never leaves a partially written file.
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def save_models(directory, models):
+    """
+    Save a dict of symbol -> model to one pickle file per symbol.
+    """
+    path = os.path.join(directory, MODELS_DIR)
+    os.makedirs(path, exist_ok=True)
+    for symbol, model in models.items():
+        # Symbols like "BINANCE:BTCUSDT" are quoted to make safe file names
+        filename = quote(symbol, safe="") + ".pkl"
+        atomic_write(os.path.join(path, filename), pickle.dumps(model))
+
+
+def load_models(directory, owns=None):
+    """
+    Load the per-symbol models saved in a checkpoint directory. If `owns` is given,
+    only the symbols for which `owns(symbol)` is True are loaded.
+    """
+    path = os.path.join(directory, MODELS_DIR)
+    if not os.path.isdir(path):
+        return {}
+
+    models = {}
+    for filename in os.listdir(path):
+        if not filename.endswith(".pkl"):
+            continue
+        symbol = unquote(filename[: -len(".pkl")])
+        if owns is not None and not owns(symbol):
+            continue
+        with open(os.path.join(path, filename), "rb") as f:
+            models[symbol] = pickle.load(f)
+    return models
+
+
+def save_state(directory, state):
+    """
+    Save the consumer state (the last consumed event) of a checkpoint. The state is
+    written after the models, so it never refers to events the models have not seen.
+    """
+    os.makedirs(directory, exist_ok=True)
+    atomic_write(os.path.join(directory, STATE_FILE), json.dumps(state).encode("utf-8"))
+
+
+def load_state(directory):
+    """
+    Load the consumer state of a checkpoint, or None if there is no checkpoint.
+    """
+    path = os.path.join(directory, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,149 @@
+import json
+import time
+import asyncio
+
+import numpy as np
+
+
+class LatencyHistogram:
+    """
+    LatencyHistogram records latencies in microseconds into log-linear buckets, in
+    the style of an HDR histogram: every power of two is split into the same number
+    of linear sub-buckets, so the relative error of any recorded value is bounded
+    (about 1% with the default 7 sub-bucket bits) while the whole range from a
+    microsecond to hours fits in a couple thousand counters.
+    """
+
+    def __init__(self, sub_bucket_bits=7, max_seconds=3600):
+        """
+        Parameters
+        ----------
+        sub_bucket_bits : int, default: 7
+            The log2 of the number of sub-buckets per power of two; more bits mean
+            more precision and more counters.
+
+        max_seconds : float, default: 3600
+            The largest latency that can be recorded; larger values are clamped.
+        """
+        self.sub_bucket_bits = sub_bucket_bits
+        self.half = 1 << (sub_bucket_bits - 1)
+        self.max_value = int(max_seconds * 1e6)
+        self.counts = np.zeros(self._index(self.max_value) + 1, dtype=np.int64)
+        self.reset()
+
+    def reset(self):
+        self.counts[:] = 0
+        self.total = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        magnitude = max(value.bit_length() - self.sub_bucket_bits, 0)
+        return magnitude * self.half + (value >> magnitude)
+
+    def _value(self, index):
+        if index < 2 * self.half:
+            return index
+        magnitude = index // self.half - 1
+        sub = index - magnitude * self.half
+        # The midpoint of the sub-bucket
+        return (sub << magnitude) + ((1 << magnitude) >> 1)
+
+    def record(self, seconds, count=1):
+        """
+        Record a latency in seconds, `count` times. Negative latencies (from clock
+        skew between machines) are recorded as zero.
+        """
+        value = min(max(int(seconds * 1e6), 0), self.max_value)
+        self.counts[self._index(value)] += count
+        self.total += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        """
+        Return the latency in seconds at percentile `q` (between 0 and 100).
+        """
+        if self.total == 0:
+            return None
+
+        rank = max(int(np.ceil(q / 100 * self.total)), 1)
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(self._value(index), self.max) / 1e6
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.total += other.total
+        self.sum += other.sum
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+        return self
+
+    def summary(self):
+        """
+        Return the count, mean, min, max and percentiles of the recorded latencies
+        in seconds.
+        """
+        if self.total == 0:
+            return {"count": 0}
+
+        return {
+            "count": self.total,
+            "mean": self.sum / self.total / 1e6,
+            "min": self.min / 1e6,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p999": self.percentile(99.9),
+            "max": self.max / 1e6,
+        }
+
+
+class LatencyRecorder:
+    """
+    LatencyRecorder keeps a latency histogram for each stage of the pipeline and
+    periodically exports their summaries.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+
+    def record(self, stage, seconds, count=1):
+        if stage not in self.histograms:
+            self.histograms[stage] = LatencyHistogram()
+        self.histograms[stage].record(seconds, count)
+
+    def export(self, reset=False):
+        """
+        Return the summary of every stage's histogram, optionally resetting them so
+        that each export covers a single interval.
+        """
+        summary = {
+            stage: histogram.summary() for stage, histogram in self.histograms.items()
+        }
+        if reset:
+            for histogram in self.histograms.values():
+                histogram.reset()
+        return summary
+
+    async def report_periodically(self, interval, path=None, reset=True):
+        """
+        Export the latency summaries every `interval` seconds, printing them or
+        appending them as JSON lines to the file at `path`.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            report = {"time": time.time(), "latency": self.export(reset=reset)}
+            if path is None:
+                print(f"Latency report: {report}")
+            else:
+                with open(path, "a") as f:
+                    f.write(json.dumps(report) + "\n")
+
+
+# The recorder shared by the publisher, the subscribers and the ack handlers
+RECORDER = LatencyRecorder()
@@ -0,0 +1,264 @@
+import time
+import zlib
+import multiprocessing as mp
+from datetime import datetime
+
+import pandas as pd
+from river import compose
+from river import linear_model
+from river import preprocessing
+
+from checkpoint import load_models, save_models
+
+
+def build_model():
+    """
+    Build a new online model pipeline for a single symbol.
+    """
+    model = compose.Pipeline(
+        ("scale", preprocessing.StandardScaler()),
+        ("lin_reg", linear_model.LinearRegression()),
+    )
+    return model
+
+
+def get_timestamp(epoch):
+    """
+    converts unix epoch to datetime
+    """
+    epoch_time = epoch / 1000.0
+    timestamp = datetime.fromtimestamp(epoch_time)
+    return timestamp
+
+
+def get_timestamps(epochs):
+    """
+    converts a Series of unix epochs to naive local datetimes, like get_timestamp()
+
+    The UTC offset is looked up for every minute the trades fall in rather than
+    once, so the local times follow daylight saving time changes.
+    """
+    minutes = epochs // 60000
+    offsets = {
+        minute: time.localtime(minute * 60).tm_gmtoff * 1000
+        for minute in minutes.unique()
+    }
+    return pd.to_datetime(epochs + minutes.map(offsets), unit="ms")
+
+
+def partition(symbol, n):
+    """
+    Assign a symbol to one of `n` partitions. Uses a stable hash (unlike hash(),
+    which is salted per process) so every process agrees on the assignment.
+    """
+    return zlib.crc32(symbol.encode("utf-8")) % n
+
+
+class SymbolModels:
+    """
+    SymbolModels keeps a separate online model for every symbol, since the prices of
+    different symbols have nothing to do with each other.
+    """
+
+    def __init__(self, models=None):
+        self.models = models if models is not None else {}
+
+    @classmethod
+    def load(cls, directory, owns=None):
+        """
+        Restore the models saved in a checkpoint directory.
+        """
+        return cls(load_models(directory, owns=owns))
+
+    def save(self, directory):
+        """
+        Save a snapshot of every model to a checkpoint directory.
+        """
+        save_models(directory, self.models)
+
+    def get(self, symbol):
+        if symbol not in self.models:
+            self.models[symbol] = build_model()
+        return self.models[symbol]
+
+    def process(self, data):
+        """
+        Generate a prediction for a trade and then train the symbol's model on it.
+        Returns the prediction message to publish.
+        """
+        model = self.get(data["symbol"])
+
+        # convert unix epoch to datetime
+        timestamp = get_timestamp(data["timestamp"])
+        # extract the microsecond component and use it as a model feature
+        x = {"microsecond": timestamp.microsecond}
+        # generate a prediction
+        price_pred = round(model.predict_one(x), 4)
+        # pass the actual trade price to the model
+        model.learn_one(x, data["price"])
+
+        # create a message that contains the predicted price and the actual price
+        message = dict()
+        message["symbol"] = data["symbol"]
+        message["time"] = timestamp.strftime("%H:%M:%S")
+        message["price"] = str(data["price"])
+        message["price_pred"] = str(price_pred)
+        # keep the exchange timestamp so the end-to-end latency can be measured
+        message["timestamp"] = data["timestamp"]
+        return message
+
+    def process_batch(self, trades):
+        """
+        Generate predictions for a batch of trades and then train each symbol's
+        model on its trades in the batch, using river's mini-batch methods on a
+        DataFrame rather than one call per trade. Every prediction in the batch is
+        made by the model as it was before the batch. Returns the prediction
+        messages to publish, in the order of the trades.
+        """
+        df = pd.DataFrame(trades, columns=["symbol", "price", "timestamp"])
+        timestamps = get_timestamps(df["timestamp"])
+        X = pd.DataFrame({"microsecond": timestamps.dt.microsecond})
+
+        preds = pd.Series(0.0, index=df.index)
+        for symbol, rows in df.groupby("symbol").indices.items():
+            model = self.get(symbol)
+            x, y = X.iloc[rows], df["price"].iloc[rows]
+            preds.iloc[rows] = model.predict_many(x).to_numpy()
+            model.learn_many(x, y)
+
+        messages = pd.DataFrame(
+            {
+                "symbol": df["symbol"],
+                "time": timestamps.dt.strftime("%H:%M:%S"),
+                "price": df["price"].astype(str),
+                "price_pred": preds.round(4).astype(str),
+                "timestamp": df["timestamp"],
+            }
+        )
+        return messages.to_dict(orient="records")
+
+
+def _worker(index, workers, inbox, outbox, done, checkpoint_dir):
+    """
+    Worker process loop: train the models for the symbols assigned to this worker
+    and send the predictions back, in the order the trades were received. Trades
+    are received either one at a time or as a list for mini-batch processing, and
+    predictions are always sent back as a list, along with the number of seconds
+    spent in the models. A ("checkpoint", directory, seq) command saves the
+    worker's models, which then include every trade received before it, and reports
+    (index, seq) back on the done queue.
+    """
+    if checkpoint_dir is not None:
+        models = SymbolModels.load(
+            checkpoint_dir, owns=lambda symbol: partition(symbol, workers) == index
+        )
+    else:
+        models = SymbolModels()
+
+    while True:
+        data = inbox.get()
+        if data is None:
+            break
+        if isinstance(data, tuple):
+            _, directory, seq = data
+            models.save(directory)
+            done.put((index, seq))
+        elif isinstance(data, list):
+            started = time.perf_counter()
+            messages = models.process_batch(data)
+            outbox.put((messages, time.perf_counter() - started))
+        else:
+            started = time.perf_counter()
+            messages = [models.process(data)]
+            outbox.put((messages, time.perf_counter() - started))
+
+
+class ModelWorkerPool:
+    """
+    ModelWorkerPool hash-partitions symbols across a pool of worker processes, each
+    of which owns the models for its symbols. All trades for a symbol go to the same
+    worker through a FIFO queue, so they are processed in order, while different
+    symbols are processed in parallel. Predictions from every worker are gathered on
+    a single results queue.
+    """
+
+    def __init__(self, workers, checkpoint_dir=None):
+        """
+        Parameters
+        ----------
+        workers : int
+            The number of worker processes to start.
+
+        checkpoint_dir : str, default: None
+            A checkpoint directory to restore the workers' models from.
+        """
+        self.inboxes = [mp.Queue() for _ in range(workers)]
+        self.results = mp.Queue()
+        self.done = mp.Queue()
+        self.checkpoints = 0
+        self.processes = [
+            mp.Process(
+                target=_worker,
+                args=(i, workers, inbox, self.results, self.done, checkpoint_dir),
+                daemon=True,
+            )
+            for i, inbox in enumerate(self.inboxes)
+        ]
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def submit(self, data):
+        """
+        Send a decoded trade to the worker that owns its symbol.
+        """
+        self.inboxes[partition(data["symbol"], len(self.inboxes))].put(data)
+
+    def submit_batch(self, trades):
+        """
+        Split a batch of decoded trades by partition and send each worker its part.
+        """
+        parts = [[] for _ in self.inboxes]
+        for data in trades:
+            parts[partition(data["symbol"], len(self.inboxes))].append(data)
+        for inbox, part in zip(self.inboxes, parts):
+            if part:
+                inbox.put(part)
+
+    def request_checkpoint(self, directory):
+        """
+        Ask every worker to save its models once it has processed every trade that
+        was submitted before the request. Returns the sequence number of the
+        checkpoint to wait for.
+        """
+        self.checkpoints += 1
+        for inbox in self.inboxes:
+            inbox.put(("checkpoint", directory, self.checkpoints))
+        return self.checkpoints
+
+    def wait_checkpoint(self, seq, timeout=60):
+        """
+        Wait until every worker has saved its models for checkpoint `seq`. Reports
+        left over from earlier checkpoints that timed out are discarded. This
+        blocks, so run it in an executor from async code.
+
+        Raises queue.Empty if a worker does not report within the timeout.
+        """
+        saved = set()
+        while len(saved) < len(self.inboxes):
+            index, done = self.done.get(timeout=timeout)
+            if done == seq:
+                saved.add(index)
+
+    def stop(self, timeout=5):
+        """
+        Ask the workers to exit once they have drained their queues, terminating
+        any that do not exit within the timeout.
+        """
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
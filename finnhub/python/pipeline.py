@@ -0,0 +1,108 @@
+import time
+import asyncio
+
+# Overflow policies for a full queue
+BLOCK = "block"
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+POLICIES = (BLOCK, DROP_NEWEST, DROP_OLDEST)
+
+
+class PipelineMetrics:
+    """
+    PipelineMetrics counts the items flowing through a BoundedQueue and tracks how
+    far behind the consumers are running.
+    """
+
+    def __init__(self):
+        self.enqueued = 0
+        self.dropped = 0
+        self.dequeued = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+
+    def snapshot(self, depth):
+        """
+        Return the current metrics as a dict, including the current queue depth.
+        """
+        return {
+            "depth": depth,
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "dequeued": self.dequeued,
+            "batches": self.batches,
+            "lag": round(self.lag, 6),
+            "max_lag": round(self.max_lag, 6),
+        }
+
+
+class BoundedQueue:
+    """
+    BoundedQueue is an asyncio queue with an explicit overflow policy that decouples
+    a producer from one or more consumers that drain it in batches. When the queue
+    is full, the "block" policy applies backpressure to the producer, "drop_newest"
+    discards the incoming item and "drop_oldest" discards the oldest queued item.
+    """
+
+    def __init__(self, maxsize=10000, policy=BLOCK):
+        """
+        Parameters
+        ----------
+        maxsize : int, default: 10000
+            The maximum number of items in the queue.
+
+        policy : str, default: "block"
+            What to do when the queue is full: "block", "drop_newest" or "drop_oldest".
+        """
+        if policy not in POLICIES:
+            raise ValueError(
+                f"unknown overflow policy {policy!r}, use one of {POLICIES}"
+            )
+
+        self.policy = policy
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.metrics = PipelineMetrics()
+
+    def __len__(self):
+        return self.queue.qsize()
+
+    async def put(self, item):
+        """
+        Add an item to the queue according to the overflow policy. Returns False if
+        the item was dropped.
+        """
+        entry = (time.monotonic(), item)
+        if self.queue.full():
+            if self.policy == DROP_NEWEST:
+                self.metrics.dropped += 1
+                return False
+            if self.policy == DROP_OLDEST:
+                self.queue.get_nowait()
+                self.metrics.dropped += 1
+
+        await self.queue.put(entry)
+        self.metrics.enqueued += 1
+        self.metrics.max_depth = max(self.metrics.max_depth, self.queue.qsize())
+        return True
+
+    async def get_batch(self, max_items):
+        """
+        Wait for at least one item, then return up to `max_items` items that are
+        already queued without waiting for more.
+        """
+        entries = [await self.queue.get()]
+        while len(entries) < max_items and not self.queue.empty():
+            entries.append(self.queue.get_nowait())
+
+        # The lag is how long the oldest item in the batch spent in the queue
+        self.metrics.lag = time.monotonic() - entries[0][0]
+        self.metrics.max_lag = max(self.metrics.max_lag, self.metrics.lag)
+        self.metrics.dequeued += len(entries)
+        self.metrics.batches += 1
+        return [item for _, item in entries]
+
+    def stats(self):
+        return self.metrics.snapshot(self.queue.qsize())
@@ -1,12 +1,15 @@
 import asyncio
-import json
 import os
+import time
 
 import websockets
 
 from pyensign.events import Event
 from pyensign.ensign import Ensign
-from utils import handle_ack, handle_nack
+from latency import RECORDER
+from codec import CodecError, CodecRegistry
+from utils import ack_latency, handle_nack
+from pipeline import BLOCK, BoundedQueue
 
 
 class TradesPublisher:
@@ -15,11 +18,84 @@ class TradesPublisher:
     """
 
     def __init__(
-        self, symbols=["AAPL", "MSFT", "AMZN"], topic="trades", ensign_creds=""
+        self,
+        symbols=["AAPL", "MSFT", "AMZN"],
+        topic="trades",
+        ensign_creds="",
+        queue_size=10000,
+        overflow=BLOCK,
+        publishers=1,
+        batch_size=100,
+        metrics_interval=10,
+        connections=1,
+        latency_interval=60,
+        latency_path=None,
+        codec="json",
     ):
+        """
+        Parameters
+        ----------
+        symbols : list of str, default: ["AAPL", "MSFT", "AMZN"]
+            The symbols to subscribe to trades for.
+
+        topic : str, default: "trades"
+            The name of the topic to publish to.
+
+        ensign_creds : str (optional)
+            The path to your Ensign credentials file. If not provided, credentials will
+            be read from the ENSIGN_CLIENT_ID and ENSIGN_CLIENT_SECRET environment
+            variables.
+
+        queue_size : int, default: 10000
+            The maximum number of trades buffered between the websocket receiver and
+            the publishers.
+
+        overflow : str, default: "block"
+            What to do when the buffer is full: "block" applies backpressure to the
+            receiver, "drop_newest" drops incoming trades and "drop_oldest" drops the
+            oldest buffered trades.
+
+        publishers : int, default: 1
+            The number of concurrent tasks publishing trades to Ensign.
+
+        batch_size : int, default: 100
+            The maximum number of trades published to Ensign at once.
+
+        metrics_interval : float, default: 10
+            The number of seconds between queue metrics reports, or None to disable.
+
+        connections : int, default: 1
+            The number of websocket connections to shard the symbols across. Each
+            connection reconnects and resubscribes independently, and all of them
+            publish to the same topic.
+
+        latency_interval : float, default: 60
+            The number of seconds between latency histogram exports, or None to
+            disable them.
+
+        latency_path : str, default: None
+            A file to append the latency exports to as JSON lines. If not specified,
+            the exports are printed.
+
+        codec : str, default: "json"
+            The codec to encode trades with: "json", "orjson", "msgpack" or "avro"
+            (see codec.py). Subscribers pick the codec to decode with from the
+            mimetype of each event.
+        """
         self.symbols = symbols
         self.topic = topic
         self.ensign = Ensign(cred_path=ensign_creds)
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.publishers = publishers
+        self.batch_size = batch_size
+        self.metrics_interval = metrics_interval
+        self.connections = max(1, min(connections, len(symbols)))
+        self.latency_interval = latency_interval
+        self.latency_path = latency_path
+        self.codecs = CodecRegistry(schema="trade")
+        self.codec = self.codecs.get(codec)
+        self.queue = None
 
     def run(self):
         """
@@ -35,33 +111,96 @@ class TradesPublisher:
 
     async def recv_and_publish(self, uri):
         """
-        Receive messages from the websocket and publish events to Ensign.
+        Receive messages from the websocket and publish events to Ensign. The
+        websocket receiver and the Ensign publishers run as separate tasks connected
+        by a bounded queue, so a slow publish never stalls the websocket.
         """
         topic_id = await self.ensign.topic_id(self.topic)
+        self.queue = BoundedQueue(maxsize=self.queue_size, policy=self.overflow)
+
+        tasks = [self.receive(uri, shard) for shard in self.shards()]
+        tasks += [self.publish(topic_id) for _ in range(self.publishers)]
+        if self.metrics_interval:
+            tasks.append(self.report_metrics())
+        if self.latency_interval:
+            tasks.append(
+                RECORDER.report_periodically(self.latency_interval, self.latency_path)
+            )
+        await asyncio.gather(*tasks)
+
+    def shards(self):
+        """
+        Split the symbols into one shard per websocket connection, round-robin.
+        """
+        return [self.symbols[i :: self.connections] for i in range(self.connections)]
+
+    async def receive(self, uri, symbols):
+        """
+        Receive messages for a shard of the symbols from its own websocket and queue
+        the trade events, reconnecting and resubscribing whenever the connection is
+        lost or refused without affecting the other shards. Messages that cannot be
+        decoded are skipped.
+        """
         while True:
             try:
                 async with websockets.connect(uri) as websocket:
-                    for symbol in self.symbols:
+                    for symbol in symbols:
                         await websocket.send(
                             f'{{"type":"subscribe","symbol":"{symbol}"}}'
                         )
 
                     while True:
                         message = await websocket.recv()
-                        for event in self.message_to_events(json.loads(message)):
-                            await self.ensign.publish(
-                                topic_id, event, on_ack=handle_ack, on_nack=handle_nack
-                            )
-            except websockets.exceptions.ConnectionClosedError as e:
-                print(f"Websocket connection closed: {e}")
+                        received = time.time()
+                        try:
+                            message = self.codecs.decode(message, "application/json")
+                        except CodecError as e:
+                            print(f"Skipping undecodable Finnhub message: {e}")
+                            continue
+
+                        for event in self.message_to_events(
+                            message, received_at=received
+                        ):
+                            await self.queue.put((event, received))
+            except (websockets.exceptions.WebSocketException, OSError) as e:
+                # Includes rejected handshakes, e.g. when rate limited
+                print(f"Websocket connection for {', '.join(symbols)} failed: {e}")
                 await asyncio.sleep(1)
 
-    def message_to_events(self, message):
+    async def publish(self, topic_id):
+        """
+        Drain the queue in batches and publish the events to Ensign.
+        """
+        while True:
+            batch = await self.queue.get_batch(self.batch_size)
+            events = [event for event, _ in batch]
+
+            # Measure the commit latency from the oldest trade in the batch
+            on_ack = ack_latency(
+                receive_to_commit=min(received for _, received in batch),
+                publish_to_commit=time.time(),
+            )
+            await self.ensign.publish(
+                topic_id, *events, on_ack=on_ack, on_nack=handle_nack
+            )
+
+    async def report_metrics(self):
+        """
+        Periodically print the queue depth, drop counts and publish lag.
+        """
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            print(f"Pipeline metrics: {self.queue.stats()}")
+
+    def message_to_events(self, message, received_at=None):
         """
-        Convert a message from the Finnhub API to multiple Ensign events.
+        Convert a message from the Finnhub API to multiple Ensign events. If the time
+        the message was received is given, it is added to each trade and the latency
+        from the exchange timestamp is recorded. Messages of other types, such as
+        errors, are printed and skipped.
         """
 
-        message_type = message["type"]
+        message_type = message.get("type") if isinstance(message, dict) else None
         if message_type == "ping":
             return
         elif message_type == "trade":
@@ -72,11 +211,13 @@ class TradesPublisher:
                     "timestamp": trade["t"],
                     "volume": trade["v"],
                 }
-                yield Event(
-                    json.dumps(data).encode("utf-8"), mimetype="application/json"
-                )
+                if received_at is not None:
+                    data["received_at"] = received_at
+                    latency = received_at - trade["t"] / 1000
+                    RECORDER.record("exchange_to_receive", latency)
+                yield Event(self.codec.encode(data), mimetype=self.codec.mimetype)
         else:
-            raise ValueError(f"Unknown message type: {message_type}")
+            print(f"Skipping Finnhub message of unknown type {message_type}: {message}")
 
 
 if __name__ == "__main__":
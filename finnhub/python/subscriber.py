@@ -1,14 +1,15 @@
-import json
+import time
+import queue
 import asyncio
-from datetime import datetime
 
 from pyensign.events import Event
 from pyensign.ensign import Ensign
-from river import compose
-from river import linear_model
-from river import preprocessing
 
-from utils import handle_ack, handle_nack
+from latency import RECORDER
+from codec import CodecRegistry
+from utils import ack_latency, handle_nack
+from checkpoint import load_state, save_state
+from models import ModelWorkerPool, SymbolModels
 
 
 class TradesSubscriber:
@@ -17,11 +18,100 @@ class TradesSubscriber:
     online model pipeline and publishes predictions to a new topic.
     """
 
-    def __init__(self, sub_topic="trades", pub_topic="predictions", ensign_creds=""):
+    def __init__(
+        self,
+        sub_topic="trades",
+        pub_topic="predictions",
+        ensign_creds="",
+        workers=0,
+        batch_size=1,
+        batch_latency=50,
+        checkpoint_dir=None,
+        checkpoint_interval=60,
+        latency_interval=60,
+        latency_path=None,
+        codec="json",
+    ):
+        """
+        Parameters
+        ----------
+        sub_topic : str, default: "trades"
+            The name of the topic to consume trades from.
+
+        pub_topic : str, default: "predictions"
+            The name of the topic to publish predictions to.
+
+        ensign_creds : str (optional)
+            The path to your Ensign credentials file. If not provided, credentials will
+            be read from the ENSIGN_CLIENT_ID and ENSIGN_CLIENT_SECRET environment
+            variables.
+
+        workers : int, default: 0
+            The number of worker processes to partition the per-symbol models across.
+            If 0, every model is trained in the subscriber's own process.
+
+        batch_size : int, default: 1
+            The maximum number of trades to collect into a mini-batch before running
+            the models on it. If 1, the models are run on one trade at a time.
+
+        batch_latency : float, default: 50
+            The maximum number of milliseconds to wait for a mini-batch to fill up
+            before running the models on the trades collected so far.
+
+        checkpoint_dir : str, default: None
+            The directory to periodically save snapshots of the models to, along
+            with the offset of the last consumed trade in the topic. If a checkpoint
+            exists, the models are restored from it on startup and the subscription
+            resumes from the trade after that offset.
+
+        checkpoint_interval : float, default: 60
+            The number of seconds between checkpoints.
+
+        latency_interval : float, default: 60
+            The number of seconds between latency histogram exports, or None to
+            disable them.
+
+        latency_path : str, default: None
+            A file to append the latency exports to as JSON lines. If not specified,
+            the exports are printed.
+
+        codec : str, default: "json"
+            The codec to encode predictions with: "json", "orjson" or "msgpack" (see
+            codec.py). Trades are decoded with the codec matching their mimetype.
+        """
         self.sub_topic = sub_topic
         self.pub_topic = pub_topic
         self.ensign = Ensign(cred_path=ensign_creds)
-        self.model = self.build_model()
+        self.pub_topic_id = None
+        self.codecs = CodecRegistry(schema="trade")
+        self.codec = CodecRegistry().get(codec)
+
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_interval = checkpoint_interval
+        self.latency_interval = latency_interval
+        self.latency_path = latency_path
+        self.restored = None
+        self.position = None
+        self.offset = None
+        if checkpoint_dir is not None:
+            self.restored = load_state(checkpoint_dir)
+
+        if workers > 0:
+            self.models = None
+            self.pool = ModelWorkerPool(workers, checkpoint_dir=checkpoint_dir)
+        else:
+            self.pool = None
+            if checkpoint_dir is not None:
+                self.models = SymbolModels.load(checkpoint_dir)
+            else:
+                self.models = SymbolModels()
+
+        self.batch_size = batch_size
+        self.batch_latency = batch_latency
+        self.batch = []
+        self.batch_position = None
+        self.batch_started = None
+        self.batch_ready = None
 
     def run(self):
         """
@@ -29,67 +119,232 @@ class TradesSubscriber:
         """
         asyncio.run(self.subscribe())
 
-    def build_model(self):
-        model = compose.Pipeline(
-            ("scale", preprocessing.StandardScaler()),
-            ("lin_reg", linear_model.LinearRegression()),
-        )
-        return model
+    async def run_model_pipeline(self, event):
+        """
+        Train an online model and publish predictions to a new topic.
+        Run your super smart model pipeline here!
+        """
+        data = self.codecs.decode(event.data, event.mimetype)
+        self.record_receive(data)
 
-    def get_timestamp(self, epoch):
+        # Keep track of the last trade handed to the models for checkpoints, by the
+        # number of events consumed from the topic so far
+        event_id = getattr(event, "id", None)
+        position = {
+            "offset": self.offset,
+            "event_id": str(event_id) if event_id is not None else None,
+            "timestamp": data["timestamp"],
+        }
+
+        if self.batch_size > 1:
+            if not self.batch:
+                self.batch_started = asyncio.get_running_loop().time()
+                self.batch_ready.set()
+            self.batch.append(data)
+            self.batch_position = position
+            if len(self.batch) >= self.batch_size:
+                await self.flush_batch()
+            return
+
+        # With a worker pool, the prediction is published once the worker that owns
+        # the symbol's model sends it back.
+        self.position = position
+        if self.pool is not None:
+            self.pool.submit(data)
+            return
+
+        started = time.perf_counter()
+        message = self.models.process(data)
+        RECORDER.record("model", time.perf_counter() - started)
+        await self.publish_predictions([message])
+
+    def record_receive(self, data):
         """
-        converts unix epoch to datetime
+        Record how long it took for a trade to get from the exchange (and from the
+        publisher, if it recorded when it received the trade) to the subscriber.
         """
-        epoch_time = epoch / 1000.0
-        timestamp = datetime.fromtimestamp(epoch_time)
-        return timestamp
+        now = time.time()
+        RECORDER.record("exchange_to_subscriber", now - data["timestamp"] / 1000)
+        if "received_at" in data:
+            RECORDER.record("publisher_to_subscriber", now - data["received_at"])
 
-    async def run_model_pipeline(self, event):
+    async def flush_batch(self):
         """
-        Train an online model and publish predictions to a new topic.
-        Run your super smart model pipeline here!
+        Run the models on the current mini-batch of trades and publish the batch of
+        predictions.
         """
-        data = json.loads(event.data)
-        # convert unix epoch to datetime
-        timestamp = self.get_timestamp(data["timestamp"])
-        # extract the microsecond component and use it as a model feature
-        x = {"microsecond": timestamp.microsecond}
-        # generate a prediction
-        price_pred = round(self.model.predict_one(x), 4)
-        price = data["price"]
-        # pass the actual trade price to the model
-        self.model.learn_one(x, price)
-
-        # create a message that contains the predicted price and the actual price
-        message = dict()
-        message["symbol"] = data["symbol"]
-        message["time"] = timestamp.strftime("%H:%M:%S")
-        message["price"] = str(data["price"])
-        message["price_pred"] = str(price_pred)
-        print(message)
-
-        # create an Ensign event and publish to the predictions topic
-        event = Event(json.dumps(message).encode("utf-8"), mimetype="application/json")
-        # Get the topic ID from the topic name.
-        topic_id = await self.ensign.topic_id(self.pub_topic)
+        trades, self.batch = self.batch, []
+        self.batch_ready.clear()
+        if not trades:
+            return
+
+        self.position = self.batch_position
+
+        if self.pool is not None:
+            self.pool.submit_batch(trades)
+            return
+
+        started = time.perf_counter()
+        messages = self.models.process_batch(trades)
+        elapsed = time.perf_counter() - started
+        RECORDER.record("model", elapsed / len(trades), count=len(trades))
+        await self.publish_predictions(messages)
+
+    async def flush_on_latency(self):
+        """
+        Flush mini-batches that have not filled up within the batch latency.
+        """
+        loop = asyncio.get_running_loop()
+        latency = self.batch_latency / 1000
+        while True:
+            await self.batch_ready.wait()
+            wait = self.batch_started + latency - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            elif self.batch:
+                await self.flush_batch()
+
+    async def publish_predictions(self, messages):
+        """
+        Publish prediction messages to the predictions topic.
+        """
+        now = time.time()
+        for message in messages:
+            print(message)
+            RECORDER.record("exchange_to_prediction", now - message["timestamp"] / 1000)
+
+        # create Ensign events and publish them to the predictions topic
+        events = [
+            Event(self.codec.encode(message), mimetype=self.codec.mimetype)
+            for message in messages
+        ]
+        oldest = min(message["timestamp"] for message in messages) / 1000
+        on_ack = ack_latency(
+            prediction_to_commit=now, exchange_to_prediction_commit=oldest
+        )
         await self.ensign.publish(
-            topic_id, event, on_ack=handle_ack, on_nack=handle_nack
+            self.pub_topic_id, *events, on_ack=on_ack, on_nack=handle_nack
         )
 
+    async def gather_predictions(self):
+        """
+        Publish the predictions sent back by the worker processes.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            # Wait with a timeout so the executor thread exits soon after shutdown
+            try:
+                messages, elapsed = await loop.run_in_executor(
+                    None, self.pool.results.get, True, 0.5
+                )
+            except queue.Empty:
+                continue
+            RECORDER.record("model", elapsed / len(messages), count=len(messages))
+            await self.publish_predictions(messages)
+
+    async def checkpoint(self):
+        """
+        Save a snapshot of the models along with the last trade they were trained
+        on. The models are saved before the state, so a checkpoint never claims
+        trades that are missing from the models.
+        """
+        if self.batch_size > 1:
+            await self.flush_batch()
+
+        # Capture the position before yielding to the event loop again, so it
+        # matches the trades that were handed to the models.
+        state = self.position
+        if state is None:
+            return
+
+        if self.pool is not None:
+            seq = self.pool.request_checkpoint(self.checkpoint_dir)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.pool.wait_checkpoint, seq)
+        else:
+            self.models.save(self.checkpoint_dir)
+        save_state(self.checkpoint_dir, state)
+
+    async def checkpoint_periodically(self):
+        """
+        Checkpoint the models every `checkpoint_interval` seconds.
+        """
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await self.checkpoint()
+            except queue.Empty:
+                # The previous checkpoint is kept, so the next one can try again
+                print("Checkpoint skipped: the workers did not save their models")
+
+    async def start_offset(self, topic_id):
+        """
+        Return the offset in the topic to resume consuming trades from, which is the
+        offset after the last trade in the restored checkpoint, or None if there is
+        no checkpoint to resume from.
+        """
+        if self.restored is None:
+            return None
+        if self.restored.get("offset") is None:
+            print("Checkpoint has no offset, resuming from the end of the topic")
+            return None
+        return self.restored["offset"]
+
     async def subscribe(self):
         """
         Subscribe to trading events from Ensign and run an
         online model pipeline and publish predictions to a new topic.
         """
 
-        # Get the topic ID from the topic name.
+        # Get the topic IDs from the topic names.
         topic_id = await self.ensign.topic_id(self.sub_topic)
+        self.pub_topic_id = await self.ensign.topic_id(self.pub_topic)
+
+        tasks = []
+        if self.pool is not None:
+            self.pool.start()
+            tasks.append(asyncio.create_task(self.gather_predictions()))
+        if self.batch_size > 1:
+            self.batch_ready = asyncio.Event()
+            tasks.append(asyncio.create_task(self.flush_on_latency()))
+        if self.checkpoint_dir is not None:
+            tasks.append(asyncio.create_task(self.checkpoint_periodically()))
+        if self.latency_interval:
+            report = RECORDER.report_periodically(
+                self.latency_interval, self.latency_path
+            )
+            tasks.append(asyncio.create_task(report))
 
-        # Subscribe to the topic.
+        # Subscribe to the topic from the offset of the checkpoint, so the trades
+        # published since then are replayed in topic order and the live trades
+        # follow on the same stream, without a gap between them. Otherwise only
+        # the live trades are consumed.
         # self.run_model_pipeline is a callback function that gets executed when
         # a new event arrives in the topic
-        async for event in self.ensign.subscribe(topic_id):
-            await self.run_model_pipeline(event)
+        try:
+            self.offset = await self.start_offset(topic_id)
+            if self.offset is not None:
+                query = f"SELECT * FROM {self.sub_topic} OFFSET {self.offset}"
+                events = self.ensign.subscribe(topic_id, query=query)
+            else:
+                events = self.ensign.subscribe(topic_id)
+                if self.checkpoint_dir is not None:
+                    # Count the offsets of the live trades from the end of the topic
+                    # before subscribing, so that trades published in between make
+                    # the offset too small rather than too large, and are replayed
+                    # rather than skipped after a restart.
+                    info = await self.ensign.info([topic_id])
+                    self.offset = info.events
+
+            async for event in events:
+                if self.offset is not None:
+                    self.offset += 1
+                await self.run_model_pipeline(event)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if self.pool is not None:
+                self.pool.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+import pytest
+
+from bars import BarAggregator
+
+
+def test_tumbling_bar():
+    agg = BarAggregator("1s", 1)
+    assert agg.add("AAPL", 10.0, 1, 1000) == []
+    assert agg.add("AAPL", 12.0, 2, 1500) == []
+    assert agg.add("AAPL", 9.0, 1, 1900) == []
+
+    bars = agg.add("AAPL", 11.0, 1, 2100)
+    assert bars == [
+        {
+            "symbol": "AAPL",
+            "bar": "1s",
+            "start": 1000,
+            "end": 2000,
+            "open": 10.0,
+            "high": 12.0,
+            "low": 9.0,
+            "close": 9.0,
+            "volume": 4.0,
+            "vwap": pytest.approx((10.0 + 24.0 + 9.0) / 4),
+            "count": 3,
+        }
+    ]
+
+
+def test_flush_closes_quiet_symbols():
+    agg = BarAggregator("1s", 1)
+    agg.add("AAPL", 10.0, 1, 1000)
+    agg.add("MSFT", 20.0, 1, 1200)
+    assert agg.flush(1999) == []
+    bars = agg.flush(2000)
+    assert sorted(bar["symbol"] for bar in bars) == ["AAPL", "MSFT"]
+    assert agg.flush(5000) == []
+
+
+def test_late_trades_are_dropped_without_lateness():
+    agg = BarAggregator("1s", 1)
+    agg.add("AAPL", 10.0, 1, 1000)
+    agg.flush(2000)
+    assert agg.add("AAPL", 11.0, 1, 1999) == []
+    assert agg.flush(3000) == []
+
+
+def test_late_trades_within_lateness_are_included():
+    agg = BarAggregator("1s", 1, lateness=0.5)
+    agg.add("AAPL", 10.0, 1, 1000)
+
+    # The step has ended but is still open
+    assert agg.flush(2200) == []
+
+    # A trade for the next step doesn't close it either
+    assert agg.add("AAPL", 12.0, 1, 2100) == []
+
+    # A trade in transit at the boundary arrives late
+    assert agg.add("AAPL", 11.0, 1, 1999) == []
+
+    bars = agg.flush(2500)
+    assert len(bars) == 1
+    assert bars[0]["start"] == 1000
+    assert bars[0]["count"] == 2
+    assert bars[0]["close"] == 11.0
+
+    # Once the step has closed, later trades for it are dropped
+    assert agg.add("AAPL", 13.0, 1, 1999) == []
+    bars = agg.flush(3500)
+    assert [(bar["start"], bar["count"]) for bar in bars] == [(2000, 1)]
+
+
+def test_trades_within_lateness_of_the_first_trade_are_included():
+    agg = BarAggregator("1s", 1, lateness=2)
+    assert agg.add("AAPL", 10.0, 1, 5000) == []
+
+    # The first trade was the late one, and an older trade arrives after it
+    assert agg.add("AAPL", 9.0, 1, 3900) == []
+    assert agg.add("AAPL", 8.0, 1, 2500) == []
+
+    bars = agg.flush(7000) + agg.flush(8000)
+    assert [(bar["start"], bar["count"], bar["open"]) for bar in bars] == [
+        (3000, 1, 9.0),
+        (5000, 1, 10.0),
+    ]
+
+
+def test_trades_close_steps_after_lateness():
+    agg = BarAggregator("1s", 1, lateness=0.5)
+    agg.add("AAPL", 10.0, 1, 1000)
+    assert agg.add("AAPL", 11.0, 1, 2400) == []
+    bars = agg.add("AAPL", 12.0, 1, 2600)
+    assert [(bar["start"], bar["count"]) for bar in bars] == [(1000, 1)]
+
+
+def test_sliding_bar():
+    agg = BarAggregator("3s-sliding", 1, window=3)
+    bars = agg.add("AAPL", 10.0, 1, 0)
+    bars += agg.add("AAPL", 20.0, 1, 2000)
+    bars += agg.flush(4000)
+    assert [(bar["start"], bar["end"]) for bar in bars] == [
+        (-2000, 1000),
+        (-1000, 2000),
+        (0, 3000),
+        (1000, 4000),
+    ]
+    assert [bar["count"] for bar in bars] == [1, 1, 2, 1]
+    assert bars[2]["open"] == 10.0 and bars[2]["close"] == 20.0
+
+    # The window is empty after three quiet steps, so no more bars are emitted
+    assert [bar["end"] for bar in agg.flush(60000)] == [5000]
+
+
+def test_sliding_bar_after_a_gap():
+    agg = BarAggregator("2s-sliding", 1, window=2)
+    agg.add("AAPL", 10.0, 1, 0)
+    agg.flush(10000)
+    agg.add("AAPL", 20.0, 1, 10500)
+    bars = agg.flush(11000)
+    assert [(bar["end"], bar["count"], bar["open"]) for bar in bars] == [
+        (11000, 1, 20.0)
+    ]
@@ -0,0 +1,53 @@
+import queue
+
+import pytest
+
+from checkpoint import load_models, load_state, save_models, save_state
+from models import ModelWorkerPool, SymbolModels, partition
+
+
+def test_state_roundtrip(tmp_path):
+    assert load_state(tmp_path) is None
+    state = {"offset": 42, "event_id": "01H5", "timestamp": 1688000000000}
+    save_state(tmp_path, state)
+    assert load_state(tmp_path) == state
+
+
+def test_models_roundtrip(tmp_path):
+    models = SymbolModels()
+    models.process({"symbol": "BINANCE:BTCUSDT", "price": 30000.0, "timestamp": 1})
+    models.process({"symbol": "AAPL", "price": 180.0, "timestamp": 2})
+    save_models(tmp_path, models.models)
+
+    assert set(load_models(tmp_path)) == {"BINANCE:BTCUSDT", "AAPL"}
+    owned = load_models(tmp_path, owns=lambda symbol: symbol == "AAPL")
+    assert set(owned) == {"AAPL"}
+
+
+def test_worker_pool_checkpoint(tmp_path):
+    pool = ModelWorkerPool(2)
+    pool.start()
+    try:
+        symbols = ["AAPL", "MSFT", "AMZN", "TSLA"]
+        for i, symbol in enumerate(symbols):
+            pool.submit({"symbol": symbol, "price": 100.0 + i, "timestamp": i})
+
+        # A report left over from an earlier checkpoint that timed out is ignored
+        pool.done.put((0, 0))
+        seq = pool.request_checkpoint(str(tmp_path))
+        pool.wait_checkpoint(seq, timeout=30)
+        assert set(load_models(tmp_path)) == set(symbols)
+
+        for _ in symbols:
+            messages, _ = pool.results.get(timeout=30)
+            assert partition(messages[0]["symbol"], 2) in (0, 1)
+    finally:
+        pool.stop()
+
+
+def test_wait_checkpoint_times_out(tmp_path):
+    pool = ModelWorkerPool(1)
+    seq = pool.request_checkpoint(str(tmp_path))
+    # The worker was never started, so it can't report
+    with pytest.raises(queue.Empty):
+        pool.wait_checkpoint(seq, timeout=0.1)
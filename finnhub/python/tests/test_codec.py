@@ -0,0 +1,61 @@
+import math
+
+import pytest
+from pyensign import mimetypes as mtype
+
+from codec import (
+    CODECS,
+    CodecError,
+    CodecRegistry,
+    FastJSONCodec,
+    normalize_mimetype,
+    sample_records,
+)
+
+
+def test_normalize_mimetype():
+    key = normalize_mimetype("application/json")
+    assert normalize_mimetype("application/json; charset=utf-8") == key
+    assert normalize_mimetype("ApplicationJSON") == key
+    assert normalize_mimetype(mtype.parse("application/json")) == key
+    assert normalize_mimetype(mtype.parse("application/msgpack")) == normalize_mimetype(
+        "application/msgpack"
+    )
+
+
+@pytest.mark.parametrize("name", list(CODECS))
+def test_roundtrip(name):
+    registry = CodecRegistry(schema="trade")
+    try:
+        codec = registry.get(name)
+    except CodecError:
+        pytest.skip(f"the {name} codec is not installed")
+
+    records = sample_records(20)
+    for record in records:
+        payload = codec.encode(record)
+        assert registry.decode(payload, codec.mimetype) == record
+        # events received from Ensign have integer mimetypes
+        assert registry.decode(payload, mtype.parse(codec.mimetype)) == record
+
+
+def test_orjson_decodes_nan_and_infinity():
+    pytest.importorskip("orjson")
+    data = FastJSONCodec().decode(b'{"price": NaN, "volume": Infinity}')
+    assert math.isnan(data["price"])
+    assert data["volume"] == math.inf
+
+
+def test_errors():
+    registry = CodecRegistry()
+    with pytest.raises(CodecError, match="no codec registered"):
+        registry.decode(b"{}", "application/protobuf")
+    with pytest.raises(CodecError, match="could not decode"):
+        registry.decode(b"{not json", "application/json")
+    with pytest.raises(CodecError, match="unknown codec"):
+        registry.get("xml")
+    with pytest.raises(CodecError, match="requires a schema"):
+        registry.get("avro")
+
+    # codec errors are value errors, so callers can treat them as bad input
+    assert issubclass(CodecError, ValueError)
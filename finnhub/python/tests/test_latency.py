@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from latency import LatencyHistogram, LatencyRecorder
+
+
+def test_small_values_are_exact():
+    histogram = LatencyHistogram()
+    for micros in range(128):
+        assert histogram._value(histogram._index(micros)) == micros
+
+
+def test_bucket_values_are_within_relative_error():
+    histogram = LatencyHistogram()
+    for micros in np.unique(np.geomspace(128, 3.6e9, 2000).astype(np.int64)):
+        value = histogram._value(histogram._index(int(micros)))
+        assert value == pytest.approx(int(micros), rel=0.01)
+
+
+def test_percentiles():
+    rng = np.random.default_rng(42)
+    latencies = rng.lognormal(np.log(0.05), 1.0, 10000)
+    histogram = LatencyHistogram()
+    for seconds in latencies:
+        histogram.record(seconds)
+
+    for q in (50, 90, 99, 99.9):
+        expected = np.percentile(latencies, q, method="inverted_cdf")
+        assert histogram.percentile(q) == pytest.approx(expected, rel=0.01)
+    assert histogram.percentile(100) == pytest.approx(latencies.max(), abs=1e-6)
+
+
+def test_out_of_range_latencies_are_clamped():
+    histogram = LatencyHistogram(max_seconds=1)
+    histogram.record(-0.5)
+    histogram.record(10.0, count=3)
+
+    summary = histogram.summary()
+    assert summary["count"] == 4
+    assert summary["min"] == 0.0
+    assert summary["max"] == 1.0
+    assert summary["p50"] == 1.0
+
+
+def test_merge():
+    first, second, both = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for i, seconds in enumerate(np.linspace(0.001, 2.0, 500)):
+        (first if i % 2 else second).record(seconds)
+        both.record(seconds)
+
+    first.merge(second)
+    assert first.summary() == both.summary()
+    assert LatencyHistogram().merge(LatencyHistogram()).summary() == {"count": 0}
+
+
+def test_recorder_exports_and_resets():
+    recorder = LatencyRecorder()
+    recorder.record("publish", 0.25, count=2)
+    recorder.record("predict", 0.5)
+
+    report = recorder.export(reset=True)
+    assert report["publish"]["count"] == 2
+    assert report["publish"]["mean"] == pytest.approx(0.25)
+    assert report["predict"]["p50"] == pytest.approx(0.5, rel=0.01)
+    assert recorder.export() == {"publish": {"count": 0}, "predict": {"count": 0}}
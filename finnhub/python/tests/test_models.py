@@ -0,0 +1,48 @@
+import time
+
+import pandas as pd
+import pytest
+
+from models import SymbolModels, get_timestamp, get_timestamps, partition
+
+# 2023-03-12 06:59:59 and 07:00:00 UTC, when New York springs forward
+BEFORE_DST = 1678604399000
+AFTER_DST = 1678604400000
+
+
+@pytest.fixture
+def new_york(monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_get_timestamps_follows_dst(new_york):
+    epochs = pd.Series([BEFORE_DST, AFTER_DST, AFTER_DST + 123])
+    times = get_timestamps(epochs)
+    assert list(times.dt.strftime("%H:%M:%S.%f")) == [
+        "01:59:59.000000",
+        "03:00:00.000000",
+        "03:00:00.123000",
+    ]
+    assert list(times) == [get_timestamp(epoch) for epoch in epochs]
+
+
+def test_process_batch_matches_process(new_york):
+    trades = [
+        {"symbol": "AAPL", "price": 180.5, "timestamp": BEFORE_DST},
+        {"symbol": "MSFT", "price": 330.0, "timestamp": AFTER_DST},
+    ]
+    batch = SymbolModels().process_batch(trades)
+    single = [SymbolModels().process(trade) for trade in trades]
+    assert [m["time"] for m in batch] == ["01:59:59", "03:00:00"]
+    assert [m["time"] for m in batch] == [m["time"] for m in single]
+    assert [m["symbol"] for m in batch] == ["AAPL", "MSFT"]
+
+
+def test_partition_is_stable():
+    assert partition("AAPL", 4) == partition("AAPL", 4)
+    for symbol in ("AAPL", "MSFT", "AMZN", "TSLA"):
+        assert 0 <= partition(symbol, 3) < 3
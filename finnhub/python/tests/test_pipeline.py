@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from pipeline import BLOCK, DROP_NEWEST, DROP_OLDEST, BoundedQueue
+
+
+async def fill(queue, items):
+    return [await queue.put(item) for item in items]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        BoundedQueue(policy="drop_everything")
+
+
+def test_block_applies_backpressure():
+    async def run():
+        queue = BoundedQueue(maxsize=2, policy=BLOCK)
+        await fill(queue, [1, 2])
+        put = asyncio.create_task(queue.put(3))
+        await asyncio.sleep(0.01)
+        assert not put.done()
+
+        assert await queue.get_batch(1) == [1]
+        assert await put
+        assert await queue.get_batch(10) == [2, 3]
+        return queue.stats()
+
+    stats = asyncio.run(run())
+    assert stats["enqueued"] == 3
+    assert stats["dropped"] == 0
+    assert stats["max_depth"] == 2
+
+
+@pytest.mark.parametrize(
+    "policy, added, kept",
+    [
+        (DROP_NEWEST, [True, True, False, False], [1, 2]),
+        (DROP_OLDEST, [True, True, True, True], [3, 4]),
+    ],
+)
+def test_drop_policies(policy, added, kept):
+    async def run():
+        queue = BoundedQueue(maxsize=2, policy=policy)
+        assert await fill(queue, [1, 2, 3, 4]) == added
+        return await queue.get_batch(10), queue.stats()
+
+    batch, stats = asyncio.run(run())
+    assert batch == kept
+    assert stats["enqueued"] == sum(added)
+    assert stats["dropped"] == 2
+    assert stats["dequeued"] == 2
+    assert stats["depth"] == 0
+    assert stats["max_depth"] == 2
+
+
+def test_get_batch_returns_queued_items_without_waiting():
+    async def run():
+        queue = BoundedQueue()
+        await fill(queue, range(5))
+        batches = [await queue.get_batch(2) for _ in range(3)]
+        return batches, queue.stats()
+
+    batches, stats = asyncio.run(run())
+    assert batches == [[0, 1], [2, 3], [4]]
+    assert stats["batches"] == 3
+    assert stats["dequeued"] == 5
+    assert stats["max_depth"] == 5
+
+
+def test_lag_is_measured_from_the_oldest_item():
+    async def run():
+        queue = BoundedQueue()
+        await queue.put("old")
+        await asyncio.sleep(0.05)
+        await queue.put("new")
+        await queue.get_batch(10)
+        first = queue.stats()
+
+        await queue.put("fresh")
+        await queue.get_batch(10)
+        return first, queue.stats()
+
+    first, second = asyncio.run(run())
+    assert first["lag"] >= 0.05
+    assert second["lag"] < first["lag"]
+    assert second["max_lag"] == first["max_lag"] == first["lag"]
@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import pytest
+import websockets
+from websockets.datastructures import Headers
+from websockets.exceptions import InvalidStatus
+from websockets.http11 import Response
+
+from pipeline import BoundedQueue
+from publisher import TradesPublisher
+
+
+def trade(symbol, price):
+    return json.dumps(
+        {"type": "trade", "data": [{"p": price, "s": symbol, "t": 1000, "v": 1}]}
+    )
+
+
+class FakeWebsocket:
+    """
+    Replays scripted messages for the symbols subscribed to, then waits forever.
+    """
+
+    def __init__(self, scripts):
+        self.scripts = scripts
+        self.messages = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def send(self, message):
+        if self.messages is None:
+            self.messages = self.scripts[json.loads(message)["symbol"]].pop(0)
+
+    async def recv(self):
+        if not self.messages:
+            await asyncio.Event().wait()
+        message = self.messages.pop(0)
+        if isinstance(message, Exception):
+            raise message
+        return message
+
+
+@pytest.fixture
+def publisher(monkeypatch):
+    monkeypatch.setenv("ENSIGN_CLIENT_ID", "client")
+    monkeypatch.setenv("ENSIGN_CLIENT_SECRET", "secret")
+    publisher = TradesPublisher(symbols=["AAPL", "MSFT"], connections=2)
+    publisher.queue = BoundedQueue()
+    return publisher
+
+
+def test_message_to_events_skips_unknown_messages(publisher):
+    assert list(publisher.message_to_events({"type": "ping"})) == []
+    assert list(publisher.message_to_events({"type": "error", "msg": "nope"})) == []
+    assert list(publisher.message_to_events(["not", "a", "message"])) == []
+
+    (event,) = publisher.message_to_events(json.loads(trade("AAPL", 1.5)))
+    assert json.loads(event.data)["price"] == 1.5
+
+
+def test_failing_shard_does_not_stop_the_others(publisher, monkeypatch):
+    rate_limited = InvalidStatus(Response(429, "Too Many Requests", Headers()))
+    dropped = websockets.exceptions.ConnectionClosedError(None, None)
+    scripts = {
+        # The first AAPL connection is refused and the second one is dropped
+        "AAPL": [
+            [b"{not json", '{"type":"error","msg":"bad symbol"}', dropped],
+            [trade("AAPL", 2.0)],
+        ],
+        "MSFT": [[trade("MSFT", 1.0), trade("MSFT", 3.0)]],
+    }
+    connects = []
+
+    def connect(uri):
+        connects.append(uri)
+        if len(connects) == 1:
+            raise rate_limited
+        return FakeWebsocket(scripts)
+
+    sleep = asyncio.sleep
+    monkeypatch.setattr(websockets, "connect", connect)
+    monkeypatch.setattr(asyncio, "sleep", lambda delay: sleep(0))
+
+    async def receive():
+        tasks = [
+            asyncio.create_task(publisher.receive("ws://finnhub", shard))
+            for shard in publisher.shards()
+        ]
+        trades = []
+        while len(trades) < 3:
+            batch = await asyncio.wait_for(publisher.queue.get_batch(10), 5)
+            trades += [json.loads(event.data) for event, _ in batch]
+        assert not any(task.done() for task in tasks)
+        for task in tasks:
+            task.cancel()
+        return trades
+
+    trades = asyncio.run(receive())
+    assert sorted((t["symbol"], t["price"]) for t in trades) == [
+        ("AAPL", 2.0),
+        ("MSFT", 1.0),
+        ("MSFT", 3.0),
+    ]
+    assert len(connects) == 4
@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from checkpoint import save_state
+from subscriber import TradesSubscriber
+
+
+class FakeEnsign:
+    def __init__(self, events=3, topic_events=100):
+        self.events = events
+        self.topic_events = topic_events
+        self.queries = []
+        self.info_calls = 0
+
+    async def topic_id(self, topic):
+        return topic
+
+    async def info(self, topic_ids):
+        self.info_calls += 1
+        return SimpleNamespace(events=self.topic_events)
+
+    async def subscribe(self, *topics, query=""):
+        self.queries.append(query)
+        for i in range(self.events):
+            yield SimpleNamespace(id=i)
+
+
+@pytest.fixture
+def make_subscriber(monkeypatch):
+    monkeypatch.setenv("ENSIGN_CLIENT_ID", "client")
+    monkeypatch.setenv("ENSIGN_CLIENT_SECRET", "secret")
+
+    def make_subscriber(**kwargs):
+        subscriber = TradesSubscriber(latency_interval=None, **kwargs)
+        subscriber.ensign = FakeEnsign()
+        subscriber.offsets = []
+
+        async def run_model_pipeline(event):
+            subscriber.offsets.append(subscriber.offset)
+
+        subscriber.run_model_pipeline = run_model_pipeline
+        return subscriber
+
+    return make_subscriber
+
+
+def test_subscribes_to_live_trades_without_checkpoints(make_subscriber):
+    subscriber = make_subscriber()
+    asyncio.run(subscriber.subscribe())
+    assert subscriber.ensign.queries == [""]
+    assert subscriber.ensign.info_calls == 0
+    assert subscriber.offsets == [None, None, None]
+
+
+def test_counts_offsets_from_the_end_of_the_topic_without_a_checkpoint(
+    make_subscriber, tmp_path
+):
+    subscriber = make_subscriber(checkpoint_dir=str(tmp_path))
+    asyncio.run(subscriber.subscribe())
+    assert subscriber.ensign.queries == [""]
+    assert subscriber.offsets == [101, 102, 103]
+
+
+def test_resumes_from_the_checkpointed_offset(make_subscriber, tmp_path):
+    save_state(str(tmp_path), {"offset": 42, "event_id": "x", "timestamp": 0})
+    subscriber = make_subscriber(checkpoint_dir=str(tmp_path))
+    asyncio.run(subscriber.subscribe())
+    assert subscriber.ensign.queries == ["SELECT * FROM trades OFFSET 42"]
+    assert subscriber.ensign.info_calls == 0
+    assert subscriber.offsets == [43, 44, 45]
@@ -1,9 +1,39 @@
-from datetime import datetime
+import time
+
+from latency import RECORDER
+
+
+def committed_at(ack):
+    """
+    Return the time at which Ensign committed an event, in seconds since the epoch.
+    """
+    return ack.committed.seconds + ack.committed.nanos / 1e9
 
 
 async def handle_ack(ack):
-    ts = datetime.fromtimestamp(ack.committed.seconds + ack.committed.nanos / 1e9)
-    print(f"Event committed at {ts}")
+    # Record how long the ack took to get back to us after the commit
+    RECORDER.record("commit_to_ack", time.time() - committed_at(ack))
+
 
 async def handle_nack(nack):
-    print(f"Could not commit event {nack.id} with error {nack.code}: {nack.error}")
\ No newline at end of file
+    print(f"Could not commit event {nack.id} with error {nack.code}: {nack.error}")
+
+
+def ack_latency(**origins):
+    """
+    Create an ack handler that records the latency from each of the given origin
+    times (in seconds since the epoch) to the commit, e.g.
+
+        on_ack=ack_latency(receive_to_commit=received_at)
+
+    records the time between receiving a trade and Ensign committing it in the
+    "receive_to_commit" histogram.
+    """
+
+    async def handler(ack):
+        committed = committed_at(ack)
+        for stage, origin in origins.items():
+            RECORDER.record(stage, committed - origin)
+        await handle_ack(ack)
+
+    return handler
@@ -0,0 +1,357 @@
+"""
+Codecs encode event payloads to bytes and decode them again. Every codec produces a
+single mimetype, so publishers can switch formats with a single argument while
+subscribers pick the codec for each event from its mimetype.
+
+Every data source keeps its own copy of this module, with the Avro schema of the
+records that it publishes. Run it to compare the payload size and encode/decode
+throughput of each codec on sample flight vectors:
+
+    $ python codec.py
+"""
+
+import io
+import re
+import json
+import time
+import random
+import argparse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import fastavro
+except ImportError:
+    fastavro = None
+
+
+class CodecError(ValueError):
+    """
+    Raised when a payload cannot be encoded or decoded.
+    """
+
+
+def optional_record(name, fields):
+    """
+    Build an Avro record schema from a dict of field name -> Avro type, in which every
+    field is nullable and defaults to null, since the upstream APIs omit fields freely.
+    """
+    return {
+        "type": "record",
+        "name": name,
+        "fields": [
+            {"name": field, "type": ["null", avro_type], "default": None}
+            for field, avro_type in fields.items()
+        ],
+    }
+
+
+# Avro schema of the records published by this data source, by name
+SCHEMAS = {
+    "flight": optional_record(
+        "FlightVector",
+        {
+            "icao24": "string",
+            "callsign": "string",
+            "origin_country": "string",
+            "time_position": "long",
+            "last_contact": "long",
+            "longitude": "double",
+            "latitude": "double",
+            "geo_altitude": "double",
+            "on_ground": "boolean",
+            "velocity": "double",
+            "true_track": "double",
+            "vertical_rate": "double",
+            "sensors": {"type": "array", "items": "int"},
+            "barometric_altitude": "double",
+            "transponder_code": "string",
+            "special_purpose_indicator": "boolean",
+            "position_source": "int",
+            "category": "int",
+            "change": "string",
+        },
+    ),
+}
+
+
+def normalize_mimetype(mimetype):
+    """
+    Normalize a mimetype to a lookup key, so that "application/json",
+    "application/json; charset=utf-8", "ApplicationJSON" and the integer mimetypes of
+    the events received from Ensign all refer to the same codec.
+    """
+    if isinstance(mimetype, int):
+        from pyensign import mimetypes
+
+        mimetype = mimetypes.names_by_value.get(mimetype, str(mimetype))
+    mimetype = str(mimetype).split(";")[0]
+    return re.sub(r"[^a-z0-9]", "", mimetype.lower())
+
+
+class JSONCodec:
+    """
+    JSONCodec encodes payloads with the standard library json module.
+    """
+
+    name = "json"
+    mimetype = "application/json"
+    aliases = ("application/json-utf8",)
+
+    def encode(self, data):
+        return json.dumps(data).encode("utf-8")
+
+    def decode(self, payload):
+        return json.loads(payload)
+
+
+class FastJSONCodec(JSONCodec):
+    """
+    FastJSONCodec produces the same JSON payloads as JSONCodec several times faster
+    using orjson, and also serializes NumPy arrays and scalars.
+    """
+
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise CodecError("the orjson codec requires orjson: pip install orjson")
+
+    def encode(self, data):
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    def decode(self, payload):
+        try:
+            return orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            # orjson is stricter than json, e.g. it rejects the NaN that json emits
+            return json.loads(payload)
+
+
+class MsgPackCodec:
+    """
+    MsgPackCodec encodes payloads as MessagePack, a schemaless binary format that
+    is smaller and faster to parse than JSON.
+    """
+
+    name = "msgpack"
+    mimetype = "application/msgpack"
+    aliases = ("application/x-msgpack",)
+
+    def __init__(self):
+        if msgpack is None:
+            raise CodecError("the msgpack codec requires msgpack: pip install msgpack")
+
+    def encode(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    def decode(self, payload):
+        return msgpack.unpackb(payload, raw=False)
+
+
+class AvroCodec:
+    """
+    AvroCodec encodes payloads as schemaless Avro records. The field names are not
+    included in the payloads, which makes them the smallest of all the codecs, but
+    the publisher and subscriber must agree on the schema.
+    """
+
+    name = "avro"
+    mimetype = "application/avro"
+    aliases = ()
+
+    def __init__(self, schema):
+        """
+        Parameters
+        ----------
+        schema : str or dict
+            The Avro schema of the records, or the name of one of the SCHEMAS.
+        """
+        if fastavro is None:
+            raise CodecError("the avro codec requires fastavro: pip install fastavro")
+        if isinstance(schema, str):
+            schema = SCHEMAS[schema]
+        self.schema = fastavro.parse_schema(schema)
+
+    def encode(self, data):
+        buf = io.BytesIO()
+        fastavro.schemaless_writer(buf, self.schema, data)
+        return buf.getvalue()
+
+    def decode(self, payload):
+        return fastavro.schemaless_reader(io.BytesIO(payload), self.schema)
+
+
+CODECS = {
+    "json": JSONCodec,
+    "orjson": FastJSONCodec,
+    "msgpack": MsgPackCodec,
+    "avro": AvroCodec,
+}
+
+
+class CodecRegistry:
+    """
+    CodecRegistry maps codec names and mimetypes to codecs. Every codec whose
+    dependencies are installed is registered for decoding, and JSON payloads are
+    decoded with orjson when it is available.
+    """
+
+    def __init__(self, schema=None):
+        """
+        Parameters
+        ----------
+        schema : str or dict, default: None
+            The Avro schema of the records, or the name of one of the SCHEMAS. The
+            avro codec is only available if a schema is given.
+        """
+        self.schema = schema
+        self.codecs = {}
+        self.decoders = {}
+        for name in CODECS:
+            try:
+                self.get(name)
+            except CodecError:
+                continue
+
+    def register(self, codec):
+        """
+        Register a codec by its name, and for decoding its mimetype and aliases.
+        """
+        self.codecs[codec.name] = codec
+        for mimetype in (codec.mimetype,) + tuple(codec.aliases):
+            self.decoders[normalize_mimetype(mimetype)] = codec
+        return codec
+
+    def get(self, codec):
+        """
+        Return the codec with the given name, creating it if it isn't registered yet.
+        Codec objects are registered and returned as is.
+        """
+        if not isinstance(codec, str):
+            return self.register(codec)
+
+        if codec not in self.codecs:
+            if codec not in CODECS:
+                raise CodecError(
+                    f"unknown codec {codec!r}, choose one of: {', '.join(CODECS)}"
+                )
+            if codec == "avro":
+                if self.schema is None:
+                    raise CodecError("the avro codec requires a schema")
+                self.register(AvroCodec(self.schema))
+            else:
+                self.register(CODECS[codec]())
+        return self.codecs[codec]
+
+    def decode(self, payload, mimetype):
+        """
+        Decode a payload with the codec registered for its mimetype.
+        """
+        codec = self.decoders.get(normalize_mimetype(mimetype), None)
+        if codec is None:
+            raise CodecError(f"no codec registered for mimetype {mimetype}")
+
+        try:
+            return codec.decode(payload)
+        except Exception as e:
+            raise CodecError(f"could not decode {codec.name} payload: {e}") from e
+
+
+################################################################
+# Benchmark
+################################################################
+
+
+def sample_records(n, seed=42):
+    """
+    Generate `n` sample flight vectors like the ones this data source publishes.
+    """
+    rng = random.Random(seed)
+
+    def maybe(value, p=0.1):
+        return None if rng.random() < p else value
+
+    def record():
+        return {
+            "icao24": f"{rng.randrange(16**6):06x}",
+            "callsign": f"UAL{rng.randrange(10**4)}",
+            "origin_country": "United States",
+            "time_position": maybe(1687886283 + rng.randrange(60)),
+            "last_contact": 1687886283 + rng.randrange(60),
+            "longitude": maybe(rng.uniform(-124, 24)),
+            "latitude": maybe(rng.uniform(-66, 49)),
+            "geo_altitude": maybe(rng.uniform(0, 12000)),
+            "on_ground": rng.random() < 0.1,
+            "velocity": maybe(rng.uniform(0, 300)),
+            "true_track": maybe(rng.uniform(0, 360)),
+            "vertical_rate": maybe(rng.uniform(-20, 20)),
+            "sensors": None,
+            "barometric_altitude": maybe(rng.uniform(0, 12000)),
+            "transponder_code": maybe(f"{rng.randrange(8**4):04o}"),
+            "special_purpose_indicator": False,
+            "position_source": rng.randrange(4),
+            "category": rng.randrange(20),
+        }
+
+    return [record() for _ in range(n)]
+
+
+def benchmark(records, codec, repeat=3):
+    """
+    Return the mean payload size in bytes and the encode and decode throughput in
+    records per second of a codec, taking the best of `repeat` runs.
+    """
+    payloads = [codec.encode(record) for record in records]
+    encode, decode = float("inf"), float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for record in records:
+            codec.encode(record)
+        encode = min(encode, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for payload in payloads:
+            codec.decode(payload)
+        decode = min(decode, time.perf_counter() - started)
+
+    return {
+        "bytes": sum(len(payload) for payload in payloads) / len(payloads),
+        "encode": len(records) / encode,
+        "decode": len(records) / decode,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the event payload codecs")
+    parser.add_argument("-n", "--records", type=int, default=10000)
+    args = parser.parse_args()
+
+    records = sample_records(args.records)
+    registry = CodecRegistry(schema="flight")
+
+    print(f"{'codec':<10}{'bytes':>8}{'encode/s':>14}{'decode/s':>14}")
+    for name in CODECS:
+        try:
+            codec = registry.get(name)
+        except CodecError as e:
+            print(f"{name:<10}  skipped: {e}")
+            continue
+
+        result = benchmark(records, codec)
+        print(
+            f"{name:<10}{result['bytes']:>8.1f}"
+            f"{result['encode']:>14,.0f}{result['decode']:>14,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
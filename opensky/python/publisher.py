@@ -1,4 +1,6 @@
 import json
+import math
+import time
 import asyncio
 from datetime import datetime
 
@@ -8,6 +10,55 @@ from pyensign.events import Event
 from pyensign.ensign import Ensign
 from python_opensky import OpenSky, BoundingBox
 
+from codec import CodecRegistry
+from snapshot import SnapshotCodec
+from statediff import StateCache
+
+# OpenSky charges API credits for every request by the area of its bounding box, as
+# (maximum area in square degrees, credits) tiers
+CREDIT_TIERS = [(25, 1), (100, 2), (400, 3), (math.inf, 4)]
+
+# The number of API credits a registered OpenSky user can spend per day
+DAILY_CREDITS = 4000
+
+
+def request_credits(box):
+    """
+    Return the number of API credits OpenSky charges for a query of a bounding box.
+    """
+    area = (box.max_latitude - box.min_latitude) * (
+        box.max_longitude - box.min_longitude
+    )
+    for max_area, credits in CREDIT_TIERS:
+        if area <= max_area:
+            return credits
+
+
+def split_bounding_box(box, tile_size):
+    """
+    Split a bounding box into a grid of tiles of at most `tile_size` degrees of
+    latitude and longitude. Returns the box itself if tile_size is None.
+    """
+    if tile_size is None:
+        return [box]
+
+    def edges(lo, hi):
+        values = [lo]
+        while values[-1] + tile_size < hi:
+            values.append(values[-1] + tile_size)
+        return list(zip(values, values[1:] + [hi]))
+
+    return [
+        BoundingBox(
+            min_latitude=min_lat,
+            max_latitude=max_lat,
+            min_longitude=min_lon,
+            max_longitude=max_lon,
+        )
+        for min_lat, max_lat in edges(box.min_latitude, box.max_latitude)
+        for min_lon, max_lon in edges(box.min_longitude, box.max_longitude)
+    ]
+
 
 class FlightsPublisher:
     """
@@ -25,6 +76,15 @@ class FlightsPublisher:
         min_longitude=-124,
         max_longitude=24,
         interval=60,
+        codec="json",
+        diff=True,
+        state_cache=None,
+        tile_size=None,
+        concurrency=4,
+        retries=2,
+        backoff=2,
+        snapshot=False,
+        daily_credits=DAILY_CREDITS,
     ):
         """
         Create a FlightsPublisher to publish flight vectors to an Ensign topic. Nothing
@@ -58,6 +118,47 @@ class FlightsPublisher:
 
         interval : int (default: 60)
             The number of seconds to wait between queries to the OpenSky API.
+
+        codec : str (default: "json")
+            The codec to encode flight vectors with: "json", "orjson", "msgpack" or
+            "avro" (see codec.py). Subscribers pick the codec to decode with from the
+            mimetype of each event.
+
+        diff : bool (default: True)
+            If True, only publish the aircraft that are new, have vanished or have
+            changed since they were last published, along with a periodic keyframe
+            of every aircraft. Each vector has a "change" field with the kind of
+            change. If False, every vector of every poll is published.
+
+        state_cache : StateCache (optional)
+            The StateCache to diff the polls with, to customize the change thresholds
+            and the keyframe interval (see statediff.py). Ignored if diff is False.
+
+        tile_size : float (optional)
+            If set, the bounding box is split into tiles of at most this many degrees
+            of latitude and longitude, which are queried concurrently. By default the
+            whole bounding box is queried at once, which uses the fewest API credits.
+
+        concurrency : int (default: 4)
+            The maximum number of tiles to query at the same time.
+
+        retries : int (default: 2)
+            The number of times to retry a failed tile query before giving up on the
+            tile for the current poll.
+
+        backoff : float (default: 2)
+            The number of seconds to wait before the first retry of a tile, doubled
+            for every further retry.
+
+        snapshot : bool (default: False)
+            If True, the vectors of each poll are published as a single compressed
+            columnar event (see snapshot.py) instead of an event per vector. The
+            codec is only used for events per vector.
+
+        daily_credits : int (default: 4000)
+            The number of OpenSky API credits that can be spent per day. A warning
+            is printed if polling every `interval` seconds is estimated to spend
+            more, or set to None to skip the check.
         """
         self.topic = topic
         self.bounding_box = BoundingBox(
@@ -66,7 +167,23 @@ class FlightsPublisher:
             min_longitude=min_longitude,
             max_longitude=max_longitude,
         )
+        self.tiles = split_bounding_box(self.bounding_box, tile_size)
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
         self.interval = interval
+        if daily_credits is not None and self.credits_per_day() > daily_credits:
+            print(
+                f"Warning: polling {len(self.tiles)} tiles every {interval} seconds "
+                f"will spend about {self.credits_per_day():,.0f} OpenSky API credits "
+                f"per day, more than the daily quota of {daily_credits:,}; use "
+                "larger tiles or a longer interval"
+            )
+        self.codec = CodecRegistry(schema="flight").get(codec)
+        self.state_cache = None
+        if diff:
+            self.state_cache = state_cache if state_cache is not None else StateCache()
+        self.snapshot = SnapshotCodec() if snapshot else None
         self.ensign = Ensign(cred_path=ensign_creds)
         with open(opensky_creds) as f:
             self.opensky_creds = json.load(f)
@@ -78,6 +195,14 @@ class FlightsPublisher:
                     "OpenSky credentials must contain both username and password"
                 )
 
+    def credits_per_day(self):
+        """
+        Estimate the number of API credits spent per day by polling every tile every
+        `interval` seconds, not counting retries.
+        """
+        credits = sum(request_credits(tile) for tile in self.tiles)
+        return credits * 86400 / self.interval
+
     def run(self):
         """
         Run the publisher forever.
@@ -109,17 +234,13 @@ class FlightsPublisher:
                 while True:
                     # Call the OpenSky API to get a set of flight vectors in the
                     # bounding box.
-                    try:
-                        response = await opensky.get_states(
-                            bounding_box=self.bounding_box
-                        )
-                    except Exception as e:
-                        print(e)
+                    vectors, complete = await self.get_states(opensky)
+                    if not vectors and not complete:
                         await asyncio.sleep(self.interval)
                         continue
 
                     # Publish each flight vector to Ensign.
-                    for event in self.vectors_to_events(response.states):
+                    for event in self.vectors_to_events(vectors, complete=complete):
                         await self.ensign.publish(
                             self.topic,
                             event,
@@ -129,35 +250,104 @@ class FlightsPublisher:
 
                     await asyncio.sleep(self.interval)
 
-    def vectors_to_events(self, vectors):
+    async def get_states(self, opensky):
+        """
+        Query the flight vectors of every tile of the bounding box concurrently, and
+        merge them into one vector per aircraft. Returns the vectors and whether
+        every tile was queried successfully.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(
+            *[self.get_tile_states(opensky, tile, semaphore) for tile in self.tiles]
+        )
+
+        # Aircraft on the edge of two tiles are returned by both, so keep the vector
+        # with the latest contact for each aircraft
+        latest = {}
+        for states in results:
+            for vector in states or []:
+                current = latest.get(vector.icao24, None)
+                if current is None or (vector.last_contact or 0) > (
+                    current.last_contact or 0
+                ):
+                    latest[vector.icao24] = vector
+
+        failed = sum(states is None for states in results)
+        if failed:
+            print(f"Could not query {failed} of {len(self.tiles)} tiles")
+        return list(latest.values()), failed == 0
+
+    async def get_tile_states(self, opensky, tile, semaphore):
+        """
+        Query the flight vectors in a single tile, retrying with exponential backoff.
+        Returns None if every attempt failed, so a failed tile does not fail the
+        whole poll.
+        """
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                # Back off without holding the semaphore, so other tiles can proceed
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                async with semaphore:
+                    response = await opensky.get_states(bounding_box=tile)
+                return response.states
+            except Exception as e:
+                print(f"Could not query tile {tile} (attempt {attempt + 1}): {e}")
+        return None
+
+    def vectors_to_events(self, vectors, complete=True):
         """
         Convert state vectors to Ensign events. This is a generator function that
-        returns the events one at a time.
-        """
-        for vector in vectors:
-            data = {
-                "icao24": vector.icao24,
-                "callsign": vector.callsign,
-                "origin_country": vector.origin_country,
-                "time_position": vector.time_position,
-                "last_contact": vector.last_contact,
-                "longitude": vector.longitude,
-                "latitude": vector.latitude,
-                "geo_altitude": vector.geo_altitude,
-                "on_ground": vector.on_ground,
-                "velocity": vector.velocity,
-                "true_track": vector.true_track,
-                "vertical_rate": vector.vertical_rate,
-                "sensors": vector.sensors,
-                "barometric_altitude": vector.barometric_altitude,
-                "transponder_code": vector.transponder_code,
-                "special_purpose_indicator": vector.special_purpose_indicator,
-                "position_source": vector.position_source,
-                "category": vector.category,
-            }
-            yield Event(
-                data=json.dumps(data).encode("utf-8"), mimetype="application/json"
+        returns the events one at a time. If a state cache is configured, only the
+        changes since the last published states are converted; aircraft are only
+        counted as missing if the vectors are `complete`. In snapshot mode, a single
+        event with all of the vectors is returned.
+        """
+        records = [self.vector_to_dict(vector) for vector in vectors]
+        if self.state_cache is not None:
+            changes = self.state_cache.diff(records, now=time.time(), complete=complete)
+            print(
+                f"Publishing {len(changes)} changes for {len(records)} flight vectors "
+                f"({len(self.state_cache)} aircraft tracked)"
             )
+            records = [dict(data, change=change) for change, data in changes]
+
+        if self.snapshot is not None:
+            if records:
+                payload = self.snapshot.encode(records)
+                yield Event(data=payload, mimetype=self.snapshot.mimetype)
+            return
+
+        for data in records:
+            yield self.to_event(data)
+
+    def vector_to_dict(self, vector):
+        """
+        Convert a state vector to a dict with the fields to publish.
+        """
+        return {
+            "icao24": vector.icao24,
+            "callsign": vector.callsign,
+            "origin_country": vector.origin_country,
+            "time_position": vector.time_position,
+            "last_contact": vector.last_contact,
+            "longitude": vector.longitude,
+            "latitude": vector.latitude,
+            "geo_altitude": vector.geo_altitude,
+            "on_ground": vector.on_ground,
+            "velocity": vector.velocity,
+            "true_track": vector.true_track,
+            "vertical_rate": vector.vertical_rate,
+            "sensors": vector.sensors,
+            "barometric_altitude": vector.barometric_altitude,
+            "transponder_code": vector.transponder_code,
+            "special_purpose_indicator": vector.special_purpose_indicator,
+            "position_source": vector.position_source,
+            "category": vector.category,
+        }
+
+    def to_event(self, data):
+        return Event(data=self.codec.encode(data), mimetype=self.codec.mimetype)
 
 
 if __name__ == "__main__":
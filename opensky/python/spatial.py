@@ -0,0 +1,192 @@
+import math
+import time
+from collections import OrderedDict, namedtuple
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+HALF_CIRCUMFERENCE_KM = math.pi * EARTH_RADIUS_KM
+
+# The latest position of an aircraft, the time it was last updated in the index and
+# the flight vector it came from
+Aircraft = namedtuple("Aircraft", ["icao24", "latitude", "longitude", "seen", "data"])
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Return the great-circle distance in kilometers between two points.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class SpatialIndex:
+    """
+    SpatialIndex keeps the latest position of every aircraft in a uniform grid of
+    latitude/longitude cells, so that box, radius and nearest neighbour queries only
+    visit the cells around the query instead of the whole fleet. Aircraft are kept in
+    an OrderedDict in the order they were last updated, so the ones that have not
+    been updated for longer than the TTL are evicted from the front in constant time
+    per aircraft.
+    """
+
+    def __init__(self, cell_deg=1.0, ttl=300):
+        """
+        Parameters
+        ----------
+        cell_deg : float (default: 1.0)
+            The size of the grid cells in degrees. Queries are fastest when the cells
+            are about the size of a typical query.
+
+        ttl : float (default: 300)
+            The number of seconds after which aircraft that have not been updated are
+            evicted, or None to keep them until they are removed.
+        """
+        self.cell_deg = cell_deg
+        self.ttl = ttl
+        self.nrows = math.ceil(180 / cell_deg)
+        self.ncols = math.ceil(360 / cell_deg)
+        self.cells = {}
+        self.aircraft = OrderedDict()
+
+    def __len__(self):
+        return len(self.aircraft)
+
+    def __contains__(self, icao24):
+        return icao24 in self.aircraft
+
+    def _cell(self, lat, lon):
+        row = min(max(math.floor((lat + 90) / self.cell_deg), 0), self.nrows - 1)
+        col = math.floor((lon + 180) / self.cell_deg) % self.ncols
+        return row, col
+
+    def update(self, icao24, lat, lon, data=None, now=None):
+        """
+        Add an aircraft or move it to its latest position.
+        """
+        now = time.time() if now is None else now
+        self.remove(icao24)
+
+        cell = self._cell(lat, lon)
+        self.cells.setdefault(cell, set()).add(icao24)
+        self.aircraft[icao24] = (Aircraft(icao24, lat, lon, now, data), cell)
+
+    def remove(self, icao24):
+        """
+        Remove an aircraft from the index, if it is in it.
+        """
+        entry = self.aircraft.pop(icao24, None)
+        if entry is None:
+            return
+
+        cell = entry[1]
+        members = self.cells[cell]
+        members.discard(icao24)
+        if not members:
+            del self.cells[cell]
+
+    def get(self, icao24):
+        entry = self.aircraft.get(icao24, None)
+        return entry[0] if entry is not None else None
+
+    def expire(self, now=None):
+        """
+        Evict the aircraft that have not been updated within the TTL and return the
+        number of aircraft evicted.
+        """
+        if self.ttl is None:
+            return 0
+
+        cutoff = (time.time() if now is None else now) - self.ttl
+        evicted = 0
+        while self.aircraft:
+            icao24, (aircraft, _) = next(iter(self.aircraft.items()))
+            if aircraft.seen >= cutoff:
+                break
+            self.remove(icao24)
+            evicted += 1
+        return evicted
+
+    def _cells_in(self, min_lat, max_lat, min_lon, max_lon):
+        """
+        Yield the aircraft in the cells that overlap a box. The box crosses the
+        antimeridian if min_lon > max_lon.
+        """
+        min_row, _ = self._cell(max(min_lat, -90), 0)
+        max_row, _ = self._cell(min(max_lat, 90), 0)
+
+        _, min_col = self._cell(0, min_lon)
+        _, max_col = self._cell(0, max_lon)
+        span = (max_col - min_col) % self.ncols
+        if max_lon - min_lon >= 360 or (min_lon > max_lon and span == 0):
+            cols = range(self.ncols)
+        else:
+            cols = [(min_col + i) % self.ncols for i in range(span + 1)]
+
+        for row in range(min_row, max_row + 1):
+            for col in cols:
+                for icao24 in self.cells.get((row, col), ()):
+                    yield self.aircraft[icao24][0]
+
+    def bbox(self, min_lat, max_lat, min_lon, max_lon):
+        """
+        Return the aircraft inside a box. The box crosses the antimeridian if min_lon
+        is greater than max_lon, e.g. bbox(50, 70, 170, -170).
+        """
+        crosses = min_lon > max_lon
+        found = []
+        for aircraft in self._cells_in(min_lat, max_lat, min_lon, max_lon):
+            lat, lon = aircraft.latitude, aircraft.longitude
+            if not min_lat <= lat <= max_lat:
+                continue
+            if crosses:
+                if lon < min_lon and lon > max_lon:
+                    continue
+            elif not min_lon <= lon <= max_lon:
+                continue
+            found.append(aircraft)
+        return found
+
+    def radius(self, lat, lon, km):
+        """
+        Return the aircraft within `km` kilometers of a point as a list of
+        (distance in km, aircraft) tuples, nearest first.
+        """
+        dlat = km / KM_PER_DEGREE
+        min_lat, max_lat = lat - dlat, lat + dlat
+        if min_lat <= -90 or max_lat >= 90:
+            # The circle contains a pole, so it covers every longitude
+            min_lon, max_lon = -180, 180
+        else:
+            widest = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+            dlon = min(km / (KM_PER_DEGREE * widest), 180)
+            min_lon = (lon - dlon + 180) % 360 - 180
+            max_lon = (lon + dlon + 180) % 360 - 180
+            if dlon >= 180:
+                min_lon, max_lon = -180, 180
+
+        found = []
+        for aircraft in self._cells_in(min_lat, max_lat, min_lon, max_lon):
+            distance = haversine_km(lat, lon, aircraft.latitude, aircraft.longitude)
+            if distance <= km:
+                found.append((distance, aircraft))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def nearest(self, lat, lon, k=1, max_km=None):
+        """
+        Return the `k` aircraft nearest to a point as a list of (distance in km,
+        aircraft) tuples, nearest first. The search radius starts at the size of a
+        cell and doubles until k aircraft are found, so only the cells around the
+        point are visited where the fleet is dense.
+        """
+        limit = HALF_CIRCUMFERENCE_KM if max_km is None else max_km
+        km = min(self.cell_deg * KM_PER_DEGREE, limit)
+        while True:
+            found = self.radius(lat, lon, km)
+            if len(found) >= k or km >= limit or len(found) == len(self):
+                return found[:k]
+            km = min(km * 2, limit)
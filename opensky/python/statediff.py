@@ -0,0 +1,184 @@
+import math
+import time
+
+EARTH_RADIUS_M = 6371000.0
+
+# The kinds of change, added to each published flight vector as its "change" field
+NEW = "new"
+CHANGED = "changed"
+VANISHED = "vanished"
+KEYFRAME = "keyframe"
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """
+    Return the great-circle distance in meters between two points.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def altitude(state):
+    """
+    Return the geometric altitude of a state, or the barometric altitude if the
+    geometric altitude is not known.
+    """
+    if state.get("geo_altitude", None) is not None:
+        return state["geo_altitude"]
+    return state.get("barometric_altitude", None)
+
+
+class StateCache:
+    """
+    StateCache keeps the last published state vector of every aircraft and diffs each
+    poll against it, so that only new aircraft, aircraft whose position, altitude,
+    velocity or track changed by more than a threshold, and aircraft that vanished
+    are published. Changes are measured from the last published state rather than the
+    last poll, so slow drift is published once it adds up. Every `keyframe_interval`
+    seconds the state of every aircraft is published, so that new subscribers can
+    catch up and missed changes are corrected.
+    """
+
+    def __init__(
+        self,
+        position_m=500.0,
+        altitude_m=100.0,
+        velocity_ms=5.0,
+        track_deg=5.0,
+        vanish_after=2,
+        keyframe_interval=600,
+    ):
+        """
+        Parameters
+        ----------
+        position_m : float (default: 500.0)
+            The distance in meters an aircraft must move to be published.
+
+        altitude_m : float (default: 100.0)
+            The change of altitude in meters for an aircraft to be published.
+
+        velocity_ms : float (default: 5.0)
+            The change of velocity in m/s for an aircraft to be published.
+
+        track_deg : float (default: 5.0)
+            The change of heading in degrees for an aircraft to be published.
+
+        vanish_after : int (default: 2)
+            The number of consecutive polls an aircraft must be missing from before
+            it is published as vanished. OpenSky sometimes drops an aircraft from a
+            single poll, which would otherwise be published as vanished and new again.
+
+        keyframe_interval : float (default: 600)
+            The number of seconds between keyframes of every aircraft, or None to
+            only publish changes.
+        """
+        self.position_m = position_m
+        self.altitude_m = altitude_m
+        self.velocity_ms = velocity_ms
+        self.track_deg = track_deg
+        self.vanish_after = vanish_after
+        self.keyframe_interval = keyframe_interval
+        self.published = {}
+        self.missed = {}
+        self.last_keyframe = None
+
+    def __len__(self):
+        return len(self.published)
+
+    def diff(self, states, now=None, complete=True):
+        """
+        Diff a poll of state vectors against the cache and return the states to
+        publish as a list of (change, state) tuples, updating the cache.
+
+        Parameters
+        ----------
+        states : iterable of dict
+            The state vectors of the poll, with at least an "icao24" field.
+
+        now : float (optional)
+            The time of the poll in seconds since the epoch, to schedule keyframes.
+
+        complete : bool (default: True)
+            Whether the poll covered the whole area. Aircraft are only counted as
+            missing from complete polls, so that a partially failed poll does not
+            make aircraft vanish.
+        """
+        now = time.time() if now is None else now
+        keyframe = self.keyframe_interval is not None and (
+            self.last_keyframe is None
+            or now - self.last_keyframe >= self.keyframe_interval
+        )
+
+        changes = []
+        seen = set()
+        for state in states:
+            icao24 = state["icao24"]
+            seen.add(icao24)
+            self.missed[icao24] = 0
+
+            previous = self.published.get(icao24, None)
+            if previous is None:
+                change = NEW
+            elif keyframe:
+                change = KEYFRAME
+            elif self.changed(previous, state):
+                change = CHANGED
+            else:
+                continue
+
+            self.published[icao24] = state
+            changes.append((change, state))
+
+        if complete:
+            for icao24 in list(self.published):
+                if icao24 in seen:
+                    continue
+                self.missed[icao24] += 1
+                if self.missed[icao24] >= self.vanish_after:
+                    del self.missed[icao24]
+                    changes.append((VANISHED, self.published.pop(icao24)))
+
+        if keyframe:
+            self.last_keyframe = now
+        return changes
+
+    def changed(self, previous, state):
+        """
+        Return True if a state differs from the previously published state of the
+        aircraft by more than any of the thresholds.
+        """
+        if previous.get("on_ground", None) != state.get("on_ground", None):
+            return True
+
+        old = (previous.get("latitude", None), previous.get("longitude", None))
+        new = (state.get("latitude", None), state.get("longitude", None))
+        if (None in old) != (None in new):
+            return True
+        if None not in new and haversine_m(*old, *new) > self.position_m:
+            return True
+
+        if _exceeds(altitude(previous), altitude(state), self.altitude_m):
+            return True
+
+        old, new = previous.get("velocity", None), state.get("velocity", None)
+        if _exceeds(old, new, self.velocity_ms):
+            return True
+
+        old, new = previous.get("true_track", None), state.get("true_track", None)
+        if old is not None and new is not None:
+            # Compare headings the short way around the compass
+            return abs((new - old + 180) % 360 - 180) > self.track_deg
+        return (old is None) != (new is None)
+
+
+def _exceeds(old, new, threshold):
+    """
+    Return True if a value appeared, disappeared or changed by more than a threshold.
+    """
+    if old is None or new is None:
+        return (old is None) != (new is None)
+    return abs(new - old) > threshold
@@ -1,16 +1,34 @@
-import json
 import asyncio
 
+import numpy as np
 from pyensign.ensign import Ensign
 from pyensign.api.v1beta1.ensign_pb2 import Nack
 
+from codec import CodecError, CodecRegistry
+from snapshot import SnapshotCodec
+from spatial import SpatialIndex
+from statediff import VANISHED
+from trajectory import TrajectoryStore
+
 
 class FlightsSubscriber:
     """
-    FlightsSubscriber consumes flight vector events from Ensign.
+    FlightsSubscriber consumes flight vector events from Ensign and keeps a spatial
+    index of the latest position of every aircraft, which can be queried with
+    subscriber.index.bbox(), radius() and nearest(), and the recent trajectory of
+    every aircraft, which can be queried with subscriber.trajectories.last_n(),
+    position_at() and distance_flown().
     """
 
-    def __init__(self, topic="flight-vectors", ensign_creds=""):
+    def __init__(
+        self,
+        topic="flight-vectors",
+        ensign_creds="",
+        cell_deg=1.0,
+        ttl=300,
+        max_aircraft=10000,
+        history=64,
+    ):
         """
         Create a FlightsSubscriber to consume flight vector events from an Ensign
         topic. Nothing will be consumed until run() is called.
@@ -24,8 +42,30 @@ class FlightsSubscriber:
             The path to your Ensign credentials file. If not provided, credentials will
             be read from the ENSIGN_CLIENT_ID and ENSIGN_CLIENT_SECRET environment
             variables.
+
+        cell_deg : float (default: 1.0)
+            The size in degrees of the cells of the spatial index.
+
+        ttl : float (default: 300)
+            The number of seconds after which aircraft without new vectors are evicted
+            from the spatial index and the trajectory store.
+
+        max_aircraft : int (default: 10000)
+            The maximum number of aircraft to keep trajectories for. The least
+            recently updated aircraft are evicted to make room for new ones.
+
+        history : int (default: 64)
+            The number of most recent points to keep in each trajectory. The
+            trajectory store takes 48 bytes per point for every aircraft, so about
+            30 MB with the defaults.
         """
         self.topic = topic
+        self.codecs = CodecRegistry(schema="flight")
+        self.codecs.register(SnapshotCodec())
+        self.index = SpatialIndex(cell_deg=cell_deg, ttl=ttl)
+        self.trajectories = TrajectoryStore(
+            max_aircraft=max_aircraft, capacity=history, ttl=ttl
+        )
         self.ensign = Ensign(cred_path=ensign_creds)
 
     def run(self):
@@ -36,18 +76,106 @@ class FlightsSubscriber:
 
     async def handle_event(self, event):
         """
-        Decode and ack the event back to Ensign.
+        Decode and ack the event back to Ensign. Events are either a single flight
+        vector, or a snapshot with the vectors of a whole poll.
         """
         try:
-            data = json.loads(event.data)
-        except json.JSONDecodeError:
-            print("Received invalid JSON in event payload:", event.data)
+            data = self.codecs.decode(event.data, event.mimetype)
+        except CodecError as e:
+            print(f"Received invalid event payload ({e}):", event.data)
             await event.nack(Nack.Code.UNKNOWN_TYPE)
             return
 
-        print("Received flight vector:", data)
+        if isinstance(data, np.ndarray):
+            self.handle_snapshot(data)
+        else:
+            self.handle_vector(data)
+        self.index.expire()
+        self.trajectories.expire()
         await event.ack()
 
+    def handle_vector(self, data):
+        """
+        Handle a single flight vector dict.
+        """
+        print("Received flight vector:", data)
+
+        icao24 = data.get("icao24", None)
+        lat, lon = data.get("latitude", None), data.get("longitude", None)
+        if data.get("change", None) == VANISHED:
+            self.index.remove(icao24)
+            self.trajectories.evict(icao24)
+        elif lat is not None and lon is not None:
+            self.index.update(icao24, lat, lon, data)
+
+            # Vectors have a time_position when OpenSky has a position update
+            timestamp = data.get("time_position", None)
+            if timestamp is None:
+                timestamp = data.get("last_contact", None)
+            altitude = data.get("geo_altitude", None)
+            if altitude is None:
+                altitude = data.get("barometric_altitude", None)
+            if timestamp is None:
+                return
+            self.trajectories.add(
+                icao24,
+                timestamp,
+                lat,
+                lon,
+                altitude,
+                data.get("velocity", None),
+                data.get("true_track", None),
+            )
+
+    def handle_snapshot(self, snapshot):
+        """
+        Handle a snapshot: a structured array with a row per flight vector and the
+        columns of snapshot.FLIGHT_DTYPE.
+        """
+        airborne = ~snapshot["on_ground"]
+        print(
+            f"Received flight snapshot of {len(snapshot)} vectors "
+            f"({airborne.sum()} airborne, "
+            f"max altitude {np.nanmax(snapshot['geo_altitude'], initial=0):.0f} m)"
+        )
+
+        vanished = snapshot["change"] == VANISHED
+        for row in np.flatnonzero(vanished):
+            icao24 = str(snapshot["icao24"][row])
+            self.index.remove(icao24)
+            self.trajectories.evict(icao24)
+
+        # Only index the vectors with a known position, and only add the ones with a
+        # known time (missing times are packed as -1) to the trajectories
+        located = ~vanished & ~np.isnan(snapshot["latitude"])
+        located &= ~np.isnan(snapshot["longitude"])
+        times = np.where(
+            snapshot["time_position"] >= 0,
+            snapshot["time_position"],
+            snapshot["last_contact"],
+        )
+        altitudes = np.where(
+            np.isnan(snapshot["geo_altitude"]),
+            snapshot["barometric_altitude"],
+            snapshot["geo_altitude"],
+        )
+        for row in np.flatnonzero(located):
+            icao24 = str(snapshot["icao24"][row])
+            lat = float(snapshot["latitude"][row])
+            lon = float(snapshot["longitude"][row])
+            self.index.update(icao24, lat, lon, snapshot[row])
+            if times[row] < 0:
+                continue
+            self.trajectories.add(
+                icao24,
+                times[row],
+                lat,
+                lon,
+                altitudes[row],
+                snapshot["velocity"][row],
+                snapshot["true_track"][row],
+            )
+
     async def subscribe(self):
         """
         Subscribe to the flight vectors topic and parse the events.
@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+from pyensign import mimetypes as mtype
+
+from codec import CodecRegistry
+from snapshot import FLIGHT_DTYPE, SnapshotCodec, decode_snapshot, pack_states
+from subscriber import FlightsSubscriber
+
+STATES = [
+    {
+        "icao24": "abc123",
+        "callsign": "UAL123  ",
+        "origin_country": "United States",
+        "time_position": 1687886283,
+        "last_contact": 1687886284,
+        "longitude": -77.04,
+        "latitude": 38.85,
+        "geo_altitude": 3000.0,
+        "on_ground": False,
+        "velocity": 200.0,
+        "true_track": 90.0,
+        "change": "new",
+    },
+    {
+        "icao24": "def456",
+        "time_position": None,
+        "last_contact": 1687886290,
+        "longitude": -76.5,
+        "latitude": 39.0,
+        "geo_altitude": None,
+        "barometric_altitude": 1200.0,
+        "on_ground": True,
+    },
+    {
+        "icao24": "0a0b0c",
+        "time_position": None,
+        "last_contact": None,
+        "longitude": -75.0,
+        "latitude": 40.0,
+    },
+]
+
+
+def test_pack_states_fills_missing_values():
+    snapshot = pack_states(STATES)
+    assert snapshot.dtype == FLIGHT_DTYPE
+    assert snapshot["callsign"].tolist() == ["UAL123", "", ""]
+    assert snapshot["time_position"].tolist() == [1687886283, -1, -1]
+    assert snapshot["last_contact"].tolist() == [1687886284, 1687886290, -1]
+    assert np.isnan(snapshot["geo_altitude"][1])
+    assert snapshot["on_ground"].tolist() == [False, True, False]
+
+
+def assert_snapshot(snapshot):
+    # structured arrays can't be compared with NaNs, so compare their bytes
+    expected = pack_states(STATES)
+    assert snapshot.dtype == expected.dtype
+    assert snapshot.tobytes() == expected.tobytes()
+
+
+def test_snapshots_round_trip_through_the_registry():
+    codec = SnapshotCodec()
+    payload = codec.encode(STATES)
+    assert_snapshot(decode_snapshot(payload))
+
+    registry = CodecRegistry(schema="flight")
+    registry.register(codec)
+    # events received from Ensign have integer mimetypes
+    for mimetype in (codec.mimetype, mtype.parse(codec.mimetype)):
+        assert_snapshot(registry.decode(payload, mimetype))
+
+
+def test_snapshot_mimetype_is_not_generic_binary():
+    assert mtype.parse(SnapshotCodec.mimetype) != mtype.ApplicationOctetStream
+
+
+@pytest.fixture
+def subscriber(monkeypatch):
+    monkeypatch.setenv("ENSIGN_CLIENT_ID", "client")
+    monkeypatch.setenv("ENSIGN_CLIENT_SECRET", "secret")
+    return FlightsSubscriber()
+
+
+def test_handle_snapshot(subscriber):
+    subscriber.handle_snapshot(pack_states(STATES))
+
+    assert len(subscriber.index) == 3
+    points = subscriber.trajectories.last_n("abc123")
+    assert points[:, 0].tolist() == [1687886283]
+
+    # the last contact stands in for a missing position time
+    points = subscriber.trajectories.last_n("def456")
+    assert points[:, 0].tolist() == [1687886290]
+    assert points[:, 3].tolist() == [1200.0]
+
+    # without either time the aircraft is indexed, but has no trajectory
+    assert "0a0b0c" in subscriber.index
+    assert "0a0b0c" not in subscriber.trajectories
+
+
+def test_handle_snapshot_removes_vanished_aircraft(subscriber):
+    subscriber.handle_snapshot(pack_states(STATES[:1]))
+    assert "abc123" in subscriber.trajectories
+    subscriber.handle_snapshot(pack_states([dict(STATES[0], change="vanished")]))
+    assert "abc123" not in subscriber.index
+    assert "abc123" not in subscriber.trajectories
+
+
+def test_handle_vector_removes_vanished_aircraft(subscriber):
+    subscriber.handle_vector(STATES[0])
+    assert "abc123" in subscriber.trajectories
+    subscriber.handle_vector({"icao24": "abc123", "change": "vanished"})
+    assert "abc123" not in subscriber.index
+    assert "abc123" not in subscriber.trajectories
@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+from spatial import SpatialIndex, haversine_km
+
+
+@pytest.fixture
+def fleet():
+    rng = random.Random(42)
+    index = SpatialIndex(cell_deg=2.0, ttl=None)
+    positions = {}
+    for i in range(2000):
+        icao24 = f"{i:06x}"
+        lat, lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        index.update(icao24, lat, lon, now=0)
+        positions[icao24] = (lat, lon)
+    return index, positions
+
+
+def ids(aircraft):
+    return sorted(item.icao24 for item in aircraft)
+
+
+@pytest.mark.parametrize(
+    "box", [(30, 50, -100, -60), (-10, 10, 170, -170), (80, 90, -180, 180)]
+)
+def test_bbox_matches_brute_force(fleet, box):
+    index, positions = fleet
+    min_lat, max_lat, min_lon, max_lon = box
+    crosses = min_lon > max_lon
+    expected = sorted(
+        icao24
+        for icao24, (lat, lon) in positions.items()
+        if min_lat <= lat <= max_lat
+        and (
+            (lon >= min_lon or lon <= max_lon)
+            if crosses
+            else min_lon <= lon <= max_lon
+        )
+    )
+    assert expected
+    assert ids(index.bbox(*box)) == expected
+
+
+@pytest.mark.parametrize(
+    "lat, lon, km", [(38.9, -77.0, 1500), (0, 179.5, 800), (88, 0, 1000)]
+)
+def test_radius_matches_brute_force(fleet, lat, lon, km):
+    index, positions = fleet
+    expected = sorted(
+        icao24
+        for icao24, position in positions.items()
+        if haversine_km(lat, lon, *position) <= km
+    )
+    found = index.radius(lat, lon, km)
+    assert expected
+    assert ids(aircraft for _, aircraft in found) == expected
+    assert [distance for distance, _ in found] == sorted(d for d, _ in found)
+
+
+def test_nearest_matches_brute_force(fleet):
+    index, positions = fleet
+    distances = sorted(
+        (haversine_km(10, 20, *position), icao24)
+        for icao24, position in positions.items()
+    )
+    found = index.nearest(10, 20, k=5)
+    assert [aircraft.icao24 for _, aircraft in found] == [
+        icao24 for _, icao24 in distances[:5]
+    ]
+    assert index.nearest(10, 20, k=5, max_km=1) == []
+
+
+def test_updates_move_aircraft_between_cells():
+    index = SpatialIndex(cell_deg=1.0, ttl=None)
+    index.update("abc123", 10.5, 10.5, data={"callsign": "UAL1"}, now=0)
+    index.update("abc123", 40.5, 40.5, now=1)
+    assert len(index) == 1
+    assert index.bbox(10, 11, 10, 11) == []
+    assert index.get("abc123").latitude == 40.5
+
+    index.remove("abc123")
+    index.remove("abc123")
+    assert len(index) == 0
+    assert index.cells == {}
+
+
+def test_stale_aircraft_expire():
+    index = SpatialIndex(ttl=60)
+    index.update("a", 0, 0, now=0)
+    index.update("b", 0, 0, now=30)
+    index.update("a", 1, 1, now=50)
+    assert index.expire(now=95) == 1
+    assert "b" not in index and "a" in index
+    assert SpatialIndex(ttl=None).expire() == 0
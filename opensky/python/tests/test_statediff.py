@@ -0,0 +1,115 @@
+import pytest
+
+from statediff import (
+    CHANGED,
+    KEYFRAME,
+    NEW,
+    VANISHED,
+    StateCache,
+    altitude,
+    haversine_m,
+)
+
+
+def state(icao24="abc123", **fields):
+    vector = {
+        "icao24": icao24,
+        "latitude": 38.85,
+        "longitude": -77.04,
+        "geo_altitude": 3000.0,
+        "velocity": 200.0,
+        "true_track": 90.0,
+        "on_ground": False,
+    }
+    vector.update(fields)
+    return vector
+
+
+@pytest.fixture
+def cache():
+    return StateCache(keyframe_interval=600, vanish_after=2)
+
+
+def test_haversine():
+    assert haversine_m(0, 0, 0, 0) == 0
+    # a degree of latitude is about 111 km
+    assert haversine_m(0, 0, 1, 0) == pytest.approx(111195, rel=1e-3)
+    assert haversine_m(0, 179.5, 0, -179.5) == pytest.approx(111195, rel=1e-3)
+
+
+def test_altitude_falls_back_to_barometric():
+    assert altitude({"geo_altitude": 100.0, "barometric_altitude": 90.0}) == 100.0
+    assert altitude({"geo_altitude": None, "barometric_altitude": 90.0}) == 90.0
+    assert altitude({}) is None
+
+
+def test_new_aircraft_are_published(cache):
+    assert cache.diff([state()], now=0) == [(NEW, state())]
+    assert len(cache) == 1
+
+
+def test_small_changes_are_not_published(cache):
+    cache.diff([state()], now=0)
+    small = state(latitude=38.851, geo_altitude=3050.0, velocity=203.0, true_track=93.0)
+    assert cache.diff([small], now=10) == []
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [
+        {"latitude": 38.9},
+        {"geo_altitude": 3200.0},
+        {"velocity": 210.0},
+        {"true_track": 100.0},
+        {"on_ground": True},
+        {"latitude": None, "longitude": None},
+        {"velocity": None},
+    ],
+)
+def test_large_changes_are_published(cache, fields):
+    cache.diff([state()], now=0)
+    assert cache.diff([state(**fields)], now=10) == [(CHANGED, state(**fields))]
+
+
+def test_headings_are_compared_the_short_way_around(cache):
+    cache.diff([state(true_track=358.0)], now=0)
+    assert cache.diff([state(true_track=2.0)], now=10) == []
+
+
+def test_drift_is_measured_from_the_last_published_state(cache):
+    cache.diff([state()], now=0)
+    changes = []
+    for i in range(1, 10):
+        changes += cache.diff([state(geo_altitude=3000.0 + 30 * i)], now=i)
+    # 30 m per poll only adds up to more than 100 m every 4 polls
+    assert [vector["geo_altitude"] for _, vector in changes] == [3120.0, 3240.0]
+
+
+def test_aircraft_vanish_after_consecutive_missed_polls(cache):
+    cache.diff([state("a"), state("b")], now=0)
+    assert cache.diff([state("a")], now=10) == []
+    assert cache.diff([state("a")], now=20, complete=False) == []
+    assert cache.diff([state("a")], now=30) == [(VANISHED, state("b"))]
+    assert len(cache) == 1
+
+
+def test_aircraft_missing_from_a_single_poll_do_not_vanish(cache):
+    cache.diff([state("a"), state("b")], now=0)
+    cache.diff([state("a")], now=10)
+    cache.diff([state("a"), state("b")], now=20)
+    assert cache.diff([state("a")], now=30) == []
+
+
+def test_keyframes_publish_every_aircraft(cache):
+    cache.diff([state("a"), state("b")], now=0)
+    assert cache.diff([state("a"), state("b")], now=300) == []
+    changes = cache.diff([state("a"), state("b"), state("c")], now=600)
+    assert changes == [
+        (KEYFRAME, state("a")),
+        (KEYFRAME, state("b")),
+        (NEW, state("c")),
+    ]
+
+    no_keyframes = StateCache(keyframe_interval=None)
+    no_keyframes.diff([state()], now=0)
+    assert no_keyframes.diff([state()], now=10**6) == []
@@ -0,0 +1,48 @@
+import pytest
+from python_opensky import BoundingBox
+
+from publisher import request_credits, split_bounding_box
+
+
+def box(min_latitude, max_latitude, min_longitude, max_longitude):
+    return BoundingBox(
+        min_latitude=min_latitude,
+        max_latitude=max_latitude,
+        min_longitude=min_longitude,
+        max_longitude=max_longitude,
+    )
+
+
+def test_whole_box_is_queried_without_a_tile_size():
+    whole = box(-66, 49, -124, 24)
+    assert split_bounding_box(whole, None) == [whole]
+
+
+def test_tiles_cover_the_box():
+    tiles = split_bounding_box(box(-66, 49, -124, 24), 30)
+    assert len(tiles) == 4 * 5
+    assert sorted({(t.min_latitude, t.max_latitude) for t in tiles}) == [
+        (-66, -36),
+        (-36, -6),
+        (-6, 24),
+        (24, 49),
+    ]
+    area = sum(
+        (t.max_latitude - t.min_latitude) * (t.max_longitude - t.min_longitude)
+        for t in tiles
+    )
+    assert area == 115 * 148
+
+
+@pytest.mark.parametrize(
+    "size, credits", [(1, 1), (5, 1), (10, 2), (20, 3), (21, 4), (180, 4)]
+)
+def test_request_credits(size, credits):
+    assert request_credits(box(0, size, 0, size)) == credits
+
+
+def test_tiles_cost_more_credits_than_the_whole_box():
+    whole = box(-66, 49, -124, 24)
+    tiles = split_bounding_box(whole, 30)
+    assert request_credits(whole) == 4
+    assert sum(request_credits(tile) for tile in tiles) == 80
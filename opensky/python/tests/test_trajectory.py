@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from trajectory import (
+    ALTITUDE,
+    LATITUDE,
+    TIME,
+    TrajectoryStore,
+    destination,
+    haversine_m,
+)
+
+
+def fly(store, icao24, points, now=0):
+    for timestamp, lat, lon, *rest in points:
+        store.add(icao24, timestamp, lat, lon, *rest, now=now)
+
+
+def test_destination_inverts_haversine():
+    lat, lon = destination(38.85, -77.04, 45.0, 100000)
+    assert haversine_m(38.85, -77.04, lat, lon) == pytest.approx(100000)
+    assert destination(0, 179.9, 90.0, 50000)[1] < -179
+
+
+def test_ring_buffer_keeps_the_latest_points():
+    store = TrajectoryStore(max_aircraft=2, capacity=4)
+    fly(store, "a", [(t, 0.0, t * 0.1) for t in range(10)])
+
+    points = store.last_n("a")
+    assert points[:, TIME].tolist() == [6, 7, 8, 9]
+    assert store.last_n("a", 2)[:, TIME].tolist() == [8, 9]
+    assert store.last_n("missing").shape == (0, 6)
+    assert store.nbytes == store.points.nbytes + 3 * 2 * 8
+
+
+def test_old_points_are_ignored():
+    store = TrajectoryStore(max_aircraft=1, capacity=4)
+    assert store.add("a", 10, 0.0, 0.0)
+    assert not store.add("a", 10, 1.0, 1.0)
+    assert not store.add("a", 5, 1.0, 1.0)
+    assert store.last_n("a")[:, TIME].tolist() == [10]
+
+
+def test_least_recently_updated_aircraft_are_evicted():
+    store = TrajectoryStore(max_aircraft=2, capacity=4, ttl=60)
+    store.add("a", 1, 0.0, 0.0, now=0)
+    store.add("b", 1, 0.0, 0.0, now=10)
+    store.add("a", 2, 0.0, 1.0, now=20)
+    store.add("c", 1, 0.0, 0.0, now=30)
+    assert "b" not in store
+    assert len(store) == 2
+
+    assert store.expire(now=85) == 1
+    assert list(store.slots) == ["c"]
+    # the evicted slot is reused from scratch
+    store.add("d", 1, 5.0, 5.0, now=90)
+    assert store.last_n("d")[:, LATITUDE].tolist() == [5.0]
+    assert store.distance_flown("d") == 0.0
+
+
+def test_position_at_interpolates_and_extrapolates():
+    store = TrajectoryStore(max_aircraft=1, capacity=8)
+    fly(
+        store,
+        "a",
+        [
+            (0, 10.0, 179.0, 1000.0, 100.0, 90.0),
+            (100, 11.0, -179.0, 2000.0, 100.0, 90.0),
+        ],
+    )
+    assert store.position_at("a", -1) is None
+    assert store.position_at("a", 0) == (10.0, 179.0, 1000.0)
+    lat, lon, alt = store.position_at("a", 50)
+    # across the antimeridian, not back around the globe
+    assert (lat, abs(lon), alt) == pytest.approx((10.5, 180.0, 1500.0))
+
+    lat, lon, alt = store.position_at("a", 160)
+    assert haversine_m(11.0, -179.0, lat, lon) == pytest.approx(6000)
+    assert alt == 2000.0
+    assert store.position_at("a", 1000) is None
+
+
+def test_distance_flown():
+    store = TrajectoryStore(max_aircraft=1, capacity=2)
+    fly(store, "a", [(0, 0.0, 0.0), (1, 0.0, 1.0), (2, 0.0, 2.0)])
+    degree = haversine_m(0.0, 0.0, 0.0, 1.0)
+
+    # the total distance includes points that no longer fit in the buffer
+    assert store.distance_flown("a") == pytest.approx(2 * degree)
+    assert store.distance_flown("a", since=1) == pytest.approx(degree)
+    assert store.distance_flown("a", since=2) == 0.0
+    assert store.distance_flown("missing") == 0.0
+
+
+def test_missing_values_are_nan():
+    store = TrajectoryStore(max_aircraft=1, capacity=2)
+    store.add("a", 0, 1.0, 2.0)
+    assert np.isnan(store.last_n("a")[0, ALTITUDE])
+    assert store.position_at("a", 10) is None
@@ -0,0 +1,256 @@
+import math
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+
+# Columns of the trajectory points
+TIME, LATITUDE, LONGITUDE, ALTITUDE, VELOCITY, TRACK = range(6)
+COLUMNS = ("time", "latitude", "longitude", "altitude", "velocity", "true_track")
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """
+    Return the great-circle distance in meters between points, element-wise.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def destination(lat, lon, track, distance):
+    """
+    Return the point reached by travelling `distance` meters from a point along a
+    great circle with the initial heading `track` (in degrees clockwise from north).
+    """
+    lat, lon, track = map(math.radians, (lat, lon, track))
+    delta = distance / EARTH_RADIUS_M
+    lat2 = math.asin(
+        math.sin(lat) * math.cos(delta)
+        + math.cos(lat) * math.sin(delta) * math.cos(track)
+    )
+    lon2 = lon + math.atan2(
+        math.sin(track) * math.sin(delta) * math.cos(lat),
+        math.cos(delta) - math.sin(lat) * math.sin(lat2),
+    )
+    return math.degrees(lat2), (math.degrees(lon2) + 180) % 360 - 180
+
+
+class TrajectoryStore:
+    """
+    TrajectoryStore keeps the recent trajectory of every aircraft in a ring buffer of
+    (time, latitude, longitude, altitude, velocity, track) points. The ring buffers
+    are slots of a single array that is allocated up front, so the memory used is
+    fixed at 48 bytes per point of capacity per aircraft no matter how many aircraft
+    are seen. Free slots are kept on a free list, and when every slot is taken the
+    least recently updated aircraft is evicted to make room.
+    """
+
+    def __init__(self, max_aircraft=10000, capacity=64, ttl=None):
+        """
+        Parameters
+        ----------
+        max_aircraft : int (default: 10000)
+            The maximum number of aircraft to keep trajectories for.
+
+        capacity : int (default: 64)
+            The number of most recent points to keep per aircraft.
+
+        ttl : float (optional)
+            The number of seconds after which the trajectories of aircraft that have
+            not been updated are evicted by expire().
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self.points = np.full((max_aircraft, capacity, len(COLUMNS)), np.nan)
+        self.counts = np.zeros(max_aircraft, dtype=np.int64)
+        self.heads = np.zeros(max_aircraft, dtype=np.int64)
+        self.distances = np.zeros(max_aircraft)
+        self.free = list(range(max_aircraft - 1, -1, -1))
+
+        # icao24 -> (slot, time last updated), least recently updated first
+        self.slots = OrderedDict()
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, icao24):
+        return icao24 in self.slots
+
+    @property
+    def nbytes(self):
+        return (
+            self.points.nbytes
+            + self.counts.nbytes
+            + self.heads.nbytes
+            + self.distances.nbytes
+        )
+
+    def add(
+        self,
+        icao24,
+        timestamp,
+        lat,
+        lon,
+        altitude=None,
+        velocity=None,
+        track=None,
+        now=None,
+    ):
+        """
+        Append a point to the trajectory of an aircraft. Points that are not newer
+        than the last point of the trajectory are ignored. Returns True if the point
+        was added.
+        """
+        now = time.time() if now is None else now
+        if icao24 in self.slots:
+            slot, _ = self.slots.pop(icao24)
+        else:
+            if not self.free:
+                self.evict(next(iter(self.slots)))
+            slot = self.free.pop()
+        self.slots[icao24] = (slot, now)
+
+        count, head = self.counts[slot], self.heads[slot]
+        if count > 0:
+            last = self.points[slot, (head - 1) % self.capacity]
+            if timestamp <= last[TIME]:
+                return False
+            self.distances[slot] += haversine_m(
+                last[LATITUDE], last[LONGITUDE], lat, lon
+            )
+
+        self.points[slot, head] = (
+            timestamp,
+            lat,
+            lon,
+            np.nan if altitude is None else altitude,
+            np.nan if velocity is None else velocity,
+            np.nan if track is None else track,
+        )
+        self.heads[slot] = (head + 1) % self.capacity
+        self.counts[slot] = min(count + 1, self.capacity)
+        return True
+
+    def evict(self, icao24):
+        """
+        Remove the trajectory of an aircraft and return its slot to the free list.
+        """
+        entry = self.slots.pop(icao24, None)
+        if entry is None:
+            return
+
+        slot = entry[0]
+        self.points[slot] = np.nan
+        self.counts[slot] = 0
+        self.heads[slot] = 0
+        self.distances[slot] = 0.0
+        self.free.append(slot)
+
+    def expire(self, now=None):
+        """
+        Evict the trajectories of the aircraft that have not been updated within the
+        TTL and return the number of trajectories evicted.
+        """
+        if self.ttl is None:
+            return 0
+
+        cutoff = (time.time() if now is None else now) - self.ttl
+        evicted = 0
+        while self.slots:
+            icao24, (_, updated) = next(iter(self.slots.items()))
+            if updated >= cutoff:
+                break
+            self.evict(icao24)
+            evicted += 1
+        return evicted
+
+    def last_n(self, icao24, n=None):
+        """
+        Return the last `n` points (or all the points kept) of an aircraft's
+        trajectory as an array with a row per point, oldest first, and the columns
+        TIME, LATITUDE, LONGITUDE, ALTITUDE, VELOCITY and TRACK.
+        """
+        if icao24 not in self.slots:
+            return np.empty((0, len(COLUMNS)))
+
+        slot, _ = self.slots[icao24]
+        count = self.counts[slot]
+        n = count if n is None else min(n, count)
+        rows = (self.heads[slot] - n + np.arange(n)) % self.capacity
+        return self.points[slot, rows]
+
+    def position_at(self, icao24, timestamp, max_extrapolation=300):
+        """
+        Return the estimated (latitude, longitude, altitude) of an aircraft at a
+        time. Times within the trajectory are linearly interpolated between the
+        surrounding points, and times after the last point are dead-reckoned from
+        its velocity and track for up to `max_extrapolation` seconds. Returns None
+        if the position can't be estimated.
+        """
+        points = self.last_n(icao24)
+        if len(points) == 0 or timestamp < points[0, TIME]:
+            return None
+
+        times = points[:, TIME]
+        i = int(np.searchsorted(times, timestamp))
+        if i < len(points):
+            after = points[i]
+            if i == 0 or after[TIME] == timestamp:
+                return (
+                    float(after[LATITUDE]),
+                    float(after[LONGITUDE]),
+                    float(after[ALTITUDE]),
+                )
+
+            before = points[i - 1]
+            frac = (timestamp - before[TIME]) / (after[TIME] - before[TIME])
+            # Interpolate the longitude the short way across the antimeridian
+            dlon = (after[LONGITUDE] - before[LONGITUDE] + 180) % 360 - 180
+            lon = (before[LONGITUDE] + frac * dlon + 180) % 360 - 180
+            lat = before[LATITUDE] + frac * (after[LATITUDE] - before[LATITUDE])
+            alt = before[ALTITUDE] + frac * (after[ALTITUDE] - before[ALTITUDE])
+            return float(lat), float(lon), float(alt)
+
+        last = points[-1]
+        elapsed = timestamp - last[TIME]
+        if max_extrapolation is not None and elapsed > max_extrapolation:
+            return None
+        if np.isnan(last[VELOCITY]) or np.isnan(last[TRACK]):
+            return None
+
+        lat, lon = destination(
+            last[LATITUDE], last[LONGITUDE], last[TRACK], last[VELOCITY] * elapsed
+        )
+        return lat, lon, float(last[ALTITUDE])
+
+    def distance_flown(self, icao24, since=None):
+        """
+        Return the great-circle distance in meters an aircraft has flown. Without
+        `since`, this is the distance since the aircraft was first seen. Otherwise it
+        is the distance between the points kept since the given time.
+        """
+        if icao24 not in self.slots:
+            return 0.0
+
+        if since is None:
+            slot, _ = self.slots[icao24]
+            return float(self.distances[slot])
+
+        points = self.last_n(icao24)
+        points = points[points[:, TIME] >= since]
+        if len(points) < 2:
+            return 0.0
+        return float(
+            haversine_m(
+                points[:-1, LATITUDE],
+                points[:-1, LONGITUDE],
+                points[1:, LATITUDE],
+                points[1:, LONGITUDE],
+            ).sum()
+        )
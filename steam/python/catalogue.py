@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+
+
+class AppCatalogue:
+    """
+    AppCatalogue keeps a local copy of the Steam app list, so that it is not
+    downloaded and parsed again at the start of every sweep. The list is persisted to
+    a file, and the ETag and Last-Modified validators of the response it came from
+    to a small metadata file next to it. The list is only revalidated once it is
+    older than the TTL, with a conditional GET that Steam can answer with a cheap 304
+    Not Modified, after which only the metadata file is rewritten. When the list has
+    changed, refresh() returns the apps that were added and removed, so that the
+    publisher only has to update the apps that changed.
+    """
+
+    def __init__(self, path="steam_apps.json", ttl=86400):
+        """
+        Parameters
+        ----------
+        path : string, default: "steam_apps.json"
+            The file to persist the app list to, so that a restarted publisher can
+            resume publishing without downloading the list again. The metadata is
+            persisted to the same path with a ".meta.json" extension.
+
+        ttl : int, default: 86400
+            The number of seconds before the app list is revalidated.
+        """
+        self.path = path
+        self.meta_path = os.path.splitext(path)[0] + ".meta.json"
+        self.ttl = ttl
+
+        # appid -> name
+        self.apps = {}
+        self.etag = None
+        self.last_modified = None
+        self.digest = None
+        self.fetched_at = None
+        self.load()
+
+    def __len__(self):
+        return len(self.apps)
+
+    def __contains__(self, appid):
+        return appid in self.apps
+
+    def load(self):
+        """
+        Load the persisted app list, if any. Returns True if the list was loaded.
+        """
+        if not os.path.exists(self.path):
+            return False
+
+        try:
+            with open(self.path) as f:
+                apps = json.load(f)
+            meta = {}
+            if os.path.exists(self.meta_path):
+                with open(self.meta_path) as f:
+                    meta = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not load the app list from {self.path}: {e}")
+            return False
+
+        # JSON object keys are strings, but appids are ints
+        self.apps = {int(appid): name for appid, name in apps.items()}
+        self.etag = meta.get("etag", None)
+        self.last_modified = meta.get("last_modified", None)
+        self.digest = meta.get("digest", None)
+        self.fetched_at = meta.get("fetched_at", None)
+        return True
+
+    def save(self):
+        """
+        Atomically persist the app list and then its metadata. The list is several
+        megabytes, so call this in a thread from async code.
+        """
+        _dump(self.apps, self.path)
+        self.save_meta()
+
+    def save_meta(self):
+        """
+        Atomically persist the validators, digest and fetch time of the app list.
+        """
+        meta = {
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "digest": self.digest,
+            "fetched_at": self.fetched_at,
+        }
+        _dump(meta, self.meta_path)
+
+    def stale(self, now=None):
+        """
+        Return True if the app list has never been fetched or is older than the TTL.
+        """
+        if self.fetched_at is None:
+            return True
+        now = time.time() if now is None else now
+        return now - self.fetched_at >= self.ttl
+
+    async def refresh(self, fetcher, url, force=False):
+        """
+        Revalidate the app list if it is stale and return the changes as a tuple of
+        (added, removed), where added maps the appids of the new apps to their names
+        and removed is a list of the appids of the apps that are gone. Renamed apps
+        are counted as added. If the list is fresh, was not modified, or could not
+        be fetched, nothing has changed and the persisted list is kept.
+        """
+        if not force and not self.stale():
+            return {}, []
+
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+
+        result = await fetcher.get(url, headers=headers)
+        if result is None:
+            return {}, []
+
+        status, response_headers, body = result
+        if status == 304:
+            self.fetched_at = time.time()
+            self.save_meta()
+            return {}, []
+
+        if status != 200:
+            print(f"Could not fetch the app list: HTTP {status}")
+            return {}, []
+
+        # Steam doesn't always send validators, so skip parsing identical lists
+        digest = hashlib.sha256(body).hexdigest()
+        if digest != self.digest:
+            try:
+                apps = await asyncio.to_thread(parse_app_list, body)
+            except ValueError as e:
+                print(f"Received an invalid app list: {e}")
+                return {}, []
+
+        self.etag = response_headers.get("ETag", None)
+        self.last_modified = response_headers.get("Last-Modified", None)
+        self.fetched_at = time.time()
+        if digest == self.digest:
+            self.save_meta()
+            return {}, []
+
+        added = {
+            appid: name
+            for appid, name in apps.items()
+            if self.apps.get(appid, None) != name
+        }
+        removed = [appid for appid in self.apps if appid not in apps]
+
+        self.apps = apps
+        self.digest = digest
+        await asyncio.to_thread(self.save)
+        return added, removed
+
+
+def _dump(state, path):
+    """
+    Atomically write a JSON file, so a crash never leaves a partially written file.
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def parse_app_list(body):
+    """
+    Parse a GetAppList response into a dict mapping appids to names. Apps without an
+    appid are skipped.
+    """
+    game_info = json.loads(body)
+    game_list = game_info.get("applist", None)
+    if game_list is None:
+        raise ValueError("missing game list in Steam API response")
+    all_games = game_list.get("apps", None)
+    if all_games is None:
+        raise ValueError("missing app names in Steam API response")
+
+    return {
+        game["appid"]: game.get("name", "")
+        for game in all_games
+        if game.get("appid", None)
+    }
@@ -0,0 +1,179 @@
+import json
+import time
+import asyncio
+
+import aiohttp
+
+# Steam allows 100,000 Web API calls per day per key
+STEAM_DAILY_QUOTA = 100000
+
+# Responses that are worth retrying
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    TokenBucket limits the average rate of requests while allowing short bursts. The
+    bucket holds up to `capacity` tokens and is refilled at `rate` tokens per second;
+    every request takes a token, waiting for one to be refilled if the bucket is
+    empty. Waiters are served in FIFO order.
+    """
+
+    def __init__(self, rate, capacity=1):
+        """
+        Parameters
+        ----------
+        rate : float
+            The number of tokens added per second.
+
+        capacity : float, default: 1
+            The maximum number of tokens in the bucket, i.e. the largest burst.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens=1):
+        """
+        Wait until `tokens` tokens are available and take them.
+        """
+        async with self.lock:
+            self._refill()
+            while self.tokens < tokens:
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= tokens
+
+
+class Fetcher:
+    """
+    Fetcher makes concurrent GET requests over a pooled aiohttp session. The number
+    of requests in flight is capped by a semaphore, the request rate is capped by a
+    token bucket shared by every request, and failed requests are retried with
+    exponential backoff, honoring the Retry-After header of rate limited responses.
+    Use it as an async context manager to open and close the session.
+    """
+
+    def __init__(
+        self,
+        concurrency=16,
+        requests_per_day=STEAM_DAILY_QUOTA,
+        burst=10,
+        retries=3,
+        backoff=1,
+        timeout=30,
+        headers=None,
+    ):
+        """
+        Parameters
+        ----------
+        concurrency : int, default: 16
+            The maximum number of requests in flight.
+
+        requests_per_day : float, default: 100000
+            The maximum average number of requests per day, including retries.
+
+        burst : int, default: 10
+            The number of requests that can be made at once before the rate limit
+            kicks in.
+
+        retries : int, default: 3
+            The number of times to retry a failed request.
+
+        backoff : float, default: 1
+            The number of seconds to wait before the first retry, doubled for every
+            further retry.
+
+        timeout : float, default: 30
+            The number of seconds before a request times out.
+
+        headers : dict, default: None
+            Headers to send with every request.
+        """
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(requests_per_day / 86400, capacity=burst)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.headers = headers
+        self.semaphore = None
+        self.session = None
+
+    async def __aenter__(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers=self.headers,
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    def retry_after(self, response, attempt):
+        """
+        Return the number of seconds to wait before retrying a response.
+        """
+        delay = self.backoff * 2**attempt
+        if response is not None:
+            try:
+                delay = max(delay, float(response.headers.get("Retry-After", 0)))
+            except ValueError:
+                # Retry-After can also be an HTTP date, which isn't worth parsing
+                pass
+        return delay
+
+    async def get(self, url, params=None, headers=None):
+        """
+        GET a URL and return the response status, headers and body, retrying failed
+        requests. Returns None if every attempt failed.
+        """
+        for attempt in range(self.retries + 1):
+            await self.bucket.acquire()
+            response = None
+            try:
+                async with self.semaphore:
+                    async with self.session.get(
+                        url, params=params, headers=headers
+                    ) as response:
+                        if response.status not in RETRY_STATUSES:
+                            body = await response.read()
+                            return response.status, response.headers, body
+                        error = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+
+            if attempt < self.retries:
+                await asyncio.sleep(self.retry_after(response, attempt))
+
+        print(f"Could not fetch {url} after {self.retries + 1} attempts: {error}")
+        return None
+
+    async def get_json(self, url, params=None):
+        """
+        GET a URL and decode its JSON body. Returns None if the request failed.
+        """
+        result = await self.get(url, params=params)
+        if result is None:
+            return None
+
+        status, _, body = result
+        if status != 200:
+            print(f"Could not fetch {url}: HTTP {status}")
+            return None
+        try:
+            if len(body) > 2**20:
+                # Don't block the event loop parsing large responses
+                return await asyncio.to_thread(json.loads, body)
+            return json.loads(body)
+        except ValueError:
+            print(f"Received invalid JSON from {url}")
+            return None
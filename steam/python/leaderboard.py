@@ -0,0 +1,204 @@
+import time
+import heapq
+from bisect import bisect_right
+from collections import OrderedDict, deque
+
+
+class AppEntry:
+    """
+    The latest player count of an app and a bounded history of its player counts.
+    """
+
+    __slots__ = ("name", "players", "updated", "times", "counts")
+
+    def __init__(self, name, max_samples):
+        self.name = name
+        self.players = 0
+        self.updated = None
+
+        # The timestamps and player counts of the samples, oldest first
+        self.times = deque(maxlen=max_samples)
+        self.counts = deque(maxlen=max_samples)
+
+    def sample(self, timestamp, players, resolution):
+        """
+        Record the latest player count. The history always ends with the latest
+        count, which replaces the last sample until that sample is `resolution`
+        seconds after the one before it.
+        """
+        times, counts = self.times, self.counts
+        if len(times) > 1 and times[-1] - times[-2] < resolution:
+            times[-1], counts[-1] = timestamp, players
+        else:
+            times.append(timestamp)
+            counts.append(players)
+
+
+class Leaderboard:
+    """
+    Leaderboard keeps the top games by concurrent players and by growth in players
+    over sliding windows. The latest player count of every game is kept in an index
+    keyed by appid, along with a history of its player counts sampled at most every
+    `resolution` seconds, which is enough to measure growth over the longest window.
+    The top games are selected from the index with a heap of size k, and the
+    baseline that the growth of each game is measured from is found by a binary
+    search over its samples, so a snapshot takes O(n log k) time plus a search per
+    game and window.
+
+    Memory is bounded by the number of games tracked and the number of samples kept
+    per game. Games without players are not tracked until they have some, but the
+    first and last time they were seen without players are remembered, so that once
+    they have players their growth is measured from 0. The least recently updated
+    games are evicted when there are more than `max_apps` tracked games or
+    `max_idle` games without players.
+    """
+
+    def __init__(
+        self,
+        k=10,
+        windows=(3600, 86400),
+        resolution=300,
+        max_apps=20000,
+        max_idle=200000,
+    ):
+        """
+        Parameters
+        ----------
+        k : int, default: 10
+            The number of games on each leaderboard.
+
+        windows : tuple of int, default: (3600, 86400)
+            The lengths in seconds of the sliding windows to measure growth over.
+
+        resolution : int, default: 300
+            The minimum number of seconds between the samples kept per game. Growth
+            is measured from the latest sample at least a window old, so it is at
+            most this many seconds off.
+
+        max_apps : int, default: 20000
+            The maximum number of games to track.
+
+        max_idle : int, default: 200000
+            The maximum number of games without players to remember, which takes
+            about 300 bytes per game.
+        """
+        self.k = k
+        self.windows = tuple(sorted(windows))
+        self.resolution = resolution
+        self.max_apps = max_apps
+        self.max_idle = max_idle
+        self.max_samples = int(self.windows[-1] // resolution) + 2
+
+        # appid -> AppEntry, least recently updated first
+        self.apps = OrderedDict()
+
+        # appid -> (first, last) times that untracked games were seen without
+        # players, least recently updated first
+        self.idle = OrderedDict()
+
+    def __len__(self):
+        return len(self.apps)
+
+    def __contains__(self, appid):
+        return appid in self.apps
+
+    def update(self, appid, name, players, now=None):
+        """
+        Record the latest player count of a game.
+        """
+        now = time.time() if now is None else now
+        entry = self.apps.get(appid, None)
+        if entry is None:
+            if not players:
+                self._update_idle(appid, now)
+                return
+            if len(self.apps) >= self.max_apps:
+                self.apps.popitem(last=False)
+            entry = AppEntry(name, self.max_samples)
+            self.apps[appid] = entry
+
+            # Measure the growth of games that had no players from 0
+            idle = self.idle.pop(appid, None)
+            if idle is not None:
+                for timestamp in sorted(set(idle)):
+                    entry.sample(timestamp, 0, self.resolution)
+        else:
+            self.apps.move_to_end(appid)
+
+        entry.name = name
+        entry.players = players
+        entry.updated = now
+        entry.sample(now, players, self.resolution)
+
+    def _update_idle(self, appid, now):
+        first, _ = self.idle.pop(appid, (now, None))
+        if len(self.idle) >= self.max_idle:
+            self.idle.popitem(last=False)
+        self.idle[appid] = (first, now)
+
+    def growth(self, appid, window, now=None):
+        """
+        Return the change in the player count of a game over a window, or None if
+        the game hasn't been tracked for long enough.
+        """
+        entry = self.apps.get(appid, None)
+        if entry is None:
+            return None
+
+        # The baseline is the latest sample that is at least a window old
+        cutoff = (time.time() if now is None else now) - window
+        i = bisect_right(entry.times, cutoff)
+        if i == 0:
+            return None
+        return entry.players - entry.counts[i - 1]
+
+    def top_players(self, k=None):
+        """
+        Return the k games with the most concurrent players as a list of dicts,
+        most players first.
+        """
+        top = heapq.nlargest(
+            k or self.k, self.apps.items(), key=lambda item: item[1].players
+        )
+        return [
+            {"id": appid, "game": entry.name, "count": entry.players}
+            for appid, entry in top
+        ]
+
+    def top_growth(self, window, k=None, now=None):
+        """
+        Return the k games whose player count grew the most over a window as a list
+        of dicts, most growth first.
+        """
+        now = time.time() if now is None else now
+        growth = []
+        for appid in self.apps:
+            change = self.growth(appid, window, now)
+            if change is not None:
+                growth.append((change, appid))
+
+        top = heapq.nlargest(k or self.k, growth, key=lambda item: item[0])
+        return [
+            {
+                "id": appid,
+                "game": self.apps[appid].name,
+                "count": self.apps[appid].players,
+                "growth": change,
+            }
+            for change, appid in top
+        ]
+
+    def snapshot(self, now=None):
+        """
+        Return the leaderboards as a dict that can be published as an event.
+        """
+        now = time.time() if now is None else now
+        return {
+            "timestamp": now,
+            "games": len(self.apps),
+            "players": self.top_players(),
+            "growth": {
+                str(window): self.top_growth(window, now=now)
+                for window in self.windows
+            },
+        }
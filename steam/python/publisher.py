@@ -1,13 +1,16 @@
 import os
-import json
 import asyncio
 import warnings
 
-import requests
 from datetime import datetime
 from pyensign.events import Event
 from pyensign.ensign import Ensign
 
+from codec import CodecRegistry
+from catalogue import AppCatalogue
+from scheduler import PollScheduler, load_state, save_state
+from fetch import Fetcher, STEAM_DAILY_QUOTA
+
 # TODO Python>3.10 needs to ignore DeprecationWarning: There is no current event loop
 warnings.filterwarnings("ignore")
 
@@ -22,7 +25,7 @@ class SteamPublisher:
     SteamPublisher queries the steam API and publishes events to Ensign.
     """
 
-    def __init__(self, topic="steam-stats-json", interval=900, steam_key=None, game_list_endpoint=GAME_LIST_ENDPOINT, base_uri=PLAYER_QUERY, ensign_creds=""):
+    def __init__(self, topic="steam-stats-json", min_interval=60, max_interval=86400, steam_key=None, game_list_endpoint=GAME_LIST_ENDPOINT, base_uri=PLAYER_QUERY, ensign_creds="", codec="json", concurrency=16, requests_per_day=STEAM_DAILY_QUOTA, retries=3, catalogue_path="steam_apps.json", catalogue_ttl=86400, schedule_path="steam_schedule.json"):
         """
         Parameters
         ----------
@@ -35,12 +38,54 @@ class SteamPublisher:
             You can put your API key for the Steam Developer API here. If you leave it
             blank, the publisher will attempt to read it from your environment variables
 
-        interval : int, default: 900
-            The number of seconds to wait between API calls so we don't irritate the
-            nice people at Steam.
+        min_interval : int, default: 60
+            The shortest number of seconds between polls of a game. The most popular
+            games, and games whose player count changes a lot, are polled this often.
+
+        max_interval : int, default: 86400
+            The longest number of seconds between polls of a game. Games without
+            players are polled this rarely, so we don't irritate the nice people at
+            Steam.
+
+        codec : string, default: "json"
+            The codec to encode events with: "json", "orjson", "msgpack" or "avro"
+            (see codec.py). Subscribers pick the codec to decode with from the
+            mimetype of each event.
+
+        concurrency : int, default: 16
+            The maximum number of requests to the Steam API in flight at once.
+
+        requests_per_day : int, default: 100000
+            The maximum average number of requests to make to the Steam API per day,
+            which is Steam's daily quota by default. If polling every game at its
+            interval would take more requests, every interval is stretched by the
+            same factor to fit.
+
+        retries : int, default: 3
+            The number of times to retry a request that failed or was rate limited
+            before skipping the game until its next poll.
+
+        catalogue_path : string, default: "steam_apps.json"
+            The file to persist the list of Steam games to, so that a restarted
+            publisher resumes publishing without downloading the list again.
+
+        catalogue_ttl : int, default: 86400
+            The number of seconds before the list of Steam games is revalidated.
+
+        schedule_path : string, default: "steam_schedule.json"
+            The file to save the player counts learned by the polling schedule to,
+            so that a restarted publisher polls the most popular games first.
         """
         self.topic = topic
-        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.codec = CodecRegistry(schema="steam").get(codec)
+        self.concurrency = concurrency
+        self.requests_per_day = requests_per_day
+        self.retries = retries
+        self.catalogue = AppCatalogue(path=catalogue_path, ttl=catalogue_ttl)
+        self.schedule_path = schedule_path
+        self.scheduler = None
 
         if steam_key is None:
             self.steam_key = os.getenv("STEAM_API_KEY")
@@ -91,71 +136,118 @@ class SteamPublisher:
         """
         return self.base_uri + str(game)
 
-    def get_game_list(self):
+    async def refresh_game_list(self, fetcher):
+        """
+        Revalidate the cached game list if it is stale, and add the new games to the
+        schedule and remove the games that are gone from it.
+
+        Returns a tuple of (added, removed), where added maps the appids of the new
+        games to their names and removed is a list of the appids of the games that
+        are gone.
+        """
+        added, removed = await self.catalogue.refresh(
+            fetcher, self.game_list_endpoint
+        )
+        if added or removed:
+            print(f"Game list updated: {len(added)} added, {len(removed)} removed")
+
+        for appid in added:
+            self.scheduler.add(appid)
+        for appid in removed:
+            self.scheduler.remove(appid)
+        return added, removed
+
+    async def save_schedule(self):
+        """
+        Save the player counts learned by the polling schedule. The state is taken
+        on the event loop, so it is consistent, and written in a thread.
         """
-        Wrapper for an intermediate call to get the latest game list
+        state = self.scheduler.state()
+        await asyncio.to_thread(save_state, state, self.schedule_path)
 
-        Returns a list of dictionaries of the form:
-            {
-              "name": "name_of_game",
-              "appid": "steam_identifier
-            }
+    async def refresh_periodically(self, fetcher):
         """
-        game_info = requests.get(self.game_list_endpoint).json()
-        game_list = game_info.get("applist", None)
-        if game_list is None:
-            raise Exception("missing game list in Steam API response")
-        all_games = game_list.get("apps", None)
-        if all_games is None:
-            raise Exception("missing app names in Steam API response")
+        Keep the game list up to date and save the polling schedule. The list is
+        only downloaded again when it is older than its TTL, so checking it often is
+        cheap.
+        """
+        while True:
+            await self.refresh_game_list(fetcher)
+            await asyncio.sleep(min(self.catalogue.ttl, 3600))
+            await self.save_schedule()
 
-        return all_games
+    async def poll_and_publish(self, fetcher):
+        """
+        Poll the player count of each game when the scheduler says it is due,
+        publish it, and let the scheduler adapt how often the game is polled.
+        """
+        while True:
+            game_id = await self.scheduler.wait()
+            response = await fetcher.get_json(self.format_query(game_id))
+            if response is None or "response" not in response:
+                self.scheduler.update(game_id)
+                continue
+
+            players = response["response"].get("player_count", 0)
+            self.scheduler.update(game_id, players)
+
+            # Convert the response to an event and publish it
+            game_name = self.catalogue.apps.get(game_id, None)
+            event = self.create_event(response, game_id, game_name)
+            await self.ensign.publish(
+                self.topic,
+                event,
+                on_ack=self.print_ack,
+                on_nack=self.print_nack
+            )
 
     def create_event(self, response, game_id, game_name):
-        if game_name == "":
+        if not game_name:
             game_name = "N/A"
         data = {
             "game": game_name,
             "id": game_id,
-            "count": response["response"]["result"]
+            "count": response["response"].get("player_count", 0)
         }
 
-        return Event(json.dumps(data).encode("utf-8"), mimetype="application/json")
+        return Event(self.codec.encode(data), mimetype=self.codec.mimetype)
 
     async def recv_and_publish(self):
         """
-        At some interval (`self.interval`), ping the API to get any newly updated
-        events from the last interval period
-
-        Publish report data to the `self.topic`
+        Ping the API for the player count of each game as often as the scheduler
+        allows, and publish report data to the `self.topic`
         """
         await self.ensign.ensure_topic_exists(self.topic)
 
-        while True:
-            all_games = self.get_game_list()
-
-            # Retrieve the player count for the current game/appid
-            for game in all_games:
-                game_name = game.get("name", None)
-                game_id = game.get("appid", None)
-                # TODO: does it make sense to just skip them if they don't have an ID?
-                if game_id is None:
-                    continue
-
-                request = self.format_query(game_id)
-                response = requests.get(request).json()
-
-                # Convert the response to an event and publish it
-                event = self.create_event(response, game_id, game_name)
-                await self.ensign.publish(
-                    self.topic,
-                    event,
-                    on_ack=self.print_ack,
-                    on_nack=self.print_nack
-                )
-
-            # sleep for a bit before we ping the API again
-            await asyncio.sleep(self.interval)
+        # The fetcher shares one connection pool and one rate limit across every
+        # request, so the player counts are fetched concurrently without exceeding
+        # Steam's quota
+        async with Fetcher(
+            concurrency=self.concurrency,
+            requests_per_day=self.requests_per_day,
+            retries=self.retries,
+        ) as fetcher:
+            # The scheduler spends the same request budget as the fetcher
+            self.scheduler = PollScheduler(
+                fetcher.bucket.rate,
+                min_interval=self.min_interval,
+                max_interval=self.max_interval,
+            )
+
+            # Resume from the cached game list and the saved schedule, and revalidate
+            # the list in the background so that publishing only waits for the list
+            # when there is no cached copy
+            state = await asyncio.to_thread(load_state, self.schedule_path)
+            self.scheduler.restore(state)
+            for game_id in self.catalogue.apps:
+                self.scheduler.add(game_id)
+            if len(self.catalogue) == 0:
+                await self.refresh_game_list(fetcher)
+
+            await asyncio.gather(
+                self.refresh_periodically(fetcher),
+                *(self.poll_and_publish(fetcher) for _ in range(self.concurrency)),
+            )
 
     def run(self):
         """
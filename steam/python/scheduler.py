@@ -0,0 +1,271 @@
+import os
+import json
+import math
+import time
+import heapq
+import random
+import asyncio
+
+
+class AppStats:
+    """
+    The smoothed player count of an app and when it is next due to be polled.
+    """
+
+    __slots__ = ("mean", "var", "samples", "rate", "due")
+
+    def __init__(self, due):
+        self.mean = 0.0
+        self.var = 0.0
+        self.samples = 0
+        self.rate = 0.0
+        self.due = due
+
+
+class PollScheduler:
+    """
+    PollScheduler decides when to poll the player count of each Steam app. Apps are
+    kept in a heap keyed by the time they are next due, so the next app to poll is
+    found in O(log n) time no matter how many apps there are. After every poll, the
+    polling interval of the app is adapted to an exponentially weighted moving
+    average of its player count and of the variance of its player count: apps with
+    many players, or whose player count changes a lot, are polled as often as every
+    `min_interval` seconds, and apps without players as rarely as every
+    `max_interval` seconds. If polling every app at its interval would exceed the
+    request budget, every interval is stretched by the same factor so that the
+    polls fit the budget. The learned player counts can be saved with state() and
+    restored with restore(), so that a restarted scheduler polls the apps that are
+    known to be popular first.
+    """
+
+    def __init__(
+        self,
+        budget,
+        min_interval=60,
+        max_interval=86400,
+        alpha=0.3,
+        volatility=1.0,
+    ):
+        """
+        Parameters
+        ----------
+        budget : float
+            The number of polls per second that can be made, e.g. the rate of the
+            fetcher's token bucket.
+
+        min_interval : float, default: 60
+            The shortest number of seconds between polls of an app.
+
+        max_interval : float, default: 86400
+            The longest number of seconds between polls of an app.
+
+        alpha : float, default: 0.3
+            The weight of the latest player count in the moving averages. Higher
+            values adapt faster to changes in popularity.
+
+        volatility : float, default: 1.0
+            The number of standard deviations of the player count to add to its
+            average, so that apps whose player count changes a lot are polled more
+            often than apps with a steady player count.
+        """
+        self.budget = budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.alpha = alpha
+        self.volatility = volatility
+
+        # appid -> AppStats
+        self.apps = {}
+
+        # (due, seq, appid); entries whose due time no longer matches the app's are
+        # stale and are skipped when popped
+        self.heap = []
+        self.seq = 0
+
+        # The number of polls per second wanted by all the apps
+        self.demand = 0.0
+
+        # appid -> (mean, var, samples) restored for apps that are not added yet
+        self.known = {}
+
+    def __len__(self):
+        return len(self.apps)
+
+    def __contains__(self, appid):
+        return appid in self.apps
+
+    def _push(self, appid, due):
+        self.apps[appid].due = due
+        self.seq += 1
+        heapq.heappush(self.heap, (due, self.seq, appid))
+
+    def _set_rate(self, stats, rate):
+        self.demand += rate - stats.rate
+        stats.rate = rate
+
+    def add(self, appid, now=None):
+        """
+        Add an app to the schedule. Apps with restored player counts are polled at
+        the interval learned for them, and new apps at the longest interval. The
+        first poll of an app is due at a random time within its interval, so that
+        adding every app at startup spreads the polls out rather than making every
+        app due at once, and apps known to be popular are polled first.
+        """
+        if appid in self.apps:
+            return
+
+        now = time.time() if now is None else now
+        stats = AppStats(now)
+        known = self.known.pop(appid, None)
+        if known is not None:
+            stats.mean, stats.var, stats.samples = known
+        self.apps[appid] = stats
+
+        interval = self.target_interval(stats)
+        self._set_rate(stats, 1 / interval)
+        self._push(appid, now + random.uniform(0, interval))
+
+    def remove(self, appid):
+        """
+        Remove an app from the schedule, if it is in it.
+        """
+        stats = self.apps.pop(appid, None)
+        if stats is not None:
+            self._set_rate(stats, 0.0)
+
+    def state(self):
+        """
+        Return the learned player counts of the apps that have been polled, as a
+        dict mapping appids to (mean, var, samples) that can be saved as JSON.
+        """
+        return {
+            appid: (stats.mean, stats.var, stats.samples)
+            for appid, stats in self.apps.items()
+            if stats.samples > 0
+        }
+
+    def restore(self, state):
+        """
+        Restore the learned player counts returned by state(). Apps that are already
+        scheduled are not affected; the counts are used when the apps are added.
+        """
+        for appid, (mean, var, samples) in state.items():
+            # JSON object keys are strings, but appids are ints
+            self.known[int(appid)] = (float(mean), float(var), int(samples))
+
+    def stretch(self):
+        """
+        Return the factor every interval is multiplied by to fit the budget.
+        """
+        if self.demand <= self.budget:
+            return 1.0
+        return self.demand / self.budget
+
+    def target_interval(self, stats):
+        """
+        Return the number of seconds between polls that an app would like, before
+        it is stretched to fit the budget. The interval is inversely proportional to
+        the average player count plus its volatility, so an app with a single
+        player is polled twice as often as an app without players.
+        """
+        players = stats.mean + self.volatility * math.sqrt(stats.var)
+        interval = self.max_interval / (1 + players)
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def interval(self, appid):
+        """
+        Return the current number of seconds between polls of an app.
+        """
+        return self.target_interval(self.apps[appid]) * self.stretch()
+
+    def update(self, appid, players=None, now=None):
+        """
+        Record the player count of a poll of an app, or None if the poll failed,
+        and schedule its next poll. Apps that were removed while they were being
+        polled are ignored.
+        """
+        stats = self.apps.get(appid, None)
+        if stats is None:
+            return
+
+        now = time.time() if now is None else now
+        if players is not None:
+            if stats.samples == 0:
+                stats.mean = float(players)
+            else:
+                delta = players - stats.mean
+                stats.mean += self.alpha * delta
+                stats.var = (1 - self.alpha) * (stats.var + self.alpha * delta**2)
+            stats.samples += 1
+
+        interval = self.target_interval(stats)
+        self._set_rate(stats, 1 / interval)
+        self._push(appid, now + interval * self.stretch())
+
+    def next_due(self):
+        """
+        Return the time the next app is due, or None if there are no apps.
+        """
+        while self.heap:
+            due, _, appid = self.heap[0]
+            stats = self.apps.get(appid, None)
+            if stats is not None and stats.due == due:
+                return due
+            heapq.heappop(self.heap)
+        return None
+
+    def pop_due(self, now=None):
+        """
+        Take the app that is most overdue off the schedule and return its appid, or
+        None if no app is due. The app is not polled again until update() is called
+        with the result of its poll.
+        """
+        now = time.time() if now is None else now
+        due = self.next_due()
+        if due is None or due > now:
+            return None
+
+        _, _, appid = heapq.heappop(self.heap)
+        self.apps[appid].due = None
+        return appid
+
+    async def wait(self, max_wait=1.0):
+        """
+        Wait for the next app to be due and take it off the schedule. The schedule
+        is checked at least every `max_wait` seconds, so apps that are added while
+        waiting are not missed.
+        """
+        while True:
+            now = time.time()
+            appid = self.pop_due(now)
+            if appid is not None:
+                return appid
+
+            due = self.next_due()
+            delay = max_wait if due is None else min(due - now, max_wait)
+            await asyncio.sleep(max(delay, 0))
+
+
+def load_state(path):
+    """
+    Load the scheduler state saved to a file, or an empty state if there is none.
+    """
+    if not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not load the polling schedule from {path}: {e}")
+        return {}
+
+
+def save_state(state, path):
+    """
+    Atomically save the scheduler state to a file.
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
@@ -1,10 +1,13 @@
-import json
 import asyncio
 import warnings
 
+from pyensign.events import Event
 from pyensign.ensign import Ensign
 from pyensign.api.v1beta1.ensign_pb2 import Nack
 
+from codec import CodecError, CodecRegistry
+from leaderboard import Leaderboard
+
 
 # TODO Python>3.10 needs to ignore DeprecationWarning: There is no current event loop
 warnings.filterwarnings("ignore")
@@ -14,7 +17,16 @@ class SteamSubscriber:
     SteamSubscriber queries the SteamPublisher for events.
     """
 
-    def __init__(self, topic="steam-stats-json", ensign_creds=""):
+    def __init__(
+        self,
+        topic="steam-stats-json",
+        ensign_creds="",
+        leaderboard_topic="steam-leaderboard-json",
+        leaderboard_interval=60,
+        top_k=10,
+        windows=(3600, 86400),
+        codec="json",
+    ):
         """
         Parameters
         ----------
@@ -22,9 +34,32 @@ class SteamSubscriber:
             The name of the topic you wish to publish to. If the topic doesn't yet
             exist, Ensign will create it for you. Tips on topic naming conventions can
             be found at https://ensign.rotational.dev/getting-started/topics/
+
+        leaderboard_topic : string, default: "steam-leaderboard-json"
+            The name of the topic to publish leaderboard snapshots to, or None to
+            not publish them. Ensign will create it if it doesn't yet exist.
+
+        leaderboard_interval : int, default: 60
+            The number of seconds between leaderboard snapshots.
+
+        top_k : int, default: 10
+            The number of games on each leaderboard.
+
+        windows : tuple of int, default: (3600, 86400)
+            The lengths in seconds of the sliding windows to rank the growth in
+            players over.
+
+        codec : string, default: "json"
+            The codec to encode leaderboard snapshots with: "json", "orjson" or
+            "msgpack" (see codec.py).
         """
         self.topic = topic
+        self.codecs = CodecRegistry(schema="steam")
         self.ensign = Ensign(cred_path=ensign_creds)
+        self.leaderboard_topic = leaderboard_topic
+        self.leaderboard_interval = leaderboard_interval
+        self.leaderboard = Leaderboard(k=top_k, windows=windows)
+        self.codec = CodecRegistry().get(codec)
 
     def run(self):
         """
@@ -37,22 +72,49 @@ class SteamSubscriber:
         Decode and ack the event.
         """
         try:
-            data = json.loads(event.data)
-        except json.JSONDecodeError:
-            print("Received invalid JSON in event payload:", event.data)
+            data = self.codecs.decode(event.data, event.mimetype)
+        except CodecError as e:
+            print(f"Received invalid event payload ({e}):", event.data)
             await event.nack(Nack.Code.UNKNOWN_TYPE)
             return
 
         print("New steam report received:", data)
+        self.leaderboard.update(data["id"], data["game"], data["count"])
         await event.ack()
 
+    async def print_nack(self, nack):
+        print(f"Leaderboard was not committed with error {nack.code}: {nack.error}")
+
+    async def publish_leaderboard(self):
+        """
+        Publish a snapshot of the leaderboards every `leaderboard_interval` seconds,
+        so dashboards can read a small summary instead of the full stream.
+        """
+        while True:
+            await asyncio.sleep(self.leaderboard_interval)
+            snapshot = self.leaderboard.snapshot()
+            event = Event(self.codec.encode(snapshot), mimetype=self.codec.mimetype)
+            await self.ensign.publish(
+                self.leaderboard_topic, event, on_nack=self.print_nack
+            )
+
     async def subscribe(self):
         """
         Subscribe to SteamPublisher events from Ensign
         """
         id = await self.ensign.topic_id(self.topic)
-        async for event in self.ensign.subscribe(id):
-            await self.handle_event(event)
+
+        task = None
+        if self.leaderboard_topic is not None:
+            await self.ensign.ensure_topic_exists(self.leaderboard_topic)
+            task = asyncio.create_task(self.publish_leaderboard())
+
+        try:
+            async for event in self.ensign.subscribe(id):
+                await self.handle_event(event)
+        finally:
+            if task is not None:
+                task.cancel()
 
 
 if __name__ == "__main__":
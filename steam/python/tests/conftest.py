@@ -0,0 +1,16 @@
+import os
+import sys
+
+# The modules of each data source are run as scripts from their own directory and
+# import each other as top level modules, e.g. "from codec import CodecRegistry".
+# The sources share module names, so make sure this source's modules are imported
+# rather than ones already imported from another source's tests.
+SOURCE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT = os.path.dirname(os.path.dirname(SOURCE))
+
+sys.path.insert(0, SOURCE)
+for name, module in list(sys.modules.items()):
+    path = os.path.abspath(getattr(module, "__file__", None) or "")
+    source = os.path.dirname(path)
+    if source != SOURCE and os.path.dirname(os.path.dirname(source)) == ROOT:
+        del sys.modules[name]
@@ -0,0 +1,119 @@
+import json
+import asyncio
+
+import pytest
+
+from catalogue import AppCatalogue, parse_app_list
+
+
+def app_list(apps):
+    body = {"applist": {"apps": [{"appid": a, "name": n} for a, n in apps.items()]}}
+    return json.dumps(body).encode()
+
+
+class FakeFetcher:
+    """
+    Return canned responses and record the headers of every request.
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    async def get(self, url, headers=None):
+        self.requests.append(headers)
+        return self.responses.pop(0)
+
+
+def refresh(catalogue, fetcher, force=True):
+    return asyncio.run(catalogue.refresh(fetcher, "https://steam", force=force))
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "steam_apps.json")
+
+
+def test_parse_app_list():
+    body = json.dumps(
+        {"applist": {"apps": [{"appid": 10, "name": "CS"}, {"appid": 0}, {"x": 1}]}}
+    )
+    assert parse_app_list(body) == {10: "CS"}
+    with pytest.raises(ValueError):
+        parse_app_list(b"{}")
+    with pytest.raises(ValueError):
+        parse_app_list(b'{"applist": {}}')
+
+
+def test_refresh_returns_the_changes(path):
+    catalogue = AppCatalogue(path=path)
+    assert catalogue.stale()
+
+    fetcher = FakeFetcher(
+        (200, {"ETag": '"v1"'}, app_list({10: "CS", 20: "TF", 30: "HL"})),
+        (200, {"ETag": '"v2"'}, app_list({10: "CS", 20: "TF2", 40: "L4D"})),
+    )
+    assert refresh(catalogue, fetcher) == ({10: "CS", 20: "TF", 30: "HL"}, [])
+    assert not catalogue.stale()
+
+    added, removed = refresh(catalogue, fetcher)
+    assert added == {20: "TF2", 40: "L4D"}
+    assert removed == [30]
+    assert fetcher.requests[1] == {"If-None-Match": '"v1"'}
+
+
+def test_refresh_skips_fresh_lists(path):
+    catalogue = AppCatalogue(path=path)
+    refresh(catalogue, FakeFetcher((200, {}, app_list({10: "CS"}))))
+    assert refresh(catalogue, FakeFetcher(), force=False) == ({}, [])
+
+
+def test_restarts_resume_from_the_saved_list(path):
+    catalogue = AppCatalogue(path=path)
+    headers = {"ETag": '"v1"', "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"}
+    refresh(catalogue, FakeFetcher((200, headers, app_list({10: "CS"}))))
+
+    restarted = AppCatalogue(path=path)
+    assert restarted.apps == {10: "CS"}
+    assert restarted.etag == '"v1"'
+    assert restarted.digest == catalogue.digest
+    assert not restarted.stale()
+
+    fetcher = FakeFetcher((304, {}, b""))
+    refresh(restarted, fetcher)
+    assert fetcher.requests == [
+        {"If-None-Match": '"v1"', "If-Modified-Since": headers["Last-Modified"]}
+    ]
+
+
+def test_not_modified_only_rewrites_the_metadata(path):
+    catalogue = AppCatalogue(path=path, ttl=60)
+    refresh(catalogue, FakeFetcher((200, {"ETag": '"v1"'}, app_list({10: "CS"}))))
+    with open(path, "w") as f:
+        f.write('{"10": "unchanged"}')
+    catalogue.fetched_at = 0
+
+    assert refresh(catalogue, FakeFetcher((304, {}, b"")), force=False) == ({}, [])
+    assert not catalogue.stale()
+    with open(path) as f:
+        assert json.load(f) == {"10": "unchanged"}
+    with open(catalogue.meta_path) as f:
+        assert json.load(f)["fetched_at"] == catalogue.fetched_at
+
+    # the same list without validators is not parsed or written again either
+    fetcher = FakeFetcher((200, {}, app_list({10: "CS"})))
+    assert refresh(catalogue, fetcher) == ({}, [])
+    assert catalogue.etag is None
+    with open(path) as f:
+        assert json.load(f) == {"10": "unchanged"}
+
+
+def test_failed_and_invalid_responses_keep_the_list(path):
+    catalogue = AppCatalogue(path=path)
+    refresh(catalogue, FakeFetcher((200, {"ETag": '"v1"'}, app_list({10: "CS"}))))
+
+    fetcher = FakeFetcher(None, (500, {}, b""), (200, {"ETag": '"v2"'}, b"{}"))
+    for _ in range(3):
+        assert refresh(catalogue, fetcher) == ({}, [])
+    assert catalogue.apps == {10: "CS"}
+    assert catalogue.etag == '"v1"'
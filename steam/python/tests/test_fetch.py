@@ -0,0 +1,82 @@
+import time
+import asyncio
+
+from aiohttp import web
+
+from fetch import Fetcher, TokenBucket
+
+
+def test_token_bucket_allows_a_burst_then_limits_the_rate():
+    async def take(bucket, n):
+        started = time.monotonic()
+        for _ in range(n):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    async def run():
+        bucket = TokenBucket(rate=100, capacity=5)
+        burst = await take(bucket, 5)
+        limited = await take(bucket, 10)
+        return burst, limited
+
+    burst, limited = asyncio.run(run())
+    assert burst < 0.02
+    assert 0.08 < limited < 0.5
+
+
+def test_retry_after():
+    class Response:
+        def __init__(self, retry_after):
+            self.headers = {"Retry-After": retry_after}
+
+    fetcher = Fetcher(backoff=1)
+    assert fetcher.retry_after(None, 0) == 1
+    assert fetcher.retry_after(None, 3) == 8
+    assert fetcher.retry_after(Response("30"), 0) == 30
+    assert fetcher.retry_after(Response("Wed, 21 Oct 2015 07:28:00 GMT"), 1) == 2
+
+
+async def serve(handler):
+    app = web.Application()
+    app.router.add_get("/{path}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def test_failed_requests_are_retried():
+    attempts = {}
+
+    async def handler(request):
+        path = request.match_info["path"]
+        attempts[path] = attempts.get(path, 0) + 1
+        if path == "flaky" and attempts[path] < 3:
+            return web.Response(status=503)
+        if path == "missing":
+            return web.Response(status=404)
+        if path == "down":
+            return web.Response(status=500)
+        return web.json_response({"response": {"player_count": 42}})
+
+    async def run():
+        runner, url = await serve(handler)
+        try:
+            fetcher = Fetcher(concurrency=2, retries=2, backoff=0.01)
+            async with fetcher:
+                return (
+                    await fetcher.get_json(url + "/flaky"),
+                    await fetcher.get_json(url + "/missing"),
+                    await fetcher.get(url + "/down"),
+                )
+        finally:
+            await runner.cleanup()
+
+    flaky, missing, down = asyncio.run(run())
+    assert flaky == {"response": {"player_count": 42}}
+    assert attempts["flaky"] == 3
+    # client errors are not retried, and give up after every retry failed
+    assert missing is None and attempts["missing"] == 1
+    assert down is None and attempts["down"] == 3
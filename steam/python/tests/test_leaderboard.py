@@ -0,0 +1,95 @@
+import pytest
+
+from leaderboard import Leaderboard
+
+HOUR = 3600
+
+
+@pytest.fixture
+def board():
+    return Leaderboard(k=2, windows=(HOUR, 24 * HOUR), resolution=300)
+
+
+def test_top_players(board):
+    for appid, players in ((1, 10), (2, 500), (3, 50), (4, 0)):
+        board.update(appid, f"game {appid}", players, now=0)
+    board.update(3, "renamed", 1000, now=10)
+
+    assert board.top_players() == [
+        {"id": 3, "game": "renamed", "count": 1000},
+        {"id": 2, "game": "game 2", "count": 500},
+    ]
+    assert [game["id"] for game in board.top_players(k=3)] == [3, 2, 1]
+    # games without players are not tracked
+    assert len(board) == 3 and 4 not in board
+
+
+def test_growth_is_measured_from_the_latest_sample_a_window_old(board):
+    for minute in range(0, 121, 5):
+        board.update(1, "game", 100 + minute, now=minute * 60)
+
+    now = 120 * 60
+    assert board.growth(1, HOUR, now=now) == 60
+    assert board.growth(1, 24 * HOUR, now=now) is None
+    assert board.growth(2, HOUR, now=now) is None
+
+    # between samples, the baseline is the sample before the cutoff
+    assert board.growth(1, HOUR + 60, now=now) == 65
+
+
+def test_samples_are_kept_at_the_resolution(board):
+    for second in range(0, 1201, 10):
+        board.update(1, "game", second, now=second)
+
+    times = list(board.apps[1].times)
+    assert all(b - a >= 300 for a, b in zip(times[:-2], times[1:-1]))
+    assert times[-1] == 1200
+    assert board.apps[1].counts[-1] == 1200
+
+
+def test_growth_from_zero_players(board):
+    board.update(1, "new release", 0, now=0)
+    board.update(1, "new release", 0, now=23 * HOUR)
+    assert 1 not in board
+
+    board.update(1, "new release", 5000, now=24 * HOUR)
+    board.update(2, "steady", 10000, now=0)
+    board.update(2, "steady", 10000, now=24 * HOUR)
+
+    assert board.growth(1, HOUR, now=24 * HOUR) == 5000
+    assert board.growth(1, 24 * HOUR, now=24 * HOUR) == 5000
+    assert board.top_growth(HOUR, now=24 * HOUR)[0] == {
+        "id": 1,
+        "game": "new release",
+        "count": 5000,
+        "growth": 5000,
+    }
+    assert board.idle == {}
+
+
+def test_least_recently_updated_games_are_evicted():
+    board = Leaderboard(max_apps=2, max_idle=1)
+    board.update(1, "a", 10, now=0)
+    board.update(2, "b", 10, now=1)
+    board.update(1, "a", 10, now=2)
+    board.update(3, "c", 10, now=3)
+    assert list(board.apps) == [1, 3]
+
+    board.update(4, "d", 0, now=4)
+    board.update(5, "e", 0, now=5)
+    assert list(board.idle) == [5]
+
+
+def test_snapshot(board):
+    board.update(1, "a", 10, now=0)
+    board.update(1, "a", 30, now=HOUR)
+    board.update(2, "b", 20, now=HOUR)
+
+    snapshot = board.snapshot(now=HOUR)
+    assert snapshot["timestamp"] == HOUR
+    assert snapshot["games"] == 2
+    assert [game["id"] for game in snapshot["players"]] == [1, 2]
+    assert snapshot["growth"] == {
+        "3600": [{"id": 1, "game": "a", "count": 30, "growth": 20}],
+        "86400": [],
+    }
@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+
+from scheduler import PollScheduler, load_state, save_state
+
+DAY = 86400
+
+
+def scheduler(budget=10.0, **kwargs):
+    return PollScheduler(budget, min_interval=60, max_interval=DAY, **kwargs)
+
+
+def poll_all(schedule, now):
+    polled = []
+    while True:
+        appid = schedule.pop_due(now)
+        if appid is None:
+            return polled
+        polled.append(appid)
+
+
+def test_cold_start_spreads_first_polls_over_the_longest_interval():
+    schedule = scheduler()
+    for appid in range(10000):
+        schedule.add(appid, now=0)
+
+    assert schedule.pop_due(now=0) is None
+    # about 1% of the apps are due every 1% of the interval
+    first = poll_all(schedule, DAY / 100)
+    second = poll_all(schedule, DAY / 2)
+    third = poll_all(schedule, DAY)
+    assert 50 < len(first) < 150
+    assert 4500 < len(first) + len(second) < 5500
+    assert len(first) + len(second) + len(third) == 10000
+
+
+def test_adding_an_app_twice_is_ignored():
+    schedule = scheduler()
+    schedule.add(1, now=0)
+    schedule.add(1, now=0)
+    assert len(schedule) == 1
+    assert schedule.demand == pytest.approx(1 / DAY)
+
+
+def test_popular_apps_are_polled_more_often():
+    schedule = scheduler()
+    for appid in (1, 2, 3):
+        schedule.add(appid, now=0)
+    for players, appid in ((0, 1), (1, 2), (10**6, 3)):
+        schedule.update(appid, players, now=0)
+
+    assert schedule.interval(1) == DAY
+    assert schedule.interval(2) == pytest.approx(DAY / 2)
+    assert schedule.interval(3) == 60
+    assert schedule.pop_due(now=60) == 3
+    assert schedule.demand == pytest.approx(1 / DAY + 2 / DAY + 1 / 60)
+
+
+def test_volatile_apps_are_polled_more_often():
+    steady, volatile = scheduler(), scheduler()
+    for schedule, counts in ((steady, [100] * 6), (volatile, [0, 200] * 3)):
+        schedule.add(1, now=0)
+        for players in counts:
+            schedule.update(1, players, now=0)
+    assert volatile.interval(1) < steady.interval(1)
+
+
+def test_failed_polls_keep_the_learned_interval():
+    schedule = scheduler()
+    schedule.add(1, now=0)
+    schedule.update(1, 1000, now=0)
+    interval = schedule.interval(1)
+    schedule.update(1, None, now=100)
+    assert schedule.interval(1) == interval
+    assert schedule.next_due() == pytest.approx(100 + interval)
+
+
+def test_intervals_are_stretched_to_fit_the_budget():
+    schedule = scheduler(budget=1 / 60)
+    for appid in (1, 2):
+        schedule.add(appid, now=0)
+        schedule.update(appid, 10**6, now=0)
+    # two apps polled every minute take twice the budget
+    assert schedule.stretch() == pytest.approx(2, rel=1e-3)
+    assert schedule.interval(1) == pytest.approx(120, rel=1e-3)
+
+
+def test_removed_apps_are_not_polled():
+    schedule = scheduler()
+    schedule.add(1, now=0)
+    schedule.add(2, now=0)
+    schedule.remove(1)
+    schedule.remove(3)
+    assert poll_all(schedule, DAY) == [2]
+    assert schedule.demand == pytest.approx(1 / DAY)
+
+    # apps removed while they were being polled are ignored
+    schedule.remove(2)
+    schedule.update(2, 10, now=DAY)
+    assert schedule.next_due() is None
+
+
+def test_restored_apps_keep_their_learned_intervals(tmp_path):
+    schedule = scheduler()
+    for appid in range(100):
+        schedule.add(appid, now=0)
+    schedule.update(7, 10**6, now=0)
+    schedule.update(8, 0, now=0)
+
+    path = str(tmp_path / "steam_schedule.json")
+    save_state(schedule.state(), path)
+    assert set(schedule.state()) == {7, 8}
+
+    restarted = scheduler()
+    restarted.restore(load_state(path))
+    for appid in range(100):
+        restarted.add(appid, now=DAY)
+
+    # the popular app is due within its one minute interval, while the others are
+    # spread over a day
+    assert restarted.interval(7) == 60
+    due = poll_all(restarted, DAY + 60)
+    assert 7 in due and len(due) < 10
+    assert restarted.apps[8].samples == 1
+    assert restarted.known == {}
+
+
+def test_missing_or_invalid_state_is_empty(tmp_path):
+    path = tmp_path / "steam_schedule.json"
+    assert load_state(str(path)) == {}
+    path.write_text("{not json")
+    assert load_state(str(path)) == {}
+
+
+def test_wait_returns_the_due_app():
+    schedule = scheduler()
+    schedule.add(1, now=0)
+    schedule.update(1, 10**6, now=-60)
+    assert asyncio.run(schedule.wait(max_wait=0.01)) == 1
@@ -1,4 +1,3 @@
-import json
 import asyncio
 from datetime import datetime
 
@@ -6,6 +5,8 @@ import requests
 from pyensign.events import Event
 from pyensign.ensign import Ensign
 
+from codec import CodecRegistry
+
 # TODO: replace with YOU - your email and app details :)
 ME = "(https://rotational.io/data-playground/noaa/, weather@rotational.io)"
 
@@ -23,7 +24,14 @@ class WeatherPublisher:
     WeatherPublisher queries an API for weather updates and publishes events to Ensign.
     """
 
-    def __init__(self, topic="noaa-reports-json", interval=60, locations=LOCS, user=ME):
+    def __init__(
+        self,
+        topic="noaa-reports-json",
+        interval=60,
+        locations=LOCS,
+        user=ME,
+        codec="json",
+    ):
         """
         Initialize a WeatherPublisher by specifying a topic, locations, and other user-
         defined parameters.
@@ -46,13 +54,19 @@ class WeatherPublisher:
         user : str
             When querying the NOAA API, as a courtesy, they like you to identify your
             app and contact info (aka User Agent details)
+
+        codec : string, default: "json"
+            The codec to encode events with: "json", "orjson", "msgpack" or "avro"
+            (see codec.py). Subscribers pick the codec to decode with from the
+            mimetype of each event.
         """
         self.topic = topic
         self.interval = interval
         self.locations = locations
         self.url = "https://api.weather.gov/points/"
         self.user = {"User-Agent": user}
-        self.datatype = "application/json"
+        self.codec = CodecRegistry(schema="weather").get(codec)
+        self.datatype = self.codec.mimetype
 
         # NOTE: If you need a client_id and client_secret, register for a free account
         # at: https://rotational.app/register
@@ -201,7 +215,7 @@ class WeatherPublisher:
                 "end": period.get("endTime", None),
             }
 
-            yield Event(json.dumps(data).encode("utf-8"), mimetype=self.datatype)
+            yield Event(self.codec.encode(data), mimetype=self.datatype)
 
 
 if __name__ == "__main__":
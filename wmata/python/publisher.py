@@ -1,5 +1,4 @@
 import os
-import json
 import asyncio
 from datetime import datetime
 
@@ -7,6 +6,8 @@ import requests
 from pyensign.events import Event
 from pyensign.ensign import Ensign
 
+from codec import CodecRegistry
+
 # TODO: replace with YOU - your email and app details :)
 ME = "(https://rotational.io/data-playground/dc-metro, wmata@rotational.io)"
 
@@ -18,7 +19,12 @@ class MetroPublisher:
     """
 
     def __init__(
-        self, topic="metro-updates-json", wmata_key=None, interval=900, user=ME
+        self,
+        topic="metro-updates-json",
+        wmata_key=None,
+        interval=900,
+        user=ME,
+        codec="json",
     ):
         """
         Parameters
@@ -39,10 +45,16 @@ class MetroPublisher:
         user : str
             When querying the WMATA API, as a courtesy, they like you to identify your
             app and contact info (aka User Agent details)
+
+        codec : string, default: "json"
+            The codec to encode events with: "json", "orjson", "msgpack" or "avro"
+            (see codec.py). Subscribers pick the codec to decode with from the
+            mimetype of each event.
         """
         self.topic = topic
         self.interval = interval
-        self.datatype = "application/json"
+        self.codec = CodecRegistry(schema="metro").get(codec)
+        self.datatype = self.codec.mimetype
         self.url = "https://api.wmata.com/Incidents.svc/json/BusIncidents"
 
         if wmata_key is None:
@@ -109,7 +121,7 @@ class MetroPublisher:
                 "description": metro_event.get("Description", None),
                 "date_updated": metro_event.get("DateUpdated", None),
             }
-            yield Event(json.dumps(data).encode("utf-8"), mimetype=self.datatype)
+            yield Event(self.codec.encode(data), mimetype=self.datatype)
 
     async def recv_and_publish(self):
         """
@@ -1,9 +1,10 @@
-import json
 import asyncio
 
 from pyensign import nack
 from pyensign.ensign import Ensign
 
+from codec import CodecError, CodecRegistry
+
 
 class MetroSubscriber:
     """
@@ -22,6 +23,7 @@ class MetroSubscriber:
             The name of the topic you wish to subscribe to.
         """
         self.topic = topic
+        self.codecs = CodecRegistry(schema="metro")
         self.ensign = Ensign()
 
     def run(self):
@@ -35,9 +37,9 @@ class MetroSubscriber:
         Decode and ack the event.
         """
         try:
-            data = json.loads(event.data)
-        except json.JSONDecodeError:
-            print("Received invalid JSON in event payload:", event.data)
+            data = self.codecs.decode(event.data, event.mimetype)
+        except CodecError as e:
+            print(f"Received invalid event payload ({e}):", event.data)
             await event.nack(nack.UnknownType)
             return
 